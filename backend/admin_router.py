@@ -0,0 +1,54 @@
+from typing import Any, Dict
+import asyncio
+import os
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import PlainTextResponse
+from .auth_router import get_current_user
+from .db_models import User
+from .knowledge import knowledge
+from . import model
+from .metrics import profiler
+
+# Comma-separated usernames allowed to call /admin endpoints
+ADMIN_USERNAMES = {u.strip() for u in os.getenv("ADMIN_USERNAMES", "").split(",") if u.strip()}
+
+router = APIRouter()
+
+async def require_admin(current_user: User = Depends(get_current_user)) -> User:
+    if current_user.username not in ADMIN_USERNAMES:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
+
+@router.post("/reload-knowledge")
+async def reload_knowledge(admin: User = Depends(require_admin)) -> Dict[str, Any]:
+    try:
+        changed = await asyncio.to_thread(knowledge.reload, True)
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=f"Knowledge base rejected: {e}")
+    return {"changed": changed, "version": knowledge.current.version}
+
+@router.post("/reload-model")
+async def reload_model(admin: User = Depends(require_admin)) -> Dict[str, Any]:
+    try:
+        changed = await asyncio.to_thread(model.reload, True)
+    except (OSError, ValueError, TypeError) as e:
+        raise HTTPException(status_code=422, detail=f"Model rejected: {e}")
+    return {"changed": changed, **model.stats()}
+
+@router.post("/profiler/start")
+async def start_profiler(interval_ms: float = 5.0, admin: User = Depends(require_admin)) -> Dict[str, Any]:
+    if not 0.5 <= interval_ms <= 1000:
+        raise HTTPException(status_code=422, detail="interval_ms must be between 0.5 and 1000")
+    if not profiler.start(interval_ms / 1000.0):
+        raise HTTPException(status_code=409, detail="Profiler already running")
+    return profiler.stats()
+
+@router.get("/profiler")
+async def profiler_status(admin: User = Depends(require_admin)) -> Dict[str, Any]:
+    return profiler.stats()
+
+@router.post("/profiler/stop", response_class=PlainTextResponse)
+async def stop_profiler(admin: User = Depends(require_admin)) -> PlainTextResponse:
+    # Folded stacks ("frame;frame;frame count"), ready for flamegraph.pl or speedscope
+    folded = await asyncio.to_thread(profiler.stop)
+    return PlainTextResponse(folded)
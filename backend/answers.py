@@ -1,49 +1,156 @@
-from typing import Dict
-from backend.nlp import extract_entities
-from backend.data import BASE_ANSWERS, PROGRAM_FEE_HINTS, PROGRAM_PLACEMENT_HINTS
+# Answer rendering, compiled once per knowledge-base snapshot: every (intent, program, hostel gender)
+# combination is rendered ahead of time, so answering a message is a dict lookup instead of string building.
+import os
+from string import Formatter
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+from backend.data import OFFICIAL_LINK
+from backend.nlp import HOSTEL_GENDER_ALIASES, PROGRAM_ALIASES, extract_entities
 
+NO_ANSWER = "Sorry, I don't have that information yet."
+# Most (intent, program, hostel gender) combinations answered for one message, so a message
+# that lists every alias cannot inflate the response; the budget is split across the intents
+MAX_ANSWER_COMBINATIONS = int(os.getenv("MAX_ANSWER_COMBINATIONS", "8"))
+TEMPLATE_VARIANTS = ("program", "gender", "default")
+TEMPLATE_FIELDS = ("program", "gender", "hint", "base")
 
-def build_answer(intent: str, text: str) -> str:
-    ents = extract_entities(text)
-    program = ents.get("program")
-    gender = ents.get("hostel_gender")
+Key = Tuple[str, Optional[str], Optional[str]]
+# A template split at its fields: (literal text, field name or None) pairs
+Pieces = Tuple[Tuple[str, Optional[str]], ...]
 
-    if intent == "admission_fees":
-        if program and program in PROGRAM_FEE_HINTS:
-            return (
-                f"For {program.upper()}, {PROGRAM_FEE_HINTS[program]} "
-                "Please confirm the latest fee structure on the official site or with the Admissions Office."
-            )
-        return BASE_ANSWERS[intent]
 
-    if intent == "hostel_fees":
-        if gender:
-            return (
-                f"Yes, {gender} hostel is available. Annual charges are typically ~ INR 70k–1.2L depending on room type and mess plan. "
-                "Please contact the Hostel Office for current rates and availability."
-            )
-        return BASE_ANSWERS[intent]
+def split_template(template: str) -> Pieces:
+    """Pre-split ``template`` for rendering by concatenation; raises ValueError on unknown fields."""
+    pieces = []
+    for literal, field, spec, conversion in Formatter().parse(template):
+        if field is not None and (field not in TEMPLATE_FIELDS or spec or conversion):
+            raise ValueError(f"unknown template field {{{field}}} in {template!r}")
+        pieces.append((literal, field))
+    return tuple(pieces)
 
-    if intent == "placement":
-        if program and program in PROGRAM_PLACEMENT_HINTS:
-            return (
-                f"Placement info for {program.upper()}: {PROGRAM_PLACEMENT_HINTS[program]} "
-                "Please see the Training & Placement Cell for verified, year-wise statistics."
-            )
-        return BASE_ANSWERS[intent]
 
-    if intent == "admission_process":
-        if program:
-            return (
-                f"Admission process for {program.upper()}: register on the admissions portal, complete the form, upload documents, pay fees, and track merit/counseling. "
-                f"Eligibility and test requirements vary by program—please check the official notification for {program.upper()}."
+class IntentTemplates:
+    __slots__ = ("base", "program", "gender", "default", "hints")
+
+    def __init__(self, base: Optional[str], spec: Mapping[str, str], hint_tables: Mapping[str, Mapping[str, str]]):
+        self.base = base
+        self.program = split_template(spec["program"]) if "program" in spec else None
+        self.gender = split_template(spec["gender"]) if "gender" in spec else None
+        self.default = split_template(spec["default"]) if "default" in spec else None
+        hints = spec.get("hints")
+        if hints is not None and hints not in hint_tables:
+            raise ValueError(f"unknown hint table {hints!r}")
+        self.hints: Optional[Mapping[str, str]] = hint_tables[hints] if hints is not None else None
+        if base is None:
+            # Variants that quote a missing base answer are dropped; the intent then has no answer
+            self.program, self.gender, self.default = (
+                None if pieces and any(f == "base" for _, f in pieces) else pieces
+                for pieces in (self.program, self.gender, self.default)
             )
-        return BASE_ANSWERS[intent]
 
-    # Handle new intents for university details and chatbot introduction
-    if intent in ["university_overview", "facilities", "rankings", "contact_info", "programs_offered", "campus_life"]:
-        return f"I am the Integral University Chatbot. {BASE_ANSWERS[intent]}"
-    if intent == "chatbot_intro":
-        return BASE_ANSWERS[intent]
+    def render(self, program: Optional[str], gender: Optional[str]) -> str:
+        if program and self.program is not None and (self.hints is None or program in self.hints):
+            pieces = self.program
+        elif gender and self.gender is not None:
+            pieces = self.gender
+        elif self.default is not None:
+            pieces = self.default
+        else:
+            return self.base if self.base is not None else NO_ANSWER
+        values = {
+            "program": program.upper() if program else "",
+            "gender": gender or "",
+            "hint": self.hints.get(program, "") if self.hints is not None and program else "",
+            "base": self.base or "",
+        }
+        return "".join(literal + (values[field] if field else "") for literal, field in pieces)
+
+
+class AnswerTable:
+    """Pre-rendered answers keyed by (intent, program, hostel gender).
+
+    Every known program and gender (and None) is rendered for every intent when the
+    snapshot is built; ``full`` also holds each single-intent answer with the official
+    link already appended, which is what most messages need. Entity values outside the
+    known ones (e.g. a program only named in a hint table added later) are rendered from
+    the pre-split templates on demand.
+    """
+
+    def __init__(
+        self, base_answers: Mapping[str, str], templates: Mapping[str, Mapping[str, str]],
+        hint_tables: Mapping[str, Mapping[str, str]], programs: Iterable[str] = PROGRAM_ALIASES,
+        genders: Iterable[str] = HOSTEL_GENDER_ALIASES,
+    ):
+        self.templates: Dict[str, IntentTemplates] = {
+            intent: IntentTemplates(base_answers.get(intent), templates.get(intent, {}), hint_tables)
+            for intent in {**base_answers, **templates}
+        }
+        programs = list(dict.fromkeys([*programs, *(p for table in hint_tables.values() for p in table)]))
+        self.parts: Dict[Key, str] = {}
+        self.full: Dict[Key, str] = {}
+        for intent, compiled in self.templates.items():
+            rendered: Dict[str, str] = {}  # identical answers share one string (and one full answer)
+            full: Dict[str, str] = {}
+            for program in (None, *programs):
+                for gender in (None, *genders):
+                    text = compiled.render(program, gender)
+                    text = rendered.setdefault(text, text)
+                    self.parts[intent, program, gender] = text
+                    self.full[intent, program, gender] = full.setdefault(text, f"{text}\n\n{OFFICIAL_LINK}")
+
+    def __len__(self) -> int:
+        return len(self.parts)
+
+    def part(self, intent: str, program: Optional[str] = None, gender: Optional[str] = None) -> str:
+        text = self.parts.get((intent, program, gender))
+        if text is None:
+            compiled = self.templates.get(intent)
+            text = compiled.render(program, gender) if compiled is not None else NO_ANSWER
+        return text
+
+    def answer(
+        self, intents: Sequence[str], programs: Sequence[str] = (), genders: Sequence[str] = (),
+        limit: int = MAX_ANSWER_COMBINATIONS,
+    ) -> str:
+        """The complete answer for ``intents`` (primary first) and the programs / genders named, with the official link."""
+        if len(intents) == 1 and len(programs) <= 1 and len(genders) <= 1:
+            text = self.full.get((intents[0], programs[0] if programs else None, genders[0] if genders else None))
+            if text is not None:
+                return text
+        return "\n\n".join(self.answer_parts(intents, programs, genders, limit))
+
+    def answer_parts(
+        self, intents: Sequence[str], programs: Sequence[str] = (), genders: Sequence[str] = (),
+        limit: int = MAX_ANSWER_COMBINATIONS,
+    ) -> List[str]:
+        """One paragraph per distinct (intent, program, gender) answer, in one pass over the table.
+
+        Each intent gets an equal share of ``limit`` (at least one), taken in the order the
+        programs and genders appear. Only the entities an intent's templates use are expanded,
+        so the budget is not spent on repeats; identical paragraphs are still dropped.
+        """
+        unique = list(dict.fromkeys(intents))
+        per_intent = max(1, limit // max(1, len(unique)))
+        parts: Dict[str, None] = {}
+        for intent in unique:
+            compiled = self.templates.get(intent)
+            uses_program = compiled is not None and compiled.program is not None
+            uses_gender = compiled is not None and compiled.gender is not None
+            taken = 0
+            for program in (programs if uses_program and programs else (None,)):
+                for gender in (genders if uses_gender and genders else (None,)):
+                    if taken == per_intent:
+                        break
+                    taken += 1
+                    parts[self.part(intent, program, gender)] = None
+        return [*parts, OFFICIAL_LINK]
+
 
-    return "Sorry, I don't have that information yet."
\ No newline at end of file
+def build_answer(intent: str, text: str, ents: Optional[Dict[str, Any]] = None, kb: Any = None) -> str:
+    # Callers answering several intents for one message pass the entities extracted once
+    # and the knowledge-base snapshot they started with
+    if ents is None:
+        ents = extract_entities(text)
+    if kb is None:
+        from backend.knowledge import knowledge
+        kb = knowledge.current
+    return kb.answers.part(intent, ents.get("program"), ents.get("hostel_gender"))
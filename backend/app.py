@@ -1,15 +1,91 @@
+import asyncio
+import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routes import router
+from .routes import router, warmup
+from . import model
 from .auth_router import router as auth_router
-from .database import engine
-from .db_models import Base
-
-# Create database tables
-Base.metadata.create_all(bind=engine)
+from .admin_router import router as admin_router
+from .ws_router import router as ws_router, heartbeat as ws_heartbeat, WS_HEARTBEAT_SECONDS
+from .database import async_engine, engine
+from .migrate import AUTO_MIGRATE, migrate_async
+from .auth import password_hasher
+from .knowledge import knowledge, KB_RELOAD_INTERVAL_SECONDS
+from .sessions import sessions, SESSION_PERSIST_INTERVAL_SECONDS
+from .chatlog import chatlog, CHATLOG_FLUSH_INTERVAL_SECONDS
+from .metrics import MetricsMiddleware
+from .ratelimit import RateLimitMiddleware
 
 app = FastAPI(title="Integral University Chatbot API")
 
+_background_tasks = []
+
+
+# Load the model, lexicon-backed caches and passage index before serving; false defers them to the first request
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+
+@app.on_event("startup")
+async def create_tables() -> None:
+    # Deploys that run `python -m backend.migrate` set AUTO_MIGRATE=false
+    if AUTO_MIGRATE:
+        await migrate_async()
+
+
+@app.on_event("startup")
+async def warm_up() -> None:
+    if WARMUP_ON_STARTUP:
+        await asyncio.to_thread(warmup)
+
+
+@app.on_event("startup")
+async def watch_knowledge_base() -> None:
+    # Picks up edits to data/faqs.json without restarting workers
+    if KB_RELOAD_INTERVAL_SECONDS > 0:
+        _background_tasks.append(asyncio.create_task(knowledge.watch(KB_RELOAD_INTERVAL_SECONDS)))
+
+
+@app.on_event("startup")
+async def watch_model() -> None:
+    # Models published by `python -m backend.train --data ...` replace the artifact file atomically
+    if model.MODEL_RELOAD_INTERVAL_SECONDS > 0:
+        _background_tasks.append(asyncio.create_task(model.watch(model.MODEL_RELOAD_INTERVAL_SECONDS)))
+
+
+@app.on_event("startup")
+async def restore_sessions() -> None:
+    # Conversations survive restarts only when persistence is on; writes are batched per interval
+    if SESSION_PERSIST_INTERVAL_SECONDS > 0:
+        await sessions.restore()
+        _background_tasks.append(asyncio.create_task(sessions.persist(SESSION_PERSIST_INTERVAL_SECONDS)))
+
+
+@app.on_event("startup")
+async def write_chat_logs() -> None:
+    if chatlog.enabled:
+        _background_tasks.append(asyncio.create_task(chatlog.run(CHATLOG_FLUSH_INTERVAL_SECONDS)))
+
+
+@app.on_event("startup")
+async def watch_websockets() -> None:
+    # One loop pings every open /ws/chat socket and closes idle ones
+    if WS_HEARTBEAT_SECONDS > 0:
+        _background_tasks.append(asyncio.create_task(ws_heartbeat(WS_HEARTBEAT_SECONDS)))
+
+
+@app.on_event("shutdown")
+async def shutdown_resources() -> None:
+    for task in _background_tasks:
+        task.cancel()
+    await chatlog.flush()
+    if SESSION_PERSIST_INTERVAL_SECONDS > 0:
+        await sessions.flush()
+    password_hasher.shutdown()
+    await async_engine.dispose()
+    engine.dispose()
+
+# Innermost, so 429/503 responses still get CORS headers and show up in the metrics
+app.add_middleware(RateLimitMiddleware)
 # CORS for local dev
 app.add_middleware(
     CORSMiddleware,
@@ -18,7 +94,11 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Outermost, so request latency includes CORS handling
+app.add_middleware(MetricsMiddleware)
 
 # Mount routes
 app.include_router(auth_router, prefix="/auth", tags=["authentication"])
+app.include_router(admin_router, prefix="/admin", tags=["admin"])
+app.include_router(ws_router, prefix="/ws")
 app.include_router(router)
\ No newline at end of file
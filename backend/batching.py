@@ -0,0 +1,79 @@
+# Micro-batching: coalesce concurrent classification requests into one vectorized call
+import asyncio
+import os
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+CHAT_BATCH_MAX_SIZE = int(os.getenv("CHAT_BATCH_MAX_SIZE", "32"))
+CHAT_BATCH_MAX_WAIT_MS = float(os.getenv("CHAT_BATCH_MAX_WAIT_MS", "2"))
+
+
+class MicroBatcher:
+    """Collects items submitted within ``max_wait_ms`` (up to ``max_batch_size``)
+    and runs ``fn`` once over the whole batch. ``fn`` maps a list of items to a
+    sequence of results in the same order.
+
+    All bookkeeping happens on the event loop thread, so no locking is needed.
+    A ``max_batch_size`` of 1 or a ``max_wait_ms`` of 0 disables batching.
+    """
+
+    def __init__(self, fn: Callable[[List[Any]], Sequence[Any]], max_batch_size: int, max_wait_ms: float):
+        self.fn = fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_batch_size > 1 and self.max_wait > 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def submit(self, item: Any) -> Any:
+        return (await self.submit_many([item]))[0]
+
+    async def submit_many(self, items: List[Any]) -> List[Any]:
+        if not self.enabled:
+            return list(self.fn(list(items)))
+        loop = asyncio.get_running_loop()
+        futures = []
+        for item in items:
+            fut = loop.create_future()
+            self._pending.append((item, fut))
+            futures.append(fut)
+        while len(self._pending) >= self.max_batch_size:
+            self._run(self._take())
+        if not self._pending and self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        elif self._pending and self._timer is None:
+            # Leftovers wait for company, but never longer than max_wait
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return list(await asyncio.gather(*futures))
+
+    def _flush(self) -> None:
+        self._timer = None
+        while self._pending:
+            self._run(self._take())
+
+    def _take(self) -> List[Tuple[Any, asyncio.Future]]:
+        batch = self._pending[: self.max_batch_size]
+        self._pending = self._pending[self.max_batch_size :]
+        return batch
+
+    def _run(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        live = [(item, fut) for item, fut in batch if not fut.done()]  # skip cancelled requests
+        if not live:
+            return
+        try:
+            results = self.fn([item for item, _ in live])
+        except Exception as exc:
+            for _, fut in live:
+                if not fut.done():
+                    fut.set_exception(exc)
+            return
+        for (_, fut), result in zip(live, results):
+            if not fut.done():
+                fut.set_result(result)
@@ -0,0 +1,761 @@
+# Microbenchmarks and load tests for the chat pipeline
+# Run: python -m backend.bench [name ...] [--url http://127.0.0.1:8000] [--json out.json] [--compare old.json]
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+BENCH_SEED = int(os.getenv("BENCH_SEED", "0"))
+BENCH_CORPUS_SIZE = int(os.getenv("BENCH_CORPUS_SIZE", "500"))
+# `import backend.app` must stay under this; the model, WordNet tables and sklearn load at warmup instead
+BENCH_IMPORT_BUDGET_MS = float(os.getenv("BENCH_IMPORT_BUDGET_MS", "2000"))
+
+# Filled by report()/record() as benchmarks run: {benchmark: {label: {metric: value}}}
+RESULTS: Dict[str, Dict[str, Dict[str, float]]] = {}
+_current = ""
+# Budget violations; main() exits non-zero when any are recorded
+FAILURES: List[str] = []
+# Base URL of a running server for the load tests; None drives the ASGI app in-process
+TARGET_URL: Optional[str] = None
+# The in-process load tests send thousands of requests from one user and IP on purpose
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+
+def per_call(fn: Callable[[], object], number: int, repeat: int = 5) -> float:
+    """Best-of-``repeat`` mean seconds per call of ``fn``."""
+    fn()  # warm caches and lazy imports
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - started) / number)
+    return best
+
+
+def once(fn: Callable[[], object]) -> float:
+    """Seconds for a single, un-warmed call of ``fn``."""
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def record(label: str, values: Dict[str, float]) -> None:
+    RESULTS.setdefault(_current, {})[label] = values
+
+
+def report(label: str, seconds: float) -> None:
+    print(f"{label:<44} {seconds * 1e6:10.1f} us")
+    record(label, {"us": seconds * 1e6})
+
+
+# Query shapes seen in the chat logs: Hinglish, Devanagari keywords mixed into English, bare keywords
+QUERY_TEMPLATES = [
+    "{program} ki fees kitni hai",
+    "{program} ki फीस kitni hai?",
+    "what is the fee for {program}",
+    "{program} me admission kaise le",
+    "{program} का प्रवेश process kya hai",
+    "how to apply for {program} admission",
+    "{gender} ke liye hostel hai kya",
+    "{gender} hostel fees batao",
+    "is there a hostel for {gender}",
+    "{program} placement kaisa hai, avg package?",
+    "{program} का औसत पैकेज",
+    "{program} aur {program2} ki fees and placement",
+    "{program} ke liye entrance exam kaun sa hai",
+    "scholarship milti hai kya {program} me",
+    "campus life kaisi hai",
+    "university ki ranking kya hai",
+    "contact number do admission office ka",
+    "library aur labs jaisi facilities hai?",
+    "kaun kaun se courses hai",
+    "तुम कौन हो",
+    "hostel",
+    "{program}",
+]
+
+
+def generate_corpus(n: int = BENCH_CORPUS_SIZE, seed: int = BENCH_SEED) -> List[str]:
+    """Deterministic Hinglish/Devanagari query corpus built from the real program and gender aliases."""
+    from backend.nlp import PROGRAM_ALIASES, HOSTEL_GENDER_ALIASES
+    rng = random.Random(seed)
+    programs = [a for aliases in PROGRAM_ALIASES.values() for a in aliases] + ["B.Tech", "B-Tech", "Mba", "CSE"]
+    genders = [a for aliases in HOSTEL_GENDER_ALIASES.values() for a in aliases] + ["ladkiyon", "ladke"]
+    queries = []
+    for _ in range(n):
+        q = rng.choice(QUERY_TEMPLATES).format(
+            program=rng.choice(programs), program2=rng.choice(programs), gender=rng.choice(genders)
+        )
+        if rng.random() < 0.3:
+            q = q.upper() if rng.random() < 0.2 else q.capitalize()
+        queries.append(q)
+    return queries
+
+
+def sample_queries() -> List[str]:
+    return generate_corpus()
+
+
+def misspell(text: str, rng: random.Random, rate: float = 0.5) -> str:
+    # Typing slips seen in Hinglish chats: a dropped, swapped or doubled letter inside a word
+    words = []
+    for word in text.split():
+        if len(word) >= 4 and rng.random() < rate:
+            i = rng.randrange(1, len(word) - 1)
+            slip = rng.random()
+            if slip < 0.4:
+                word = word[:i] + word[i + 1:]
+            elif slip < 0.7:
+                word = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+            else:
+                word = word[:i] + word[i] + word[i:]
+        words.append(word)
+    return " ".join(words)
+
+
+def noisy_questions(copies: int = 3, seed: int = BENCH_SEED) -> List[Tuple[str, str]]:
+    """TRAIN_DATA questions with typing slips, labeled with their intent."""
+    from backend.model import TRAIN_DATA
+    rng = random.Random(seed)
+    return [(misspell(text, rng), intent) for text, intent in TRAIN_DATA for _ in range(copies)]
+
+
+def bench_normalize() -> None:
+    from backend import nlp
+    queries = sample_queries()
+    n = len(queries)
+    nlp.lemma.cache_clear()
+    report("normalize, cold lemma cache, per message", once(lambda: [nlp.normalize(q) for q in queries]) / n)
+    report("normalize, warm lemma cache, per message", per_call(lambda: [nlp.normalize(q) for q in queries], 20) / n)
+    report("apply_hi_mapping, per message", per_call(lambda: [nlp.apply_hi_mapping(q) for q in queries], 20) / n)
+    report("normalize, transliterating, per message",
+           per_call(lambda: [nlp.normalize(q, transliterate=True) for q in queries], 20) / n)
+
+
+def bench_entities() -> None:
+    from backend import nlp
+    texts = [nlp.normalize(q) for q in sample_queries()]
+    n = len(texts)
+    report("extract_entities, per message", per_call(lambda: [nlp.extract_entities(t) for t in texts], 20) / n)
+
+
+def bench_inference() -> None:
+    from backend import model
+    from backend.nlp import normalize
+    texts = [normalize(t) for t in sample_queries()]
+    X = model.vectorizer.transform(texts)
+    rows = [X[i] for i in range(X.shape[0])]
+    n = len(rows)
+    clf, scorer = type(model.clf).__name__, type(model.scorer).__name__
+
+    report("transform, per message", per_call(lambda: [model.vectorizer.transform([t]) for t in texts], 5) / n)
+    report(f"{clf}.predict_proba, per message", per_call(lambda: [model.clf.predict_proba(r) for r in rows], 5) / n)
+    report(f"{scorer}, per message", per_call(lambda: [model.scorer.predict_proba(r) for r in rows], 5) / n)
+    report(f"{clf}.predict_proba, batch of {n}", per_call(lambda: model.clf.predict_proba(X), 20) / n)
+    report(f"{scorer}, batch of {n}", per_call(lambda: model.scorer.predict_proba(X), 20) / n)
+
+
+def bench_importtime() -> None:
+    # Fresh interpreter per run (python -X importtime), best of 3 to damp disk-cache noise
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [root, os.getenv("PYTHONPATH")]))}
+    runs = []
+    for _ in range(3):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import backend.app"],
+                              env=env, capture_output=True, text=True, check=True)
+        modules = {}
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, name = line.split("|")
+            try:
+                modules[name.strip()] = int(cumulative) / 1e3
+            except ValueError:
+                continue  # the header line
+        runs.append(modules)
+    best = min(runs, key=lambda m: m.get("backend.app", float("inf")))
+    total = best.get("backend.app", 0.0)
+    for name in sorted((n for n in best if n.startswith("backend.") or "." not in n), key=best.get, reverse=True)[:10]:
+        print(f"  {name:<40} {best[name]:8.1f} ms")
+    heavy = [m for m in ("sklearn", "scipy", "nltk", "joblib") if m in best]
+    status = "ok" if total <= BENCH_IMPORT_BUDGET_MS and not heavy else "OVER BUDGET"
+    print(f"import backend.app: {total:.1f} ms (budget {BENCH_IMPORT_BUDGET_MS:.0f} ms) {status}")
+    if heavy:
+        print(f"  eagerly imported: {', '.join(heavy)}")
+    if status != "ok":
+        FAILURES.append(f"importtime {total:.0f} ms > {BENCH_IMPORT_BUDGET_MS:.0f} ms or eager {heavy}")
+    record("import backend.app", {"ms": total, "budget_ms": BENCH_IMPORT_BUDGET_MS})
+
+
+def bench_answers() -> None:
+    from backend import answers, model, nlp
+    from backend.knowledge import build_snapshot, knowledge
+    from backend.data import load_faqs, DATA_FILE
+    texts = [nlp.normalize(q) for q in sample_queries()]
+    scores = model.predict_proba_batch(texts)
+    intents = [str(scores.classes[i]) for i in scores.proba.argmax(axis=1)]
+    ents = [nlp.extract_entities(t) for t in texts]
+    kb = knowledge.current
+    n = len(texts)
+    faqs = load_faqs(DATA_FILE)
+    report("build knowledge snapshot (compile table)", per_call(lambda: build_snapshot(faqs), 20))
+    # Every intent x program x hostel gender, entity-free included
+    matrix = [
+        (i, p, g) for i in kb.answers.templates for p in (None, *nlp.PROGRAM_ALIASES)
+        for g in (None, *nlp.HOSTEL_GENDER_ALIASES)
+    ]
+    table = kb.answers
+    print(f"{'answer table entries':<44} {len(table):10d}")
+    report(f"part lookup, full matrix ({len(matrix)} keys)", per_call(
+        lambda: [table.part(i, p, g) for i, p, g in matrix], 50) / len(matrix))
+    entities = [(i, (p,) if p else (), (g,) if g else ()) for i, p, g in matrix]
+    report("answer, one intent, full matrix", per_call(
+        lambda: [table.answer((i,), p, g) for i, p, g in entities], 50) / len(matrix))
+    report("answer, two intents, full matrix", per_call(
+        lambda: [table.answer((i, "placement"), p, g) for i, p, g in entities], 50) / len(matrix))
+    report("answer, two intents x three programs", per_call(
+        lambda: table.answer(("admission_fees", "placement"), ("btech", "cse", "mba"), ()), 20_000))
+    # Every alias in one message: extraction plus the capped combined answer
+    flood = nlp.normalize(" ".join(a for names in nlp.PROGRAM_ALIASES.values() for a in names) + " boys girls fees")
+    topics = ("admission_fees", "placement", "hostel_fees")
+
+    def flood_answer() -> str:
+        ents_ = nlp.extract_entities(flood)
+        return table.answer(topics, nlp.mentioned(ents_["programs"]), nlp.mentioned(ents_["hostel_genders"]))
+    print(f"{'every alias in one message: answer chars':<44} {len(flood_answer()):10d}")
+    report("every alias in one message: entities + answer", per_call(flood_answer, 2000))
+    report("build_answer, per message", per_call(
+        lambda: [answers.build_answer(i, t, e, kb) for i, t, e in zip(intents, texts, ents)], 20) / n)
+    from backend.routes import compose_response
+    report("compose_response, per message", per_call(
+        lambda: [compose_response(t, s, kb) for t, s in zip(texts, scores.rows())], 5) / n)
+
+
+def bench_retrieval() -> None:
+    import random
+    import tempfile
+    from backend import nlp, retrieval
+    rng = random.Random(0)
+    faq = retrieval.default_passages()
+    words = sorted({w for _, text in faq for w in text.split()})
+    queries = [nlp.normalize(q) for q in sample_queries()]
+    for size in (1_000, 10_000, 50_000):
+        passages = [(f"doc {i}", " ".join(rng.choices(words, k=40))) for i in range(size)]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "index")
+            report(f"build index, {size} passages (total)", once(lambda: retrieval.build_index(passages, path)))
+            index = retrieval.PassageIndex(path)
+            per_query = per_call(lambda: [index.lookup(q, min_score=0.0) for q in queries], 5) / len(queries)
+            report(f"top-{retrieval.RETRIEVAL_TOP_K} lookup, {size} passages", per_query)
+
+
+def bench_tiers() -> None:
+    from backend import model, nlp, tiers
+    from backend.knowledge import knowledge
+    from backend.routes import classify, match_fuzzy, match_known
+    kb = knowledge.current
+    noisy = noisy_questions()
+    sets = {"corpus": [(q, None) for q in sample_queries()], "misspelled TRAIN_DATA": noisy}
+    for name, labeled in sets.items():
+        texts = [nlp.normalize(q) for q, _ in labeled]
+        used: Counter = Counter()
+        right = classifier_right = 0
+        for (_, label), text, scores in zip(labeled, texts, model.predict_proba_batch(texts).rows()):
+            resolved = match_known(text, kb) or classify(text, scores, kb)
+            used[resolved[4]] += 1
+            right += resolved[0] == label
+            classifier_right += str(scores.classes[scores.proba.argmax()]) == label
+        shares = {tier: used[tier] / len(texts) for tier in tiers.TIERS[1:]}
+        print(f"{name} ({len(texts)}): " + ", ".join(f"{t} {v:.1%}" for t, v in shares.items()))
+        if labeled[0][1] is not None:
+            print(f"  accuracy: tiers {right / len(texts):.1%}, classifier alone {classifier_right / len(texts):.1%}")
+            shares.update(accuracy=right / len(texts), classifier_accuracy=classifier_right / len(texts))
+        record(f"tier shares, {name}", shares)
+    texts = [nlp.normalize(q) for q in sample_queries()]
+    low = [nlp.normalize(q) for q, _ in noisy]
+    n = len(texts)
+    report("exact tier, per message", per_call(lambda: [match_known(t, kb) for t in texts], 20) / n)
+    report("classifier tier, one message", per_call(lambda: model.predict_proba_batch(texts[:1]), 2000))
+    report("classifier tier, per message in a batch of 32", per_call(lambda: model.predict_proba_batch(texts[:32]), 200) / 32)
+    report("fuzzy tier, per misspelled message", per_call(lambda: [match_fuzzy(t, kb) for t in low], 5) / len(low))
+
+
+def bench_features() -> None:
+    # Each featurization (model.MODEL_FEATURES) with and without transliteration, trained on TRAIN_DATA:
+    # accuracy on the held-out data/eval_noisy.jsonl and on misspelled cross-validation folds,
+    # then fitted-vectorizer memory (on TRAIN_DATA and on a large misspelled corpus) and transform latency
+    import pickle
+    import tracemalloc
+    import numpy as np
+    from backend import model, nlp
+    from backend.inference import make_scorer
+    from backend.train import read_dataset
+    from sklearn.model_selection import StratifiedKFold
+    held_out = list(read_dataset(os.path.join(os.path.dirname(__file__), "data", "eval_noisy.jsonl")))
+    devanagari = np.array([any("\u0900" <= ch <= "\u097f" for ch in text) for text, _ in held_out])
+    truth = np.array([intent for _, intent in held_out])
+    texts, labels = [t for t, _ in model.TRAIN_DATA], np.array([y for _, y in model.TRAIN_DATA])
+    for transliterate in (False, True):
+        # A held-out row that normalizes to a training text would be scored in-sample
+        seen = {nlp.normalize(t, transliterate) for t in texts}
+        overlap = [t for t, _ in held_out if nlp.normalize(t, transliterate) in seen]
+        assert not overlap, f"eval_noisy.jsonl rows match TRAIN_DATA (transliterate={transliterate}): {overlap[:5]}"
+    folds = list(StratifiedKFold(n_splits=5, shuffle=True, random_state=BENCH_SEED).split(texts, labels))
+    rng = random.Random(BENCH_SEED)
+    corpus = sample_queries()
+    # A TF-IDF vocabulary grows with every misspelling it is fitted on; hashing stays fixed
+    large = [misspell(q, rng) for q in generate_corpus(20_000)]
+
+    def fitted_bytes(features: str, X: List[str]) -> int:
+        model.make_vectorizer(features).fit(X[:10])  # imports and caches are not the vectorizer's
+        tracemalloc.start()
+        vec = model.make_vectorizer(features).fit(X)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del vec
+        return size
+
+    def predict(vec, clf, raw: List[str], transliterate: bool) -> np.ndarray:
+        scorer = make_scorer(clf)
+        X = vec.transform([nlp.normalize(t, transliterate) for t in raw])
+        return scorer.classes[scorer.predict_proba(X).argmax(axis=1)]
+
+    for features in model.FEATURES:
+        for transliterate in (False, True):
+            label = f"{features}{' + transliteration' if transliterate else ''}"
+            X = [nlp.normalize(t, transliterate) for t in texts]
+            vec, clf = model.fit(X, list(labels), features)
+            vectorizer_bytes = fitted_bytes(features, X)
+            large_bytes = fitted_bytes(features, [nlp.normalize(q, transliterate) for q in large])
+            pred = predict(vec, clf, [t for t, _ in held_out], transliterate)
+            right = pred == truth
+            clean = noisy = 0
+            for train, test in folds:
+                fold_vec, fold_clf = model.fit([X[i] for i in train], list(labels[train]), features)
+                clean += (predict(fold_vec, fold_clf, [texts[i] for i in test], transliterate) == labels[test]).sum()
+                slips = [misspell(texts[i], rng) for i in test]
+                noisy += (predict(fold_vec, fold_clf, slips, transliterate) == labels[test]).sum()
+            scorer = make_scorer(clf)
+            weights = scorer.weights.nbytes + (scorer.slots.nbytes if getattr(scorer, "slots", None) is not None else 0)
+            state = len(pickle.dumps(vec))
+            normalized = [nlp.normalize(q, transliterate) for q in corpus]
+            per_message = per_call(lambda: vec.transform(normalized), 20) / len(normalized)
+            single = per_call(lambda: vec.transform(normalized[:1]), 2000)
+            values = {
+                "held_out_accuracy": float(right.mean()),
+                "held_out_latin": float(right[~devanagari].mean()),
+                "held_out_devanagari": float(right[devanagari].mean()),
+                "cv_accuracy": clean / len(texts),
+                "cv_misspelled_accuracy": noisy / len(texts),
+                "vectorizer_bytes": vectorizer_bytes,
+                "vectorizer_bytes_large": large_bytes,
+                "pickled_bytes": state,
+                "scorer_weight_bytes": weights,
+                "transform_us_per_message": per_message * 1e6,
+                "transform_us_single": single * 1e6,
+            }
+            print(f"{label}:")
+            print(f"  held-out noisy ({len(held_out)}): {values['held_out_accuracy']:.1%} "
+                  f"(Latin {values['held_out_latin']:.1%}, Devanagari {values['held_out_devanagari']:.1%}); "
+                  f"5-fold CV {values['cv_accuracy']:.1%}, misspelled {values['cv_misspelled_accuracy']:.1%}")
+            print(f"  memory: vectorizer {vectorizer_bytes / 1024:.0f} KiB (pickled {state / 1024:.1f} KiB; "
+                  f"{large_bytes / 1024:.0f} KiB fitted on {len(large)} misspelled queries), "
+                  f"scorer weights {weights / 1024:.0f} KiB")
+            print(f"  transform: {per_message * 1e6:.1f} us/message in a batch of {len(normalized)}, "
+                  f"{single * 1e6:.1f} us for one message")
+            record(label, values)
+
+
+def bench_sessions() -> None:
+    import tracemalloc
+    from backend import nlp
+    from backend.sessions import SESSION_TURNS, SessionStore
+    users = 50_000
+    ents = nlp.extract_entities("hostel for girls")
+    store = SessionStore(SESSION_TURNS, ttl=3600, max_count=users)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for user_id in range(users):
+        for _ in range(SESSION_TURNS):
+            store.record(user_id, "admission_fees", "btech", None)
+    per_session = (tracemalloc.get_traced_memory()[0] - before) / users
+    tracemalloc.stop()
+    store._dirty.clear()
+    print(f"memory per session ({SESSION_TURNS} turns, {users} users) {per_session:10.0f} bytes")
+    record("memory per session", {"bytes": per_session, "sessions": users})
+    ids = iter(range(10**9))
+    report(f"context lookup, {users} sessions", per_call(lambda: store.context(next(ids) % users, ents), 100_000))
+    report(f"record turn, {users} sessions", per_call(
+        lambda: store.record(next(ids) % users, "hostel_fees", None, "girls"), 100_000))
+
+
+def bench_chatlog() -> None:
+    import tempfile
+    from backend.chatlog import ChatLog
+    texts = [f"btech fees {i}" for i in range(10_000)]
+    with tempfile.TemporaryDirectory() as tmp:
+        log = ChatLog("file", tmp, max_size=len(texts), batch_size=1000)
+        it = iter(range(10**9))
+        report("record (enqueue)", per_call(
+            lambda: log.record(1, "chat", texts[next(it) % len(texts)], "admission_fees", 0.9, ["admission_fees"], 0.002),
+            len(texts), repeat=1))
+        queued = len(log)
+        seconds = once(lambda: asyncio.run(log.flush()))
+        report(f"flush to gzip JSONL, per record ({queued} records)", seconds / queued)
+        size = sum(os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp))
+        print(f"{'bytes per record on disk':<44} {size / queued:10.1f}")
+        record("bytes per record", {"bytes": size / queued})
+        full = ChatLog("file", tmp, max_size=0, batch_size=1000)
+        report("record (queue full, dropped)", per_call(
+            lambda: full.record(1, "chat", "x", "placement", 0.9, ["placement"], 0.002), 100_000))
+
+
+def bench_ratelimit() -> None:
+    from backend.ratelimit import LoadShedder, RateLimit
+    keys = 100_000
+    limit = RateLimit("bench", per_minute=600, burst=100, max_keys=keys)
+    limit.enabled = True  # the in-process load tests switch rate limiting off for this process
+    ids = iter(range(10**9))
+    report(f"acquire, {keys} keys", per_call(lambda: limit.acquire(next(ids) % keys), 200_000))
+    report(f"acquire, rejected", per_call(lambda: limit.acquire(-1, 1000), 200_000))
+    shedder = LoadShedder(max_in_flight=1000, p99=1.0, window=10)
+    for _ in range(1024):
+        shedder.observe(0.001)
+    report("load shedding check + observe", per_call(lambda: (shedder.reason(), shedder.observe(0.001)), 200_000))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+async def drive(label: str, request: Callable[[int], Awaitable[Any]], total: int, concurrency: int) -> Dict[str, float]:
+    """Issue ``total`` requests with at most ``concurrency`` in flight; print and record latency percentiles."""
+    gate = asyncio.Semaphore(concurrency)
+    statuses: Counter = Counter()
+
+    async def one(i: int) -> float:
+        async with gate:
+            started = time.perf_counter()
+            r = await request(i)
+            statuses[r.status_code] += 1
+            return time.perf_counter() - started
+
+    started = time.perf_counter()
+    lat = await asyncio.gather(*[one(i) for i in range(total)])
+    elapsed = time.perf_counter() - started
+    stats = {
+        "requests": total,
+        "ok": statuses.get(200, 0),
+        "rps": total / elapsed,
+        "p50_ms": percentile(lat, 50) * 1e3,
+        "p95_ms": percentile(lat, 95) * 1e3,
+        "p99_ms": percentile(lat, 99) * 1e3,
+    }
+    print(f"  {label:<28} {stats['rps']:8.1f} req/s  p50 {stats['p50_ms']:7.1f} ms  p95 {stats['p95_ms']:7.1f} ms"
+          f"  p99 {stats['p99_ms']:7.1f} ms  status {dict(statuses)}")
+    record(label, stats)
+    return stats
+
+
+@contextlib.asynccontextmanager
+async def app_client():
+    # In-process ASGI client (needs httpx) with startup/shutdown handlers run; uses the configured DATABASE_URL
+    import httpx
+    from backend.app import app
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            yield client
+
+
+@contextlib.asynccontextmanager
+async def target_client():
+    # A running server when --url / BENCH_URL is given, otherwise the app in-process
+    if TARGET_URL:
+        import httpx
+        async with httpx.AsyncClient(base_url=TARGET_URL, timeout=120) as client:
+            yield client
+    else:
+        async with app_client() as client:
+            yield client
+
+
+BENCH_CREDS = {"username": "bench_user", "password": "bench-pass-123"}
+
+
+async def bench_token(client) -> str:
+    await client.post("/auth/register", json={**BENCH_CREDS, "email": "bench_user@example.com"})
+    return (await client.post("/auth/token", data=BENCH_CREDS)).json()["access_token"]
+
+
+def bench_login() -> None:
+    from backend.auth import password_hasher
+    concurrency = int(os.getenv("BENCH_CONCURRENCY", "16"))
+    total = int(os.getenv("BENCH_LOGINS", "64"))
+
+    async def run() -> None:
+        async with target_client() as client:
+            await bench_token(client)  # also starts the hashing pool
+            await drive(f"/auth/token x{concurrency}", lambda i: client.post("/auth/token", data=BENCH_CREDS),
+                        total, concurrency)
+            if not TARGET_URL:
+                print(f"hash pool: {password_hasher.stats()}")
+
+    asyncio.run(run())
+
+
+def chat_request(client, headers: Dict[str, str], queries: List[str]) -> Callable[[int], Awaitable[Any]]:
+    return lambda i: client.post("/chat", json={"message": queries[i % len(queries)]}, headers=headers)
+
+
+def bench_auth_chat() -> None:
+    # /chat latency on its own, then while a stream of /auth/token requests runs alongside
+    concurrency = int(os.getenv("BENCH_CONCURRENCY", "16"))
+    total = int(os.getenv("BENCH_CHATS", "400"))
+    logins = int(os.getenv("BENCH_LOGINS", "16"))
+    queries = sample_queries()
+
+    async def run() -> None:
+        async with target_client() as client:
+            headers = {"Authorization": f"Bearer {await bench_token(client)}"}
+            await drive("/chat alone", chat_request(client, headers, queries), total, concurrency)
+            login_codes = asyncio.gather(*[client.post("/auth/token", data=BENCH_CREDS) for _ in range(logins)])
+            await drive(f"/chat with {logins} logins", chat_request(client, headers, queries), total, concurrency)
+            await login_codes
+
+    asyncio.run(run())
+
+
+def bench_load() -> None:
+    # End-to-end: logins, then cold and warm (response cache) passes over the generated corpus
+    concurrency = int(os.getenv("BENCH_CONCURRENCY", "16"))
+    chats = int(os.getenv("BENCH_CHATS", "1000"))
+    logins = int(os.getenv("BENCH_LOGINS", "64"))
+    queries = sample_queries()
+
+    async def run() -> None:
+        async with target_client() as client:
+            token = await bench_token(client)
+            headers = {"Authorization": f"Bearer {token}"}
+            await drive("/auth/token", lambda i: client.post("/auth/token", data=BENCH_CREDS), logins, concurrency)
+            # Unique messages miss the response cache; the repeat pass measures the cached path
+            unique = [f"{q} {i}" for i, q in enumerate(queries)]
+            await drive("/chat cold", chat_request(client, headers, unique), len(unique), concurrency)
+            await drive("/chat mixed", chat_request(client, headers, queries), chats, concurrency)
+            await drive("/chat/batch x8", lambda i: client.post(
+                "/chat/batch", json={"messages": [queries[(i * 8 + j) % len(queries)] for j in range(8)]},
+                headers=headers), max(1, chats // 8), concurrency)
+
+    asyncio.run(run())
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    # Resident set size from /proc (Linux); None elsewhere
+    try:
+        with open(f"/proc/{pid}/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+@contextlib.contextmanager
+def server_url():
+    # --url / BENCH_URL, or a single uvicorn worker started for the benchmark: (base URL, pid or None)
+    if TARGET_URL:
+        yield TARGET_URL, None
+        return
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")]))}
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.app:app", "--port", str(port), "--log-level", "warning"], env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        import httpx
+        for _ in range(300):
+            try:
+                if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.1)
+        yield url, proc.pid
+    finally:
+        proc.terminate()
+        proc.wait(30)
+
+
+def bench_ws() -> None:
+    # /ws/chat against a real server (the ASGI test transport has no WebSockets): request/response
+    # messages/sec next to POST /chat, then server memory per idle authenticated socket
+    import httpx
+    import websockets
+    concurrency = int(os.getenv("BENCH_CONCURRENCY", "16"))
+    total = int(os.getenv("BENCH_CHATS", "2000"))
+    idle = int(os.getenv("BENCH_WS_IDLE", "2000"))
+    queries = sample_queries()
+
+    async def conversation(url: str, headers: Dict[str, str], count: int, offset: int) -> List[float]:
+        lat = []
+        async with websockets.connect(url, additional_headers=headers, max_queue=None) as ws:
+            await ws.recv()  # ready
+            for i in range(count):
+                started = time.perf_counter()
+                await ws.send(json.dumps({"type": "chat", "id": i, "message": queries[(offset + i) % len(queries)]}))
+                while json.loads(await ws.recv())["type"] == "ping":
+                    pass
+                lat.append(time.perf_counter() - started)
+        return lat
+
+    async def run(base: str, pid: Optional[int]) -> None:
+        ws_url = base.replace("http", "ws", 1) + "/ws/chat"
+        async with httpx.AsyncClient(base_url=base, timeout=120) as client:
+            headers = {"Authorization": f"Bearer {await bench_token(client)}"}
+            await drive(f"POST /chat x{concurrency}", chat_request(client, headers, queries), total, concurrency)
+        per_socket = max(1, total // concurrency)
+        started = time.perf_counter()
+        lat = [x for part in await asyncio.gather(*[
+            conversation(ws_url, headers, per_socket, i * per_socket) for i in range(concurrency)
+        ]) for x in part]
+        elapsed = time.perf_counter() - started
+        stats = {
+            "messages": len(lat), "msgs_per_s": len(lat) / elapsed, "p50_ms": percentile(lat, 50) * 1e3,
+            "p99_ms": percentile(lat, 99) * 1e3,
+        }
+        print(f"  {'/ws/chat x' + str(concurrency):<28} {stats['msgs_per_s']:8.1f} msg/s  p50 {stats['p50_ms']:7.1f} ms"
+              f"  p99 {stats['p99_ms']:7.1f} ms")
+        record(f"/ws/chat x{concurrency}", stats)
+
+        if pid is None:
+            print("  idle sockets: server memory is only measured for the server this benchmark starts")
+            return
+        gate = asyncio.Semaphore(64)
+
+        async def open_one(sockets: list) -> None:
+            async with gate:
+                ws = await websockets.connect(ws_url, additional_headers=headers, open_timeout=60)
+                await ws.recv()
+                sockets.append(ws)
+
+        # The first round grows the allocator's arenas once; the second shows the steady per-socket cost
+        for _ in range(2):
+            sockets: list = []
+            before = rss_bytes(pid)
+            started = time.perf_counter()
+            await asyncio.gather(*[open_one(sockets) for _ in range(idle)])
+            opened = time.perf_counter() - started
+            await asyncio.sleep(1)
+            after = rss_bytes(pid)
+            await asyncio.gather(*[ws.close() for ws in sockets])
+            await asyncio.sleep(1)
+        if before is None or after is None:
+            return
+        per_conn = (after - before) / idle
+        print(f"  {idle} idle sockets: {per_conn / 1024:.1f} KiB server RSS each, opened in {opened:.1f}s")
+        record(f"{idle} idle sockets", {"bytes_per_socket": per_conn, "open_s": opened})
+
+    with server_url() as (base, pid):
+        asyncio.run(run(base, pid))
+
+
+BENCHMARKS: Dict[str, Callable[[], None]] = {
+    "normalize": bench_normalize,
+    "entities": bench_entities,
+    "login": bench_login,
+    "auth_chat": bench_auth_chat,
+    "inference": bench_inference,
+    "answers": bench_answers,
+    "importtime": bench_importtime,
+    "retrieval": bench_retrieval,
+    "tiers": bench_tiers,
+    "features": bench_features,
+    "sessions": bench_sessions,
+    "chatlog": bench_chatlog,
+    "ratelimit": bench_ratelimit,
+    "load": bench_load,
+    "ws": bench_ws,
+}
+
+
+def git_commit() -> Dict[str, Any]:
+    def git(*args: str) -> str:
+        try:
+            return subprocess.run(
+                ["git", *args], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return ""
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        **git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "target": TARGET_URL or "in-process",
+        "settings": {k: v for k, v in sorted(os.environ.items()) if k.startswith("BENCH_")},
+    }
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> None:
+    print(f"== compare {old['environment'].get('commit', '')[:10]} -> {new['environment'].get('commit', '')[:10]}")
+    for bench, labels in new["results"].items():
+        for label, values in labels.items():
+            before = old["results"].get(bench, {}).get(label, {})
+            for metric, value in values.items():
+                if metric in ("requests", "ok") or not before.get(metric):
+                    continue
+                change = (value - before[metric]) / before[metric] * 100
+                print(f"  {bench}/{label} {metric}: {before[metric]:.1f} -> {value:.1f} ({change:+.1f}%)")
+
+
+def main(argv=None) -> int:
+    global TARGET_URL, _current
+    parser = argparse.ArgumentParser(description="Chat pipeline benchmarks.")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    parser.add_argument("--url", default=os.getenv("BENCH_URL"), help="run load tests against this server")
+    parser.add_argument("--json", help="write results and environment (git commit, settings) to this file")
+    parser.add_argument("--compare", help="print changes against a previous --json file")
+    args = parser.parse_args(argv)
+    TARGET_URL = args.url
+    for name in args.names or list(BENCHMARKS):
+        if name not in BENCHMARKS:
+            print(f"unknown benchmark {name!r}; choose from {', '.join(BENCHMARKS)}")
+            return 2
+        print(f"== {name}")
+        _current = name
+        BENCHMARKS[name]()
+    output = {"environment": environment(), "results": RESULTS}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), output)
+    if FAILURES:
+        print("FAILED: " + "; ".join(FAILURES))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
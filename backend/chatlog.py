@@ -0,0 +1,225 @@
+# Chat-log capture for analytics and retraining. Requests only append a tuple to a bounded
+# in-memory queue; a background task writes the queue out in batches, either to gzip JSONL
+# files (one gzip member per batch) or to the chat_logs table. When the queue is full, new
+# records are dropped and counted instead of slowing requests down.
+#   python -m backend.chatlog export --max-confidence 0.5 --output to_label.csv
+import argparse
+import asyncio
+import collections
+import csv
+import glob
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .metrics import Counter, GaugeFunc, registry
+
+logger = logging.getLogger(__name__)
+
+# "file" (gzip JSONL under CHATLOG_DIR), "db" (chat_logs table) or "off"
+CHATLOG_SINK = os.getenv("CHATLOG_SINK", "file").lower()
+CHATLOG_DIR = os.getenv("CHATLOG_DIR", os.path.join(os.path.dirname(__file__), "data", "chatlogs"))
+CHATLOG_QUEUE_SIZE = int(os.getenv("CHATLOG_QUEUE_SIZE", "10000"))
+CHATLOG_BATCH_SIZE = int(os.getenv("CHATLOG_BATCH_SIZE", "1000"))
+CHATLOG_FLUSH_INTERVAL_SECONDS = float(os.getenv("CHATLOG_FLUSH_INTERVAL_SECONDS", "2"))
+
+FIELDS = ("created_at", "user_id", "endpoint", "text", "intent", "confidence", "intents", "latency_ms")
+Record = Tuple[float, Optional[int], str, str, str, float, List[str], float]
+
+RECORDS = registry.register(Counter("chat_log_records_total", "Chat-log records by outcome.", ("result",)))
+QUEUED, DROPPED, WRITTEN, FAILED = (RECORDS.labels(r) for r in ("queued", "dropped", "written", "failed"))
+
+
+class ChatLog:
+    """Bounded queue of chat records plus the batch writer that drains it.
+
+    ``record`` runs on the event loop and never waits: it appends to a deque or drops.
+    File writes happen in a worker thread so compression never blocks request handling.
+    """
+
+    def __init__(self, sink: str, directory: str, max_size: int, batch_size: int):
+        self.sink = sink
+        self.directory = directory
+        self.max_size = max_size
+        self.batch_size = max(1, batch_size)
+        self._queue: "collections.deque[Record]" = collections.deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self.queued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.sink in ("file", "db")
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def record(
+        self, user_id: Optional[int], endpoint: str, text: str, intent: str, confidence: float,
+        intents: List[str], latency: float,
+    ) -> None:
+        if not self.enabled:
+            return
+        if len(self._queue) >= self.max_size:
+            self.dropped += 1
+            DROPPED.inc()
+            return
+        self._queue.append((time.time(), user_id, endpoint, text, intent, confidence, intents, latency * 1000.0))
+        self.queued += 1
+        QUEUED.inc()
+        if len(self._queue) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _take(self) -> List[Record]:
+        n = min(len(self._queue), self.batch_size)
+        return [self._queue.popleft() for _ in range(n)]
+
+    async def flush(self) -> int:
+        """Write everything queued so far, one batch at a time; returns the records written."""
+        total = 0
+        while self._queue:
+            batch = self._take()
+            try:
+                if self.sink == "db":
+                    await self._write_db(batch)
+                else:
+                    await asyncio.to_thread(self._write_file, batch)
+            except Exception:
+                # The batch is lost rather than re-queued, so a broken sink cannot grow memory
+                self.failed += len(batch)
+                FAILED.inc(len(batch))
+                logger.exception("could not write %d chat-log records", len(batch))
+                continue
+            self.written += len(batch)
+            WRITTEN.inc(len(batch))
+            total += len(batch)
+        return total
+
+    def path(self, day: str) -> str:
+        # One file per day and process, so pre-forked workers never interleave writes
+        return os.path.join(self.directory, f"chat-{day}-{os.getpid()}.jsonl.gz")
+
+    def _write_file(self, batch: List[Record]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        lines = "".join(json.dumps(dict(zip(FIELDS, r)), ensure_ascii=False) + "\n" for r in batch)
+        # Appending a complete gzip member keeps the file readable even if the process dies mid-run
+        with open(self.path(time.strftime("%Y%m%d", time.gmtime(batch[0][0]))), "ab") as f:
+            f.write(gzip.compress(lines.encode("utf-8")))
+
+    async def _write_db(self, batch: List[Record]) -> None:
+        from sqlalchemy import insert
+        from .database import AsyncSessionLocal
+        from .db_models import ChatLog as ChatLogRow
+        rows = [{**dict(zip(FIELDS, r)), "intents": json.dumps(r[6])} for r in batch]
+        async with AsyncSessionLocal() as db:
+            await db.execute(insert(ChatLogRow), rows)
+            await db.commit()
+
+    async def run(self, interval: float) -> None:
+        self._wakeup = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sink": self.sink,
+            "pending": len(self._queue),
+            "queued": self.queued,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+        }
+
+
+chatlog = ChatLog(CHATLOG_SINK, CHATLOG_DIR, CHATLOG_QUEUE_SIZE, CHATLOG_BATCH_SIZE)
+
+registry.register(GaugeFunc("chat_log_pending", "Chat-log records waiting to be written.", lambda: len(chatlog)))
+
+
+def read_files(directory: str = CHATLOG_DIR) -> Iterator[Dict[str, Any]]:
+    for path in sorted(glob.glob(os.path.join(directory, "chat-*.jsonl.gz"))):
+        try:
+            # gzip reads concatenated members as one stream
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    yield json.loads(line)
+        except (OSError, EOFError, ValueError):
+            logger.warning("skipping unreadable chat log %s", path)
+
+
+def read_db() -> Iterator[Dict[str, Any]]:
+    from .database import SessionLocal
+    from .db_models import ChatLog as ChatLogRow
+    db = SessionLocal()
+    try:
+        for row in db.query(ChatLogRow).yield_per(1000):
+            values = {name: getattr(row, name) for name in FIELDS}
+            values["intents"] = json.loads(row.intents)
+            yield values
+    finally:
+        db.close()
+
+
+def low_confidence(
+    records: Iterable[Dict[str, Any]], max_confidence: float, since: float = 0.0
+) -> List[Dict[str, Any]]:
+    """Distinct texts answered below ``max_confidence``, least confident first.
+
+    Repeated questions collapse into one row with a count, so labelers see each text once.
+    """
+    grouped: Dict[str, Dict[str, Any]] = {}
+    for r in records:
+        if r["created_at"] < since or r["confidence"] >= max_confidence or not r["text"]:
+            continue
+        row = grouped.get(r["text"])
+        if row is None:
+            grouped[r["text"]] = {
+                "text": r["text"], "predicted_intent": r["intent"], "confidence": r["confidence"],
+                "count": 1, "label": "",
+            }
+        else:
+            row["count"] += 1
+            if r["confidence"] < row["confidence"]:
+                row["predicted_intent"], row["confidence"] = r["intent"], r["confidence"]
+    return sorted(grouped.values(), key=lambda row: (row["confidence"], -row["count"]))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export chat logs for labeling.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="write low-confidence questions as CSV (text, predicted_intent, confidence, count, label)")
+    export.add_argument("--source", choices=("file", "db"), default="db" if CHATLOG_SINK == "db" else "file")
+    export.add_argument("--dir", default=CHATLOG_DIR, help="chat-log directory for --source file (default: %(default)s)")
+    export.add_argument("--max-confidence", type=float, default=0.5)
+    export.add_argument("--days", type=float, default=0, help="only records from the last N days (0: all)")
+    export.add_argument("--output", default="-", help="CSV path, or - for stdout")
+    args = parser.parse_args(argv)
+
+    records = read_db() if args.source == "db" else read_files(args.dir)
+    since = time.time() - args.days * 86400 if args.days > 0 else 0.0
+    rows = low_confidence(records, args.max_confidence, since)
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+    try:
+        writer = csv.DictWriter(out, fieldnames=["text", "predicted_intent", "confidence", "count", "label"])
+        writer.writeheader()
+        writer.writerows(rows)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"exported {len(rows)} texts below confidence {args.max_confidence}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
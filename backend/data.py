@@ -48,6 +48,41 @@ DEFAULT_PROGRAM_PLACEMENT_HINTS: Dict[str, str] = {
     "biotech": "Biotech placements include pharma, research, and healthcare domains.",
 }
 
+# How answers are rendered per intent; data/faqs.json "answer_templates" replaces an intent's entry.
+#   "program": when the message names a program (with "hints", only programs listed in that table)
+#   "gender":  when it names a hostel gender
+#   "default": otherwise; intents without one answer with their base answer
+# Fields: {program} (upper-cased), {gender}, {hint} (the program's entry in "hints"), {base}
+DEFAULT_ANSWER_TEMPLATES: Dict[str, Dict[str, str]] = {
+    "admission_fees": {
+        "program": "For {program}, {hint} Please confirm the latest fee structure on the official site or with the Admissions Office.",
+        "hints": "program_fee_hints",
+    },
+    "hostel_fees": {
+        "gender": (
+            "Yes, {gender} hostel is available. Annual charges are typically ~ INR 70k–1.2L depending on room type and mess plan. "
+            "Please contact the Hostel Office for current rates and availability."
+        ),
+    },
+    "placement": {
+        "program": "Placement info for {program}: {hint} Please see the Training & Placement Cell for verified, year-wise statistics.",
+        "hints": "program_placement_hints",
+    },
+    "admission_process": {
+        "program": (
+            "Admission process for {program}: register on the admissions portal, complete the form, upload documents, pay fees, and track merit/counseling. "
+            "Eligibility and test requirements vary by program—please check the official notification for {program}."
+        ),
+    },
+    **{
+        intent: {"default": "I am the Integral University Chatbot. {base}"}
+        for intent in ("university_overview", "facilities", "rankings", "contact_info", "programs_offered", "campus_life")
+    },
+}
+
+# Appended once to every answer
+OFFICIAL_LINK = "For official details, visit: https://www.iul.ac.in"
+
 DATA_FILE = os.path.join(os.path.dirname(__file__), "data", "faqs.json")
 
 
@@ -59,9 +94,3 @@ def load_faqs(path: str) -> Dict[str, Any]:
     except Exception:
         pass
     return {}
-
-
-_FAQS = load_faqs(DATA_FILE)
-BASE_ANSWERS: Dict[str, str] = {**DEFAULT_BASE_ANSWERS, **_FAQS.get("base_answers", {})}
-PROGRAM_FEE_HINTS: Dict[str, str] = {**DEFAULT_PROGRAM_FEE_HINTS, **_FAQS.get("program_fee_hints", {})}
-PROGRAM_PLACEMENT_HINTS: Dict[str, str] = {**DEFAULT_PROGRAM_PLACEMENT_HINTS, **_FAQS.get("program_placement_hints", {})}
\ No newline at end of file
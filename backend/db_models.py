@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Float, Text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 
@@ -12,4 +12,26 @@ class User(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
\ No newline at end of file
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class ChatSession(Base):
+    # Conversation context persisted in batches by backend.sessions; one row per user
+    __tablename__ = "chat_sessions"
+
+    user_id = Column(Integer, primary_key=True)
+    turns = Column(Text, nullable=False)  # JSON [[timestamp, intent, program, gender], ...], oldest first
+    updated_at = Column(Float, nullable=False, index=True)  # unix seconds
+
+class ChatLog(Base):
+    # One answered message, written in batches by backend.chatlog (CHATLOG_SINK=db)
+    __tablename__ = "chat_logs"
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(Float, nullable=False, index=True)  # unix seconds
+    user_id = Column(Integer, nullable=True)
+    endpoint = Column(String, nullable=False)
+    text = Column(Text, nullable=False)  # normalized message
+    intent = Column(String, nullable=False, index=True)
+    confidence = Column(Float, nullable=False, index=True)
+    intents = Column(Text, nullable=False)  # JSON list of the answered intents, primary first
+    latency_ms = Column(Float, nullable=False)
@@ -0,0 +1,87 @@
+# Stateless hashed featurizer for the intent model (MODEL_FEATURES=hashed): word uni/bigrams and
+# character 2-4-grams within word boundaries, each hashed into its own n_features columns.
+# The output equals a FeatureUnion of two sklearn HashingVectorizers (word ngram_range=(1, 2) with
+# English stop words; analyzer="char_wb", ngram_range=(2, 4); alternate_sign=False; l2 norm), the
+# char block scaled by char_weight. Each of those costs ~300 us of fixed overhead per call, which a
+# single message cannot amortize; here a word's hashed n-grams are computed once and cached.
+import re
+from functools import lru_cache
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+FEATURE_CACHE_SIZE = 50_000
+CHAR_NGRAMS = (2, 4)
+
+_TOKEN = re.compile(r"(?u)\b\w\w+\b")
+
+
+@lru_cache(maxsize=1)
+def _stop_words() -> frozenset:
+    from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+    return ENGLISH_STOP_WORDS
+
+
+@lru_cache(maxsize=FEATURE_CACHE_SIZE)
+def bucket(feature: str, n_features: int) -> int:
+    # sklearn FeatureHasher's column for ``feature`` (signed 32-bit MurmurHash3, seed 0)
+    from sklearn.utils import murmurhash3_32
+    h = murmurhash3_32(feature, 0)
+    if h == -2147483648:
+        return (2147483647 - (n_features - 1)) % n_features
+    return abs(h) % n_features
+
+
+@lru_cache(maxsize=FEATURE_CACHE_SIZE)
+def char_buckets(word: str, n_features: int) -> Tuple[int, ...]:
+    # sklearn's char_wb n-grams: the word padded with one space each side (a padded word
+    # shorter than n yields itself once); columns are offset past the word block
+    padded = f" {word} "
+    out: List[int] = []
+    for n in range(CHAR_NGRAMS[0], CHAR_NGRAMS[1] + 1):
+        if len(padded) <= n:
+            out.append(n_features + bucket(padded, n_features))
+            break
+        out.extend(n_features + bucket(padded[i:i + n], n_features) for i in range(len(padded) - n + 1))
+    return tuple(out)
+
+
+class HashedFeatures:
+    """Word + character n-gram features in a fixed 2 * n_features space; fit() learns nothing."""
+
+    def __init__(self, n_features: int = 2 ** 18, char_weight: float = 1.0):
+        self.n_features = n_features
+        self.char_weight = char_weight
+
+    def fit(self, texts: Iterable[str], y=None) -> "HashedFeatures":
+        return self
+
+    def fit_transform(self, texts: Iterable[str], y=None):
+        return self.transform(texts)
+
+    def transform(self, texts: Iterable[str]):
+        import scipy.sparse as sp
+        n = self.n_features
+        stop = _stop_words()
+        columns: List[int] = []
+        lengths: List[int] = []
+        for text in texts:
+            start = len(columns)
+            text = text.lower()
+            words = [t for t in _TOKEN.findall(text) if t not in stop]
+            columns.extend(bucket(w, n) for w in words)
+            columns.extend(bucket(f"{a} {b}", n) for a, b in zip(words, words[1:]))
+            for word in text.split():
+                columns.extend(char_buckets(word, n))
+            lengths.append(len(columns) - start)
+        m = len(lengths)
+        rows = np.repeat(np.arange(m), lengths)
+        # Duplicate (row, column) pairs are summed into counts
+        X = sp.csr_matrix((np.ones(len(columns)), (rows, np.asarray(columns, dtype=np.int64))), shape=(m, 2 * n))
+        X.sum_duplicates()
+        # l2-normalize the word and char blocks of each row separately, then weight the char block
+        block = (X.indices >= n).astype(np.intp)
+        cell = np.repeat(np.arange(m), np.diff(X.indptr)) * 2 + block
+        norms = np.sqrt(np.bincount(cell, weights=X.data ** 2, minlength=2 * m))
+        X.data *= np.array([1.0, self.char_weight])[block] / norms[cell]
+        return X
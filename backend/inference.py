@@ -0,0 +1,130 @@
+# Closed-form scorers for the linear intent models, used instead of clf.predict_proba on the hot path
+from typing import List, Optional, Tuple
+import numpy as np
+
+MIN_PROB = 1e-7  # libsvm clamps pairwise probabilities to [MIN_PROB, 1 - MIN_PROB]
+
+
+def compact_weights(coef) -> Tuple[np.ndarray, np.ndarray]:
+    """(slots, weights) for a (rows x features) coefficient matrix with many all-zero columns.
+
+    Hashed feature spaces are large and fixed, so most features never get a weight. Only
+    features with one get a row in the dense (features x rows) ``weights``; ``slots`` maps
+    every feature to its row, with unused features pointing at a final all-zero row. A
+    sparse ``coef`` is never expanded to its full width.
+    """
+    if hasattr(coef, "tocsc"):
+        csc = coef.tocsc()
+        used = np.flatnonzero(np.diff(csc.indptr))
+        kept = csc[:, used].toarray()
+    else:
+        coef = np.asarray(coef)
+        used = np.flatnonzero(np.any(coef != 0, axis=0))
+        kept = coef[:, used]
+    slots = np.full(coef.shape[1], len(used), dtype=np.int32)
+    slots[used] = np.arange(len(used), dtype=np.int32)
+    weights = np.zeros((len(used) + 1, coef.shape[0]), dtype=np.float64)
+    weights[:-1] = kept.T
+    return slots, weights
+
+
+def compact_dot(X, slots: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    import scipy.sparse as sp
+    X = sp.csr_matrix(X)
+    compact = sp.csr_matrix((X.data, slots[X.indices], X.indptr), shape=(X.shape[0], len(weights)))
+    return np.asarray(compact @ weights)
+
+
+class LinearIntentScorer:
+    """Reproduces ``SVC(kernel='linear', probability=True).predict_proba`` with dense NumPy ops.
+
+    The SVC is one-vs-one, so the exported weight matrix has one row per pair
+    of intents (in ``clf.classes_`` order). Scoring is a single sparse-dot-dense
+    product, Platt sigmoids per pair, and the pairwise-coupling problem from
+    libsvm solved in closed form (libsvm iterates to the same fixed point, so
+    probabilities agree to ~1e-3 and rankings agree except for near-ties).
+    """
+
+    def __init__(self, clf):
+        if getattr(clf, "kernel", None) != "linear" or not getattr(clf, "probability", False):
+            raise TypeError("LinearIntentScorer needs an SVC fitted with kernel='linear' and probability=True")
+        self.classes = np.asarray(clf.classes_)
+        n_classes = len(self.classes)
+        # Stored transposed (features x pairs) so scoring is X @ weights; hashed features
+        # (MODEL_FEATURES=hashed) leave most of the space unused, so only used features are kept
+        self.slots: Optional[np.ndarray] = None
+        slots, weights = compact_weights(clf.coef_)
+        if 2 * (len(weights) - 1) <= len(slots):
+            self.slots, self.weights = slots, weights
+        else:
+            coef = clf.coef_
+            coef = coef.toarray() if hasattr(coef, "toarray") else np.asarray(coef)
+            self.weights = np.ascontiguousarray(coef.T, dtype=np.float64)
+        self.intercept = np.asarray(clf.intercept_, dtype=np.float64)
+        self.prob_a = np.asarray(clf.probA_, dtype=np.float64)
+        self.prob_b = np.asarray(clf.probB_, dtype=np.float64)
+        self._rows, self._cols = np.triu_indices(n_classes, 1)
+        self._diag = np.arange(n_classes)
+
+    def decision_function(self, X) -> np.ndarray:
+        if self.slots is not None:
+            return compact_dot(X, self.slots, self.weights) + self.intercept
+        return np.asarray(X @ self.weights) + self.intercept
+
+    def predict_proba(self, X) -> np.ndarray:
+        dec = self.decision_function(X)
+        n, k = dec.shape[0], len(self.classes)
+        # Platt scaling per pair: P(row class beats column class)
+        pair = 1.0 / (1.0 + np.exp(dec * self.prob_a + self.prob_b))
+        np.clip(pair, MIN_PROB, 1.0 - MIN_PROB, out=pair)
+        r = np.zeros((n, k, k))
+        r[:, self._rows, self._cols] = pair
+        r[:, self._cols, self._rows] = 1.0 - pair
+        # Wu, Lin & Weng (2004) coupling: Q p = b e, sum(p) = 1
+        q = -r.transpose(0, 2, 1) * r
+        q[:, self._diag, self._diag] = (r * r).sum(axis=1)
+        p = np.linalg.solve(q, np.ones((n, k, 1)))[..., 0]
+        p /= p.sum(axis=1, keepdims=True)
+        return p
+
+
+class OvRIntentScorer:
+    """Reproduces ``SGDClassifier(loss="log_loss").predict_proba`` (one-vs-rest logistic).
+
+    Models from ``python -m backend.train --data`` use a hashing vectorizer, so much of the
+    (large, fixed) feature space may have zero weight; weights are kept compacted
+    (see ``compact_weights``).
+    """
+
+    def __init__(self, clf):
+        if getattr(clf, "loss", None) != "log_loss":
+            raise TypeError("OvRIntentScorer needs a linear model fitted with loss='log_loss'")
+        self.classes = np.asarray(clf.classes_)
+        self.slots, self.weights = compact_weights(clf.coef_)
+        self.intercept = np.asarray(clf.intercept_, dtype=np.float64)
+
+    def decision_function(self, X) -> np.ndarray:
+        return compact_dot(X, self.slots, self.weights) + self.intercept
+
+    def predict_proba(self, X) -> np.ndarray:
+        dec = self.decision_function(X)
+        p = 1.0 / (1.0 + np.exp(-dec))
+        if len(self.classes) == 2:
+            return np.hstack([1.0 - p, p])
+        # sklearn normalizes the per-class sigmoids to sum to one
+        p /= p.sum(axis=1, keepdims=True)
+        return p
+
+
+def make_scorer(clf):
+    """The hot-path scorer matching ``clf``'s model family."""
+    if getattr(clf, "kernel", None) is not None:
+        return LinearIntentScorer(clf)
+    return OvRIntentScorer(clf)
+
+
+def top_k(proba: np.ndarray, k: int) -> List[int]:
+    """Indices of the ``k`` largest entries of a 1-D probability vector, best first."""
+    k = min(k, proba.shape[0])
+    idx = np.argpartition(proba, -k)[-k:]
+    return [int(i) for i in idx[np.argsort(proba[idx])[::-1]]]
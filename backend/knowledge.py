@@ -0,0 +1,197 @@
+# Hot-reloadable knowledge base: immutable snapshots of the answer tables, swapped atomically
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+from backend.answers import TEMPLATE_VARIANTS, AnswerTable
+from backend.data import (
+    DATA_FILE, DEFAULT_ANSWER_TEMPLATES, DEFAULT_BASE_ANSWERS, DEFAULT_PROGRAM_FEE_HINTS,
+    DEFAULT_PROGRAM_PLACEMENT_HINTS, load_faqs,
+)
+from backend.model import TRAIN_DATA
+from backend.nlp import HOSTEL_GENDER_ALIASES, LEXICON, PROGRAM_ALIASES, normalize
+from backend.retrieval import RETRIEVAL_INDEX_DIR, RETRIEVAL_PASSAGES, Passages, faq_passages, file_passages
+from backend.tiers import QuestionIndex
+
+logger = logging.getLogger(__name__)
+
+# Seconds between mtime checks of data/faqs.json; 0 disables the watcher
+KB_RELOAD_INTERVAL_SECONDS = float(os.getenv("KB_RELOAD_INTERVAL_SECONDS", "5"))
+
+TABLES = ("base_answers", "program_fee_hints", "program_placement_hints")
+
+
+def is_hint_table(name: str) -> bool:
+    # Any "program_<topic>_hints" object can be referenced by an answer template's "hints"
+    return name.startswith("program_") and name.endswith("_hints")
+
+
+@dataclass(frozen=True)
+class KnowledgeBase:
+    base_answers: Mapping[str, str]
+    program_fee_hints: Mapping[str, str]
+    program_placement_hints: Mapping[str, str]
+    # Every answer pre-rendered by (intent, program, hostel gender)
+    answers: AnswerTable
+    # Known questions for the exact and fuzzy tiers
+    questions: QuestionIndex
+    # BM25 index over these answers (plus data/passages.jsonl) for the retrieval tier
+    passages: Passages
+    version: str
+
+
+def validate_faqs(faqs: Any) -> Dict[str, Dict[str, Any]]:
+    """Check the shape of a faqs.json document; raises ValueError describing the first problem."""
+    if not isinstance(faqs, dict):
+        raise ValueError("faqs.json must contain a JSON object")
+    tables: Dict[str, Dict[str, Any]] = {}
+    for name in (*TABLES, *(n for n in faqs if is_hint_table(n) and n not in TABLES)):
+        table = faqs.get(name, {})
+        if not isinstance(table, dict):
+            raise ValueError(f"'{name}' must be an object of string -> string")
+        for key, value in table.items():
+            if not isinstance(value, str) or not value.strip():
+                raise ValueError(f"'{name}.{key}' must be a non-empty string")
+        tables[name] = table
+    templates = faqs.get("answer_templates", {})
+    if not isinstance(templates, dict):
+        raise ValueError("'answer_templates' must be an object of intent -> template object")
+    for intent, spec in templates.items():
+        if not isinstance(spec, dict) or not set(spec) <= {*TEMPLATE_VARIANTS, "hints"}:
+            raise ValueError(f"'answer_templates.{intent}' may only set {', '.join(TEMPLATE_VARIANTS)} and hints")
+        for key, value in spec.items():
+            if not isinstance(value, str) or not value.strip():
+                raise ValueError(f"'answer_templates.{intent}.{key}' must be a non-empty string")
+    tables["answer_templates"] = templates
+    questions = faqs.get("questions", {})
+    if not isinstance(questions, dict):
+        raise ValueError("'questions' must be an object of intent -> list of strings")
+    for intent, texts in questions.items():
+        if not isinstance(texts, list) or not all(isinstance(t, str) and t.strip() for t in texts):
+            raise ValueError(f"'questions.{intent}' must be a list of non-empty strings")
+    tables["questions"] = questions
+    return tables
+
+
+# Real words the fuzzy tier must not "correct" into known ones (e.g. "administration" -> "admission")
+SPELLED_WORDS = LEXICON.nouns | {
+    word for aliases in (*PROGRAM_ALIASES.values(), *HOSTEL_GENDER_ALIASES.values())
+    for alias in aliases for word in normalize(alias).split()
+}
+
+
+def known_questions(questions: Mapping[str, List[str]], intents: Any) -> List[Tuple[str, str]]:
+    """(normalized text, intent) for TRAIN_DATA, the faqs.json questions and each intent's own name."""
+    known = [(normalize(text), intent) for text, intent in TRAIN_DATA]
+    known += [(normalize(text), intent) for intent, texts in questions.items() for text in texts]
+    known += [(normalize(intent.replace("_", " ")), intent) for intent in intents]
+    return known
+
+
+def build_snapshot(faqs: Dict[str, Any], index_dir: str = RETRIEVAL_INDEX_DIR) -> KnowledgeBase:
+    tables = validate_faqs(faqs)
+    base_answers = {**DEFAULT_BASE_ANSWERS, **tables["base_answers"]}
+    fee_hints = {**DEFAULT_PROGRAM_FEE_HINTS, **tables["program_fee_hints"]}
+    placement_hints = {**DEFAULT_PROGRAM_PLACEMENT_HINTS, **tables["program_placement_hints"]}
+    hint_tables = {
+        **{name: table for name, table in tables.items() if is_hint_table(name)},
+        "program_fee_hints": fee_hints,
+        "program_placement_hints": placement_hints,
+    }
+    templates = {**DEFAULT_ANSWER_TEMPLATES, **tables["answer_templates"]}
+    # Changes whenever any answer table changes; used to invalidate cached answers
+    version = hashlib.sha256(
+        json.dumps([base_answers, hint_tables, templates, tables["questions"]], sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    try:
+        answers = AnswerTable(base_answers, templates, hint_tables)
+    except ValueError as exc:
+        raise ValueError(f"'answer_templates': {exc}") from None
+    unanswered = sorted(set(tables["questions"]) - set(answers.templates))
+    if unanswered:
+        raise ValueError(f"'questions.{unanswered[0]}' names an intent without an answer")
+    questions = QuestionIndex(known_questions(tables["questions"], answers.templates), SPELLED_WORDS)
+    return KnowledgeBase(
+        base_answers=MappingProxyType(base_answers),
+        program_fee_hints=MappingProxyType(fee_hints),
+        program_placement_hints=MappingProxyType(placement_hints),
+        answers=answers,
+        questions=questions,
+        passages=Passages(list(faq_passages(tables)) + list(file_passages(RETRIEVAL_PASSAGES)), index_dir),
+        version=version,
+    )
+
+
+class KnowledgeStore:
+    """Holds the current KnowledgeBase for ``path``.
+
+    Readers take ``store.current`` once per request and use that snapshot
+    throughout, so a reload never shows them a mix of old and new tables.
+    Reloads parse and validate off the request path and replace the snapshot
+    with a single reference assignment; an invalid file keeps the old one.
+    """
+
+    def __init__(self, path: str, index_dir: str = RETRIEVAL_INDEX_DIR):
+        self.path = path
+        self.index_dir = index_dir
+        self._mtime = self._stat()
+        self._lock = threading.Lock()
+        # Startup keeps the historical behaviour: unreadable or invalid data falls back to the defaults
+        try:
+            self.current = build_snapshot(load_faqs(path), index_dir)
+        except ValueError:
+            logger.exception("invalid %s; serving default answers", path)
+            self.current = build_snapshot({}, index_dir)
+        self.reloads = 0
+        self.failures = 0
+
+    def _stat(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def reload(self, force: bool = False) -> bool:
+        """Re-read the file if it changed (or ``force``). Returns True when a new snapshot was installed."""
+        with self._lock:
+            mtime = self._stat()
+            if not force and mtime == self._mtime:
+                return False
+            try:
+                faqs: Any = {}
+                if mtime is not None:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        faqs = json.load(f)
+                snapshot = build_snapshot(faqs, self.index_dir)
+            except (OSError, ValueError):
+                self.failures += 1
+                raise
+            finally:
+                # Do not retry a broken file on every tick; wait for the next edit
+                self._mtime = mtime
+            # Build the new passage index before the swap, so retrieval never quotes the old answers
+            snapshot.passages.index()
+            changed = snapshot.version != self.current.version
+            self.current = snapshot
+            self.reloads += 1
+            return changed
+
+    def stats(self) -> Dict[str, Any]:
+        return {"version": self.current.version, "reloads": self.reloads, "failures": self.failures}
+
+    async def watch(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if await asyncio.to_thread(self.reload):
+                    logger.info("reloaded %s (version %s)", self.path, self.current.version[:12])
+            except (OSError, ValueError):
+                logger.exception("rejected %s; keeping the previous knowledge base", self.path)
+
+
+knowledge = KnowledgeStore(DATA_FILE)
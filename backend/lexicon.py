@@ -0,0 +1,123 @@
+# Offline stopword and lemma tables, so importing backend.nlp never touches NLTK or the network.
+# The artifact is compiled from NLTK's English stopwords and WordNet nouns:
+#   python -m backend.lexicon build     (needs the NLTK data once, on the build machine)
+#   python -m backend.lexicon verify    (checks the tables reproduce WordNetLemmatizer)
+import argparse
+import gzip
+import json
+import os
+import re
+import sys
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+LEXICON_VERSION = 1
+LEXICON_FILE = os.getenv(
+    "LEXICON_FILE", os.path.join(os.path.dirname(__file__), "data", "lexicon.json.gz")
+)
+
+# WordNet's noun detachment rules (nltk WordNetCorpusReader.MORPHOLOGICAL_SUBSTITUTIONS["n"])
+NOUN_SUBSTITUTIONS = (
+    ("s", ""), ("ses", "s"), ("ves", "f"), ("xes", "x"), ("zes", "z"),
+    ("ches", "ch"), ("shes", "sh"), ("men", "man"), ("ies", "y"),
+)
+# normalize() only ever produces tokens of this shape, so other lemmas are never looked up
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+class Lexicon:
+    """Stopwords plus a noun lemmatizer equivalent to ``WordNetLemmatizer().lemmatize(word)``."""
+
+    def __init__(self, stopwords: Iterable[str], nouns: Iterable[str], exceptions: Dict[str, str]):
+        self.stopwords: FrozenSet[str] = frozenset(stopwords)
+        self.nouns: FrozenSet[str] = frozenset(nouns)
+        # Irregular plurals, already resolved to their final lemma (e.g. "children" -> "child")
+        self.exceptions = exceptions
+
+    def lemmatize(self, word: str) -> str:
+        # Same search as WordNet's morphy for pos="n": exception list, then one round of suffix rules,
+        # then repeated rounds until some form is a known noun; the shortest candidate wins
+        if word in self.exceptions:
+            return self.exceptions[word]
+        forms = self._detach([word])
+        found = self._known([word] + forms)
+        while not found and forms:
+            forms = self._detach(forms)
+            found = self._known(forms)
+        return min(found, key=len) if found else word
+
+    @staticmethod
+    def _detach(forms: List[str]) -> List[str]:
+        return [form[: -len(old)] + new for form in forms for old, new in NOUN_SUBSTITUTIONS if form.endswith(old)]
+
+    def _known(self, forms: List[str]) -> List[str]:
+        seen: List[str] = []
+        for form in forms:
+            if form in self.nouns and form not in seen:
+                seen.append(form)
+        return seen
+
+
+def compile_tables() -> Dict[str, object]:
+    # Build-time only: this is the one place NLTK is imported
+    from nltk.corpus import stopwords, wordnet as wn
+    from nltk.stem import WordNetLemmatizer
+    lemmatizer = WordNetLemmatizer()
+    pos_map = wn._lemma_pos_offset_map
+    nouns = sorted(w for w, pos in pos_map.items() if "n" in pos and _TOKEN.fullmatch(w))
+    exceptions = {form: lemmatizer.lemmatize(form) for form in wn._exception_map["n"] if _TOKEN.fullmatch(form)}
+    return {
+        "lexicon_version": LEXICON_VERSION,
+        "stopwords": sorted(set(stopwords.words("english"))),
+        "nouns": "\n".join(nouns),
+        "exceptions": exceptions,
+    }
+
+
+def save(tables: Dict[str, object], path: str = LEXICON_FILE) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    # mtime=0 keeps the gzip bytes reproducible, so rebuilding unchanged data leaves git clean
+    with open(tmp, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as f:
+        f.write(json.dumps(tables, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8"))
+    os.replace(tmp, path)
+
+
+def load(path: str = LEXICON_FILE) -> Lexicon:
+    try:
+        with gzip.open(path, "rb") as f:
+            tables = json.loads(f.read().decode("utf-8"))
+    except OSError as e:
+        raise RuntimeError(f"lexicon artifact {path} is missing or unreadable; run: python -m backend.lexicon build") from e
+    if tables.get("lexicon_version") != LEXICON_VERSION:
+        raise RuntimeError(f"lexicon artifact {path} has an unsupported version; run: python -m backend.lexicon build")
+    return Lexicon(tables["stopwords"], tables["nouns"].split("\n"), tables["exceptions"])
+
+
+def verify(lexicon: Lexicon, words: Iterable[str]) -> List[str]:
+    from nltk.stem import WordNetLemmatizer
+    lemmatizer = WordNetLemmatizer()
+    return [w for w in words if lexicon.lemmatize(w) != lemmatizer.lemmatize(w)]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compile or check the offline stopword/lemma tables.")
+    parser.add_argument("command", choices=("build", "verify"))
+    parser.add_argument("--output", default=LEXICON_FILE, help="artifact path (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        tables = compile_tables()
+        save(tables, args.output)
+        print(f"wrote {args.output} ({len(tables['stopwords'])} stopwords, "
+              f"{tables['nouns'].count(chr(10)) + 1} nouns, {len(tables['exceptions'])} exceptions)")
+        return 0
+
+    lexicon = load(args.output)
+    # Every noun, its regular plural forms, and every irregular form
+    words = sorted(lexicon.nouns | {n + s for n in lexicon.nouns for s in ("s", "es")} | set(lexicon.exceptions))
+    mismatches = verify(lexicon, words)
+    print(f"checked {len(words)} words, {len(mismatches)} mismatches {mismatches[:10]}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+# Aho-Corasick alias matcher: finds every alias occurrence in one linear scan of the text
+from collections import deque
+from typing import Dict, List, Tuple
+
+Match = Tuple[str, int, int]  # (canonical name, start, end)
+
+
+def _is_word(ch: str) -> bool:
+    # Same definition of a word character as re's \b for str patterns
+    return ch.isalnum() or ch == "_"
+
+
+class AliasMatcher:
+    """Matches ``{canonical: [alias, ...]}`` tables with ``\\b(alias)\\b`` semantics.
+
+    The automaton is built once; ``find_all`` walks the text a single time
+    regardless of how many aliases are registered. Matching is case-sensitive,
+    like the regexes it replaces (callers pass normalized, lowercased text).
+    """
+
+    def __init__(self, aliases: Dict[str, List[str]]):
+        self.order: Dict[str, int] = {canon: i for i, canon in enumerate(aliases)}
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[str, int]]] = [[]]
+        for canon, names in aliases.items():
+            for alias in names:
+                self._add(alias, canon)
+        self._link()
+
+    def _add(self, alias: str, canon: str) -> None:
+        state = 0
+        for ch in alias:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        if (canon, len(alias)) not in self._out[state]:
+            self._out[state].append((canon, len(alias)))
+
+    def _link(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                # Inherit matches of the longest proper suffix so the scan never follows output chains
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find_all(self, text: str) -> List[Match]:
+        """Every alias occurrence bounded by word boundaries, ordered by start (longest first)."""
+        goto, fail, out = self._goto, self._fail, self._out
+        n = len(text)
+        found: List[Match] = []
+        state = 0
+        for end, ch in enumerate(text, 1):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if not out[state]:
+                continue
+            right = _is_word(text[end]) if end < n else False
+            for canon, length in out[state]:
+                start = end - length
+                left = _is_word(text[start - 1]) if start > 0 else False
+                # \b before the first and after the last character of the alias
+                if left != _is_word(text[start]) and _is_word(text[end - 1]) != right:
+                    found.append((canon, start, end))
+        found.sort(key=lambda m: (m[1], m[1] - m[2]))
+        return found
@@ -0,0 +1,340 @@
+# In-process metrics with Prometheus text exposition, plus an on-demand sampling profiler.
+# Every series is created up front (or on first use of a new label value), so recording a
+# sample is a bisect and a few integer/float updates under an uncontended lock.
+import collections
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Upper bounds in seconds, 50us .. 5s; the +Inf bucket is implicit
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+CONFIDENCE_BUCKETS = (0.1, 0.2, 0.25, 0.3, 0.35, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._expose_child(_labels(self.labelnames, values), child))
+        return lines
+
+    def _expose_child(self, labels: str, child) -> List[str]:
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.inc(amount)
+
+    def _expose_child(self, labels: str, child: _CounterChild) -> List[str]:
+        return [f"{self.name}{labels} {_number(child.value)}"]
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def dec(self, amount: float = 1.0) -> None:
+        self._default.dec(amount)
+
+    def set(self, value: float) -> None:
+        self._default.set(value)
+
+
+class GaugeFunc(_Metric):
+    """Gauge read from a callback at scrape time (for state other modules already track)."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float]):
+        super().__init__(name, help)
+        self.fn = fn
+
+    def expose(self) -> List[str]:
+        try:
+            value = float(self.fn())
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {_number(value)}"]
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default.observe(value)
+
+    def _expose_child(self, labels: str, child: _HistogramChild) -> List[str]:
+        with child._lock:
+            counts = list(child.counts)
+            total = child.sum
+        inner = labels[1:-1] + "," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{{inner}le="{_number(float(bound))}"}} {cumulative}')
+        lines.append(f"{self.name}_sum{labels} {_number(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def expose(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGES = ("jwt_decode", "user_lookup", "normalize", "transform", "predict_proba", "build_answer", "retrieval")
+STAGE_SECONDS = registry.register(
+    Histogram("chat_stage_seconds", "Time spent in each stage of the chat pipeline.", ("stage",))
+)
+# Pre-create every stage so the hot path never takes the creation lock
+STAGE = {stage: STAGE_SECONDS.labels(stage) for stage in STAGES}
+INFERENCE_BATCH_SIZE = registry.register(
+    Histogram("chat_inference_batch_size", "Messages classified per model call.", buckets=BATCH_SIZE_BUCKETS)
+)
+INTENTS = registry.register(Counter("chat_intent_total", "Answers served, by primary intent.", ("intent",)))
+CONFIDENCE = registry.register(
+    Histogram("chat_confidence", "Classifier confidence of the primary intent.", buckets=CONFIDENCE_BUCKETS)
+)
+CACHE_RESULTS = registry.register(Counter("chat_cache_total", "Response cache lookups.", ("result",)))
+CACHE_HIT, CACHE_MISS = CACHE_RESULTS.labels("hit"), CACHE_RESULTS.labels("miss")
+HTTP_SECONDS = registry.register(
+    Histogram("http_request_duration_seconds", "HTTP request latency by endpoint.", ("endpoint", "method", "status"))
+)
+HTTP_IN_FLIGHT = registry.register(Gauge("http_requests_in_flight", "HTTP requests currently being served."))
+
+
+def process_memory(pid="self") -> Dict[str, int]:
+    """Rss/Pss/shared/private bytes of a process from /proc (Linux); empty elsewhere."""
+    fields = {"Rss": "rss", "Pss": "pss", "Shared_Clean": "shared_clean", "Shared_Dirty": "shared_dirty",
+              "Private_Clean": "private_clean", "Private_Dirty": "private_dirty"}
+    memory: Dict[str, int] = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in fields:
+                    memory[fields[key]] = int(rest.split()[0]) * 1024
+    except (OSError, ValueError):
+        pass
+    return memory
+
+
+registry.register(GaugeFunc(
+    "process_resident_memory_bytes", "Resident set size of this worker.", lambda: process_memory()["rss"]
+))
+registry.register(GaugeFunc(
+    "process_proportional_memory_bytes", "Proportional set size (shared pages split between processes).",
+    lambda: process_memory()["pss"],
+))
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: request latency by endpoint function and the in-flight gauge."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # The router stores the matched endpoint in the scope; using its name keeps label cardinality bounded
+            endpoint = getattr(scope.get("endpoint"), "__name__", "unmatched")
+            HTTP_SECONDS.labels(endpoint, scope["method"], str(status[0])).observe(time.perf_counter() - started)
+
+
+class SamplingProfiler:
+    """Samples the stacks of all threads every ``interval`` seconds into folded-stack counts.
+
+    Output is the "collapsed" format used by flamegraph.pl and speedscope. Sampling runs in
+    its own thread and only while started, so it costs nothing when switched off.
+    """
+
+    def __init__(self, max_stacks: int = 10_000):
+        self.max_stacks = max_stacks
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.stacks: collections.Counter = collections.Counter()
+        self.samples = 0
+        self.interval = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = 0.005) -> bool:
+        with self._lock:
+            if self.running:
+                return False
+            self.stacks = collections.Counter()
+            self.samples = 0
+            self.interval = interval
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="sampling-profiler", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self) -> str:
+        with self._lock:
+            if self._thread is not None:
+                self._stop.set()
+                self._thread.join()
+                self._thread = None
+            return self.folded()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def _loop(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack = ";".join(reversed(names))
+                # Bounded memory: once full, only stacks already seen keep counting
+                if stack in self.stacks or len(self.stacks) < self.max_stacks:
+                    self.stacks[stack] += 1
+            self.samples += 1
+
+    def stats(self) -> Dict[str, float]:
+        return {"running": self.running, "interval": self.interval, "samples": self.samples, "stacks": len(self.stacks)}
+
+
+profiler = SamplingProfiler()
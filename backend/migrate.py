@@ -0,0 +1,42 @@
+# Schema setup, run once per deploy (or by the launcher) instead of by every worker at startup
+# Run: python -m backend.migrate
+import asyncio
+import os
+import sys
+from typing import List
+from sqlalchemy import inspect
+from .database import engine, async_engine
+from .db_models import Base
+
+# Let app startup create missing tables (convenient for development); set to false when deploys run this module
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "true").lower() in ("1", "true", "yes")
+
+
+def _create_missing(conn) -> List[str]:
+    existing = set(inspect(conn).get_table_names())
+    missing = [t for t in Base.metadata.sorted_tables if t.name not in existing]
+    Base.metadata.create_all(bind=conn, tables=missing)
+    return [t.name for t in missing]
+
+
+def migrate() -> List[str]:
+    """Create missing tables; returns their names."""
+    with engine.begin() as conn:
+        return _create_missing(conn)
+
+
+async def migrate_async() -> List[str]:
+    async with async_engine.begin() as conn:
+        return await conn.run_sync(_create_missing)
+
+
+def main() -> int:
+    created = migrate()
+    print(f"created tables: {', '.join(created)}" if created else "schema up to date")
+    engine.dispose()
+    asyncio.run(async_engine.dispose())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,36 @@
-from typing import List
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.svm import SVC
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
 from backend.nlp import normalize
+from backend.inference import make_scorer
+from backend.metrics import STAGE, INFERENCE_BATCH_SIZE
+
+if TYPE_CHECKING:
+    from sklearn.svm import SVC
+
+logger = logging.getLogger(__name__)
+
+# Bump when the artifact layout or the estimator configuration changes
+ARTIFACT_VERSION = 1
+MODEL_ARTIFACT = os.getenv(
+    "MODEL_ARTIFACT", os.path.join(os.path.dirname(__file__), "data", "intent_model.joblib")
+)
+# Seconds between mtime checks of MODEL_ARTIFACT, so models published by backend.train go live; 0 disables
+MODEL_RELOAD_INTERVAL_SECONDS = float(os.getenv("MODEL_RELOAD_INTERVAL_SECONDS", "5"))
+# "tfidf": word uni/bigram TF-IDF over a vocabulary learned from TRAIN_DATA.
+# "hashed": word uni/bigrams plus character 2-4-grams, each hashed into MODEL_HASH_FEATURES columns;
+# misspelled words still share most character n-grams with the trained ones, and no vocabulary is kept
+MODEL_FEATURES = os.getenv("MODEL_FEATURES", "tfidf")
+MODEL_HASH_FEATURES = int(os.getenv("MODEL_HASH_FEATURES", str(2 ** 18)))
+# Weight of the character n-grams against the word n-grams (held-out accuracy on data/eval_noisy.jsonl
+# rises up to 2.0, then stays flat)
+MODEL_CHAR_WEIGHT = float(os.getenv("MODEL_CHAR_WEIGHT", "2.0"))
+FEATURES = ("tfidf", "hashed")
 
 # Training data (expanded for better accuracy)
 TRAIN_DATA = [
@@ -140,10 +169,197 @@ TRAIN_DATA = [
     ("tum kya karte ho", "chatbot_intro"),
 ]
 
-X_train: List[str] = [normalize(t) for t, _ in TRAIN_DATA]
-Y_train: List[str] = [y for _, y in TRAIN_DATA]
 
-vectorizer = TfidfVectorizer(ngram_range=(1, 2), min_df=1, stop_words='english')
-X_vec = vectorizer.fit_transform(X_train)
-clf = SVC(probability=True, kernel='linear', C=1.0)  # Linear SVM for text, with probability estimates
-clf.fit(X_vec, Y_train)
\ No newline at end of file
+def training_set() -> Tuple[List[str], List[str]]:
+    X = [normalize(t) for t, _ in TRAIN_DATA]
+    Y = [y for _, y in TRAIN_DATA]
+    return X, Y
+
+
+def training_hash(X: List[str], Y: List[str]) -> str:
+    # Hash the normalized texts so changes to the normalizer also trigger a retrain
+    config: Dict[str, Any] = {"artifact_version": ARTIFACT_VERSION, "X": X, "Y": Y}
+    if MODEL_FEATURES != "tfidf":
+        # Only other featurizations are hashed in, so existing tfidf artifacts stay valid
+        config["features"] = [MODEL_FEATURES, MODEL_HASH_FEATURES, MODEL_CHAR_WEIGHT]
+    payload = json.dumps(config, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def make_vectorizer(
+    features: str = MODEL_FEATURES, n_features: int = MODEL_HASH_FEATURES, char_weight: float = MODEL_CHAR_WEIGHT
+) -> Any:
+    """An unfitted vectorizer for normalized texts (see MODEL_FEATURES)."""
+    if features == "tfidf":
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        return TfidfVectorizer(ngram_range=(1, 2), min_df=1, stop_words='english')
+    if features == "hashed":
+        from backend.features import HashedFeatures
+        # Stateless: fit() learns nothing, and the artifact holds only the settings
+        return HashedFeatures(n_features, char_weight)
+    raise ValueError(f"unknown MODEL_FEATURES {features!r}; expected one of {', '.join(FEATURES)}")
+
+
+def fit(X: List[str], Y: List[str], features: str = MODEL_FEATURES) -> Tuple[Any, "SVC"]:
+    from sklearn.svm import SVC
+    vec = make_vectorizer(features)
+    X_vec = vec.fit_transform(X)
+    # Linear SVM for text, with probability estimates; fixed seed so every build yields the same model
+    model = SVC(probability=True, kernel='linear', C=1.0, random_state=0)
+    model.fit(X_vec, Y)
+    return vec, model
+
+
+def save_artifact(
+    vec: Any, model: Any, train_hash: str, path: str = MODEL_ARTIFACT, extra: Optional[Dict[str, Any]] = None
+) -> None:
+    import joblib
+    import sklearn
+    artifact = {
+        "artifact_version": ARTIFACT_VERSION,
+        "sklearn_version": sklearn.__version__,
+        "train_hash": train_hash,
+        "classes": [str(c) for c in model.classes_],
+        "vectorizer": vec,
+        "clf": model,
+        # Retrained models carry {"published": True, "metrics": ..., "trained_at": ...}
+        **(extra or {}),
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Write then rename so concurrently starting workers never read a partial file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    joblib.dump(artifact, tmp)
+    os.replace(tmp, path)
+
+
+def load_artifact(path: str = MODEL_ARTIFACT) -> Optional[Dict[str, Any]]:
+    import joblib
+    import sklearn
+    if not os.path.isfile(path):
+        return None
+    try:
+        # Numpy arrays (coefficients, support vectors) are memory-mapped rather than copied
+        artifact = joblib.load(path, mmap_mode="r")
+    except Exception:
+        return None
+    if artifact.get("artifact_version") != ARTIFACT_VERSION:
+        return None
+    if artifact.get("sklearn_version") != sklearn.__version__:
+        return None
+    return artifact
+
+
+def load_or_train(path: str = MODEL_ARTIFACT) -> Tuple[Any, Any, str]:
+    X, Y = training_set()
+    train_hash = training_hash(X, Y)
+    artifact = load_artifact(path)
+    # A model published by the retraining pipeline is served as is, whatever TRAIN_DATA says
+    if artifact is not None and (artifact["train_hash"] == train_hash or artifact.get("published")):
+        return artifact["vectorizer"], artifact["clf"], artifact["train_hash"]
+    vec, model = fit(X, Y)
+    try:
+        save_artifact(vec, model, train_hash, path)
+    except OSError:
+        pass  # read-only deployments still serve the freshly trained model
+    return vec, model, train_hash
+
+
+# Loaded on first use (or by routes.warmup), so importing the app does not pull in sklearn
+_LAZY = ("vectorizer", "clf", "MODEL_VERSION", "scorer")
+_model: Optional[Tuple[Any, Any, str, Any]] = None
+_load_lock = threading.Lock()
+_artifact_mtime: Optional[float] = None
+reloads = 0
+reload_failures = 0
+
+
+def _artifact_stat(path: str = MODEL_ARTIFACT) -> Optional[float]:
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def load() -> Tuple[Any, Any, str, Any]:
+    global _model, _artifact_mtime
+    if _model is None:
+        with _load_lock:
+            if _model is None:
+                vec, clf, version = load_or_train()
+                _artifact_mtime = _artifact_stat()
+                _model = (vec, clf, version, make_scorer(clf))
+    return _model
+
+
+def reload(force: bool = False) -> bool:
+    """Swap in the artifact at MODEL_ARTIFACT if it changed (or ``force``). True when the model changed.
+
+    The new model is loaded and its scorer built before a single reference assignment, so
+    in-flight batches finish on the old model. An unreadable artifact keeps the old one.
+    """
+    global _model, _artifact_mtime, reloads, reload_failures
+    load()
+    with _load_lock:
+        mtime = _artifact_stat()
+        if not force and mtime == _artifact_mtime:
+            return False
+        # Do not retry a broken file on every tick; wait for the next publish
+        _artifact_mtime = mtime
+        artifact = load_artifact()
+        if artifact is None:
+            reload_failures += 1
+            raise ValueError(f"model artifact {MODEL_ARTIFACT} is missing, unreadable or from another version")
+        vec, clf = artifact["vectorizer"], artifact["clf"]
+        changed = artifact["train_hash"] != _model[2]
+        _model = (vec, clf, artifact["train_hash"], make_scorer(clf))
+        reloads += 1
+        return changed
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "version": _model[2] if _model is not None else None,
+        "reloads": reloads,
+        "failures": reload_failures,
+    }
+
+
+async def watch(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if await asyncio.to_thread(reload):
+                logger.info("loaded model %s from %s", _model[2][:12], MODEL_ARTIFACT)
+        except (OSError, ValueError, TypeError):
+            logger.exception("rejected %s; keeping the previous model", MODEL_ARTIFACT)
+
+
+def __getattr__(name: str) -> Any:
+    # model.vectorizer / model.clf / model.MODEL_VERSION / model.scorer
+    if name in _LAZY:
+        return load()[_LAZY.index(name)]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class Scores(NamedTuple):
+    """Probabilities (one row per text, or a single row) with the classes and version of the
+    model snapshot that produced them, so a reload mid-request cannot misread the columns."""
+    proba: Any
+    classes: Any
+    version: str
+
+    def rows(self) -> List["Scores"]:
+        return [Scores(row, self.classes, self.version) for row in self.proba]
+
+
+def predict_proba_batch(texts: List[str]) -> Scores:
+    # One transform + one scoring call for the whole batch amortizes sklearn/scipy overhead
+    vectorizer, _, version, scorer = load()
+    started = time.perf_counter()
+    X = vectorizer.transform(texts)
+    transformed = time.perf_counter()
+    proba = scorer.predict_proba(X)
+    STAGE["transform"].observe(transformed - started)
+    STAGE["predict_proba"].observe(time.perf_counter() - transformed)
+    INFERENCE_BATCH_SIZE.observe(len(texts))
+    return Scores(proba, scorer.classes, version)
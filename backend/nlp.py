@@ -1,21 +1,14 @@
-from typing import List, Dict, Optional, Tuple
+from typing import Any, List, Dict, Optional, Tuple
+from functools import lru_cache
+import os
 import re
-import nltk
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
-
-# Download NLTK data if not present (lazy load)
-try:
-    stopwords.words('english')
-except LookupError:
-    nltk.download('stopwords')
-try:
-    WordNetLemmatizer().lemmatize('test')
-except LookupError:
-    nltk.download('wordnet')
-
-STOP_WORDS = set(stopwords.words('english'))
-LEMMATIZER = WordNetLemmatizer()
+from backend.lexicon import load as load_lexicon
+from backend.matcher import AliasMatcher, Match
+from backend.translit import to_latin
+
+# Precompiled stopword and WordNet noun tables (backend/data/lexicon.json.gz); no NLTK at runtime
+LEXICON = load_lexicon()
+STOP_WORDS = LEXICON.stopwords
 
 # Hindi/Hinglish mapping patterns to normalize tokens
 HI_MAP_PATTERNS: List[Tuple[re.Pattern, str]] = [
@@ -45,7 +38,17 @@ HI_MAP_PATTERNS: List[Tuple[re.Pattern, str]] = [
     (re.compile(r"\b(बीसीए|bca|bachelor of computer applications)\b", re.I), " bca "),
 ]
 
-_non_alnum_english = re.compile(r"[^a-z0-9\s]")
+# All HI_MAP_PATTERNS folded into one alternation; the named group that matched selects the replacement.
+# Every pattern starts with \b, which is hoisted so positions inside a word are rejected immediately.
+_HI_MAP_REPLACEMENTS: Dict[str, str] = {f"m{i}": rep for i, (_, rep) in enumerate(HI_MAP_PATTERNS)}
+HI_MAP_REGEX = re.compile(
+    r"\b(?:" + "|".join(f"(?P<m{i}>{pat.pattern[2:]})" for i, (pat, _) in enumerate(HI_MAP_PATTERNS)) + ")", re.I
+)
+_token_re = re.compile(r"[a-z0-9]+")
+LEMMA_CACHE_SIZE = 50_000
+# Romanize Devanagari words HI_MAP_PATTERNS does not cover ("शुल्क" -> "shulk") instead of dropping them.
+# Changes the training texts, so the model is retrained on the next start
+NORMALIZE_TRANSLITERATE = os.getenv("NORMALIZE_TRANSLITERATE", "false").lower() in ("1", "true", "yes")
 
 PROGRAM_ALIASES: Dict[str, List[str]] = {
     "btech": ["btech", "b tech", "bachelor of technology", "ug engineering", "बीटेक"],
@@ -70,43 +73,58 @@ HOSTEL_GENDER_ALIASES: Dict[str, List[str]] = {
     "girls": ["girls", "girl", "female", "women", "लड़कियां", "लडकियां", "लड़कियां", "लड़कियों", "लड़कियों"],
 }
 
-PROGRAM_PATTERNS: List[Tuple[str, re.Pattern]] = [
-    (canon, re.compile(r"\b(" + r"|".join(map(re.escape, aliases)) + r")\b"))
-    for canon, aliases in PROGRAM_ALIASES.items()
-]
-HOSTEL_PATTERNS: List[Tuple[str, re.Pattern]] = [
-    (canon, re.compile(r"\b(" + r"|".join(map(re.escape, aliases)) + r")\b"))
-    for canon, aliases in HOSTEL_GENDER_ALIASES.items()
-]
+# Built once; each matcher scans a message in a single pass however many aliases it holds
+PROGRAM_MATCHER = AliasMatcher(PROGRAM_ALIASES)
+HOSTEL_MATCHER = AliasMatcher(HOSTEL_GENDER_ALIASES)
+
+
+def _hi_replacement(m: re.Match) -> str:
+    return _HI_MAP_REPLACEMENTS[m.lastgroup]
 
 
 def apply_hi_mapping(text: str) -> str:
-    for pat, rep in HI_MAP_PATTERNS:
-        text = pat.sub(rep, text)
-    return text
+    return HI_MAP_REGEX.sub(_hi_replacement, text)
+
+
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def lemma(token: str) -> str:
+    # Empty string marks a stop word so normalize() can drop it with the same lookup
+    if token in STOP_WORDS:
+        return ""
+    return LEXICON.lemmatize(token)
 
 
-def normalize(text: str) -> str:
+def normalize(text: str, transliterate: bool = NORMALIZE_TRANSLITERATE) -> str:
+    # One mapping pass, one tokenizing pass; WordNet is only consulted for unseen tokens
     text = apply_hi_mapping(text)
+    if transliterate:
+        latin = to_latin(text)
+        if latin != text:
+            # Romanized words get the Latin mappings too ("लड़कियों" -> "ladkiyon" -> "girls")
+            text = apply_hi_mapping(latin)
     text = text.lower()
-    text = _non_alnum_english.sub(" ", text)
-    # Tokenize, remove stop words, lemmatize
-    tokens = text.split()
-    tokens = [LEMMATIZER.lemmatize(word) for word in tokens if word not in STOP_WORDS]
-    text = " ".join(tokens)
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
-
-
-def extract_entities(text: str) -> Dict[str, Optional[str]]:
-    program: Optional[str] = None
-    for canon, pat in PROGRAM_PATTERNS:
-        if pat.search(text):
-            program = canon
-            break
-    hostel_gender: Optional[str] = None
-    for canon, pat in HOSTEL_PATTERNS:
-        if pat.search(text):
-            hostel_gender = canon
-            break
-    return {"program": program, "hostel_gender": hostel_gender}
\ No newline at end of file
+    return " ".join(filter(None, map(lemma, _token_re.findall(text))))
+
+
+def mentioned(matches: List[Match]) -> List[str]:
+    """Distinct canonical names in the order the text first mentions them."""
+    return list(dict.fromkeys(canon for canon, _, _ in matches))
+
+
+def _first(matcher: AliasMatcher, matches: List[Match]) -> Optional[str]:
+    # Earliest entry in the alias table wins, as with the previous per-pattern scan
+    if not matches:
+        return None
+    return min((canon for canon, _, _ in matches), key=matcher.order.__getitem__)
+
+
+def extract_entities(text: str) -> Dict[str, Any]:
+    programs = PROGRAM_MATCHER.find_all(text)
+    genders = HOSTEL_MATCHER.find_all(text)
+    return {
+        "program": _first(PROGRAM_MATCHER, programs),
+        "hostel_gender": _first(HOSTEL_MATCHER, genders),
+        # Every match as (canonical, start, end), in text order
+        "programs": programs,
+        "hostel_genders": genders,
+    }
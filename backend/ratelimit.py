@@ -0,0 +1,309 @@
+# Admission control: token-bucket rate limits and load shedding.
+# Buckets use GCRA (the "generic cell rate algorithm"): a bucket is a single float, the time at
+# which it will be full again, so each check is one dict lookup and a few float operations.
+#   - per client IP, in RateLimitMiddleware: a strict policy for /auth (bcrypt) and a ceiling for everything else
+#   - per user, in the chat handlers (after authentication): CHAT_LIMIT
+# RATE_LIMIT_URL=redis://... shares the buckets between workers and hosts.
+import itertools
+import math
+import os
+import time
+from typing import Dict, Hashable, Optional
+
+from fastapi import HTTPException, status
+from starlette.responses import JSONResponse
+from starlette.websockets import WebSocketClose
+
+from .metrics import Counter, registry
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_URL = os.getenv("RATE_LIMIT_URL", "")
+# Buckets kept per policy in process; the least recently updated are dropped beyond this
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Take the client IP from X-Forwarded-For (only behind a trusted proxy). Clients can prepend any
+# addresses they like, so the one RATE_LIMIT_TRUSTED_PROXIES entries from the right is used:
+# the address the outermost of that many trusted proxies saw connecting
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() in ("1", "true", "yes")
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "1"))
+
+# Requests per minute and burst size; a rate of 0 disables the policy
+RATE_LIMIT_AUTH_PER_MINUTE = float(os.getenv("RATE_LIMIT_AUTH_PER_MINUTE", "10"))
+RATE_LIMIT_AUTH_BURST = float(os.getenv("RATE_LIMIT_AUTH_BURST", "10"))
+RATE_LIMIT_CHAT_PER_MINUTE = float(os.getenv("RATE_LIMIT_CHAT_PER_MINUTE", "60"))
+RATE_LIMIT_CHAT_BURST = float(os.getenv("RATE_LIMIT_CHAT_BURST", "64"))
+RATE_LIMIT_IP_PER_MINUTE = float(os.getenv("RATE_LIMIT_IP_PER_MINUTE", "1200"))
+RATE_LIMIT_IP_BURST = float(os.getenv("RATE_LIMIT_IP_BURST", "300"))
+
+# Load shedding (0 disables each trigger): reject with 503 while this worker has more requests in
+# flight than SHED_MAX_IN_FLIGHT, or while the p99 latency of the last SHED_WINDOW_SECONDS is too high
+SHED_MAX_IN_FLIGHT = int(os.getenv("SHED_MAX_IN_FLIGHT", "0"))
+SHED_P99_SECONDS = float(os.getenv("SHED_P99_SECONDS", "0"))
+SHED_WINDOW_SECONDS = float(os.getenv("SHED_WINDOW_SECONDS", "10"))
+
+AUTH_PATHS = ("/auth/token", "/auth/register")
+# Never limited: probes and scrapes must keep working when the API is saturated
+EXEMPT_PATHS = ("/health", "/metrics")
+
+RATE_LIMITED = registry.register(Counter("rate_limited_total", "Requests rejected with 429, by policy.", ("policy",)))
+SHED = registry.register(Counter("load_shed_total", "Requests rejected with 503 by load shedding.", ("reason",)))
+
+
+class RateLimit:
+    """In-process token buckets for one policy: ``burst`` tokens, refilled at ``per_minute``."""
+
+    def __init__(self, name: str, per_minute: float, burst: float, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.name = name
+        self.enabled = RATE_LIMIT_ENABLED and per_minute > 0
+        self.burst = max(1.0, burst)
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0  # seconds per token
+        self.tolerance = self.burst * self.interval
+        self.max_keys = max_keys
+        # key -> time its bucket is full again; insertion order is update order (oldest first)
+        self._tat: Dict[Hashable, float] = {}
+        self.rejected = 0
+        self.evictions = 0
+        self._rejected = RATE_LIMITED.labels(name)
+
+    def acquire(self, key: Hashable, cost: float = 1.0) -> float:
+        """Take ``cost`` tokens; returns 0 when allowed, else the seconds until they are available.
+
+        A ``cost`` above ``burst`` is never allowed; ``enforce`` rejects it up front.
+        """
+        if not self.enabled:
+            return 0.0
+        now = time.monotonic()
+        tat = self._tat.pop(key, now)
+        new_tat = max(tat, now) + cost * self.interval
+        if new_tat - now > self.tolerance:
+            self._tat[key] = tat
+            self.rejected += 1
+            self._rejected.inc()
+            return new_tat - now - self.tolerance
+        self._tat[key] = new_tat
+        if len(self._tat) > self.max_keys:
+            self._evict()
+        return 0.0
+
+    def _evict(self) -> None:
+        # Drop the least recently updated tenth at once, so eviction stays O(1) amortized;
+        # those buckets are almost always full again, and a dropped bucket simply starts full
+        excess = len(self._tat) - int(self.max_keys * 0.9)
+        for key in list(itertools.islice(self._tat, excess)):
+            del self._tat[key]
+        self.evictions += excess
+
+    def stats(self) -> Dict[str, float]:
+        return {"keys": len(self._tat), "rejected": self.rejected, "evictions": self.evictions}
+
+
+class RedisRateLimit:
+    """Same GCRA buckets kept in Redis (one key per bucket, updated atomically by a script),
+    so every worker and host shares them. Requires the optional ``redis`` package.
+    """
+
+    SCRIPT = """
+    local now = redis.call('TIME')
+    now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+    local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+    local new_tat = math.max(tat, now) + tonumber(ARGV[1])
+    local tolerance = tonumber(ARGV[2])
+    if new_tat - now > tolerance then
+        return tostring(new_tat - now - tolerance)
+    end
+    redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+    return '0'
+    """
+
+    def __init__(self, url: str, name: str, per_minute: float, burst: float, prefix: str = "iu-chatbot:rl:"):
+        try:
+            import redis
+        except ImportError as exc:
+            raise RuntimeError("RedisRateLimit needs the 'redis' package: pip install redis") from exc
+        self.name = name
+        self.enabled = RATE_LIMIT_ENABLED and per_minute > 0
+        self.burst = max(1.0, burst)
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self.tolerance = self.burst * self.interval
+        self.prefix = f"{prefix}{name}:"
+        self._script = redis.Redis.from_url(url).register_script(self.SCRIPT)
+        self.rejected = 0
+        self._rejected = RATE_LIMITED.labels(name)
+
+    def acquire(self, key: Hashable, cost: float = 1.0) -> float:
+        if not self.enabled:
+            return 0.0
+        wait = float(self._script(keys=[f"{self.prefix}{key}"], args=[cost * self.interval, self.tolerance]))
+        if wait > 0:
+            self.rejected += 1
+            self._rejected.inc()
+        return wait
+
+    def stats(self) -> Dict[str, float]:
+        return {"rejected": self.rejected}
+
+
+def make_limit(name: str, per_minute: float, burst: float, url: str = RATE_LIMIT_URL):
+    """In-process buckets by default; a ``redis://`` URL selects the shared RedisRateLimit."""
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisRateLimit(url, name, per_minute, burst)
+    return RateLimit(name, per_minute, burst)
+
+
+AUTH_LIMIT = make_limit("auth", RATE_LIMIT_AUTH_PER_MINUTE, RATE_LIMIT_AUTH_BURST)
+CHAT_LIMIT = make_limit("chat", RATE_LIMIT_CHAT_PER_MINUTE, RATE_LIMIT_CHAT_BURST)
+IP_LIMIT = make_limit("ip", RATE_LIMIT_IP_PER_MINUTE, RATE_LIMIT_IP_BURST)
+
+
+def retry_after(wait: float) -> str:
+    return str(max(1, math.ceil(wait)))
+
+
+def enforce(limit, key: Hashable, cost: float = 1.0) -> None:
+    """Raise 429 with Retry-After when ``key`` is out of tokens for ``limit``, or 413 when
+    ``cost`` exceeds the burst, which no amount of waiting would refill."""
+    if limit.enabled and cost > limit.burst:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {int(limit.burst)} messages per request under the {limit.name} rate limit",
+        )
+    wait = limit.acquire(key, cost)
+    if wait > 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests",
+            headers={"Retry-After": retry_after(wait)},
+        )
+
+
+class LoadShedder:
+    """Decides whether to reject new work: too many requests in flight, or recent p99 too high.
+
+    Latencies go into a fixed ring buffer; the p99 is recomputed at most every ``refresh``
+    seconds, so the per-request cost is constant. Only latencies from the last ``window``
+    seconds count, so shedding stops by itself once the slow requests age out; fewer than
+    ``min_samples`` of them never trigger it.
+    """
+
+    def __init__(
+        self, max_in_flight: int, p99: float, window: float, size: int = 1024, refresh: float = 0.25,
+        min_samples: int = 20,
+    ):
+        self.max_in_flight = max_in_flight
+        self.p99 = p99
+        self.window = window
+        self.refresh = refresh
+        self.min_samples = min_samples
+        self._latency = [0.0] * size
+        self._at = [0.0] * size
+        self._next = 0
+        self._checked = 0.0
+        self.overloaded = False
+        self.in_flight = 0
+        self.current_p99 = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_in_flight > 0 or self.p99 > 0
+
+    def observe(self, seconds: float) -> None:
+        i = self._next
+        self._latency[i] = seconds
+        self._at[i] = time.monotonic()
+        self._next = (i + 1) % len(self._latency)
+
+    def reason(self) -> Optional[str]:
+        """Why the next request should be shed, or None."""
+        if self.max_in_flight > 0 and self.in_flight >= self.max_in_flight:
+            return "in_flight"
+        if self.p99 > 0:
+            now = time.monotonic()
+            if now - self._checked >= self.refresh:
+                self._checked = now
+                recent = sorted(l for l, at in zip(self._latency, self._at) if at and now - at <= self.window)
+                self.current_p99 = recent[min(len(recent) - 1, int(len(recent) * 0.99))] if recent else 0.0
+                self.overloaded = len(recent) >= self.min_samples and self.current_p99 > self.p99
+            if self.overloaded:
+                return "p99"
+        return None
+
+    def stats(self) -> Dict[str, float]:
+        return {"in_flight": self.in_flight, "p99_seconds": self.current_p99, "overloaded": self.overloaded}
+
+
+shedder = LoadShedder(SHED_MAX_IN_FLIGHT, SHED_P99_SECONDS, SHED_WINDOW_SECONDS)
+
+
+def client_ip(scope, trusted_proxies: Optional[int] = None) -> str:
+    if trusted_proxies is None:
+        trusted_proxies = RATE_LIMIT_TRUSTED_PROXIES if RATE_LIMIT_TRUST_FORWARDED else 0
+    if trusted_proxies > 0:
+        # Repeated headers count as one list, in order
+        hops = [
+            hop.strip() for name, value in scope.get("headers", ()) if name == b"x-forwarded-for"
+            for hop in value.decode("latin-1").split(",") if hop.strip()
+        ]
+        if len(hops) >= trusted_proxies:
+            return hops[-trusted_proxies]
+    client = scope.get("client")
+    return client[0] if client else "-"
+
+
+class RateLimitMiddleware:
+    """Pure ASGI middleware: load shedding, then per-IP buckets, before any body parsing or auth."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "websocket":
+            await self.handshake(scope, receive, send)
+            return
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        if shedder.enabled:
+            reason = shedder.reason()
+            if reason is not None:
+                SHED.labels(reason).inc()
+                response = JSONResponse(
+                    {"detail": "Server is overloaded, please retry"}, status_code=503, headers={"Retry-After": "1"}
+                )
+                await response(scope, receive, send)
+                return
+        is_auth = scope["path"] in AUTH_PATHS
+        wait = (AUTH_LIMIT if is_auth else IP_LIMIT).acquire(client_ip(scope))
+        if wait > 0:
+            response = JSONResponse(
+                {"detail": "Too many requests"}, status_code=429, headers={"Retry-After": retry_after(wait)}
+            )
+            await response(scope, receive, send)
+            return
+        # bcrypt routes are slow by design and bounded by the hashing pool's own queue (503),
+        # so they do not feed the latency window
+        if not shedder.enabled or is_auth:
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        shedder.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            shedder.in_flight -= 1
+            shedder.observe(time.perf_counter() - started)
+
+    async def handshake(self, scope, receive, send):
+        # Sockets are long-lived, so only the upgrade is limited; messages use CHAT_LIMIT per user
+        reason = shedder.reason() if shedder.enabled else None
+        if reason is not None:
+            SHED.labels(reason).inc()
+        elif IP_LIMIT.acquire(client_ip(scope)) <= 0:
+            await self.app(scope, receive, send)
+            return
+        # Closing before accept rejects the handshake with HTTP 403
+        await WebSocketClose()(scope, receive, send)
+
+
+def stats() -> Dict[str, Dict[str, float]]:
+    return {
+        "auth": AUTH_LIMIT.stats(), "chat": CHAT_LIMIT.stats(), "ip": IP_LIMIT.stats(), "shedding": shedder.stats(),
+    }
@@ -0,0 +1,244 @@
+# BM25 passage retrieval over the FAQ data and an optional passage corpus.
+# The index is precomputed (python -m backend.retrieval build) and memory-mapped at startup:
+# term-major CSR postings (indptr / doc ids / BM25 weights) plus a UTF-8 text blob with offsets.
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from backend.data import (
+    DATA_FILE, DEFAULT_BASE_ANSWERS, DEFAULT_PROGRAM_FEE_HINTS, DEFAULT_PROGRAM_PLACEMENT_HINTS, load_faqs,
+)
+from backend.nlp import normalize
+
+INDEX_VERSION = 1
+RETRIEVAL_INDEX_DIR = os.getenv(
+    "RETRIEVAL_INDEX_DIR", os.path.join(os.path.dirname(__file__), "data", "retrieval_index")
+)
+# Extra passages, one JSON object per line: {"title": "...", "text": "..."}
+RETRIEVAL_PASSAGES = os.getenv(
+    "RETRIEVAL_PASSAGES", os.path.join(os.path.dirname(__file__), "data", "passages.jsonl")
+)
+# Classifier confidence below which /chat falls back to fuzzy matching, then retrieved passages
+# (default for tiers.FALLBACK_CONFIDENCE_THRESHOLD)
+RETRIEVAL_CONFIDENCE_THRESHOLD = float(os.getenv("RETRIEVAL_CONFIDENCE_THRESHOLD", "0.35"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "2"))
+RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "1.0"))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+FAQ_SECTIONS = {
+    "program_fee_hints": "fees",
+    "program_placement_hints": "placements",
+    "program_exam_hints": "admission exams and eligibility",
+}
+
+
+def faq_passages(faqs: Dict[str, Any]) -> Iterator[Tuple[str, str]]:
+    # Same defaults-then-overrides merge as the knowledge base
+    base_answers = {**DEFAULT_BASE_ANSWERS, **faqs.get("base_answers", {})}
+    sections = {
+        "program_fee_hints": {**DEFAULT_PROGRAM_FEE_HINTS, **faqs.get("program_fee_hints", {})},
+        "program_placement_hints": {**DEFAULT_PROGRAM_PLACEMENT_HINTS, **faqs.get("program_placement_hints", {})},
+        "program_exam_hints": faqs.get("program_exam_hints", {}),
+    }
+    for key, text in base_answers.items():
+        yield key.replace("_", " ").capitalize(), text
+    for section, topic in FAQ_SECTIONS.items():
+        for program, text in sections[section].items():
+            yield f"{program.upper()} {topic}", text
+
+
+def file_passages(path: str) -> Iterator[Tuple[str, str]]:
+    if not os.path.isfile(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            yield row.get("title", ""), row["text"]
+
+
+def default_passages() -> List[Tuple[str, str]]:
+    return list(faq_passages(load_faqs(DATA_FILE))) + list(file_passages(RETRIEVAL_PASSAGES))
+
+
+def source_hash(passages: List[Tuple[str, str]]) -> str:
+    payload = json.dumps(
+        {"index_version": INDEX_VERSION, "k1": BM25_K1, "b": BM25_B, "passages": passages},
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def build_index(passages: List[Tuple[str, str]], path: str = RETRIEVAL_INDEX_DIR) -> None:
+    """Tokenize and weight all passages, then write the index directory atomically."""
+    from sklearn.feature_extraction.text import CountVectorizer
+    docs = [normalize(f"{title} {text}") for title, text in passages]
+    # Same tokens the /chat path produces: normalize() output split on spaces
+    vec = CountVectorizer(analyzer=str.split, dtype=np.float32)
+    tf = vec.fit_transform(docs).tocsr()
+    n_docs = tf.shape[0]
+    doc_len = np.asarray(tf.sum(axis=1)).ravel()
+    avg_len = float(doc_len.mean()) if n_docs else 0.0
+    df = np.bincount(tf.indices, minlength=tf.shape[1])
+    idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+    # Precompute the full BM25 contribution of every (doc, term) pair; a query is then a sum of postings
+    norm = BM25_K1 * (1.0 - BM25_B + BM25_B * doc_len / max(avg_len, 1e-9))
+    rows = np.repeat(np.arange(n_docs), np.diff(tf.indptr))
+    tf.data = (idf[tf.indices] * tf.data * (BM25_K1 + 1.0) / (tf.data + norm[rows])).astype(np.float32)
+    postings = tf.tocsc()
+    postings.sort_indices()
+
+    texts = [f"{title}: {text}" if title else text for title, text in passages]
+    blobs = [t.encode("utf-8") for t in texts]
+    offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in blobs], out=offsets[1:])
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, "indptr.npy"), postings.indptr.astype(np.int64))
+    np.save(os.path.join(tmp, "doc_ids.npy"), postings.indices.astype(np.int32))
+    np.save(os.path.join(tmp, "weights.npy"), postings.data.astype(np.float32))
+    np.save(os.path.join(tmp, "offsets.npy"), offsets)
+    with open(os.path.join(tmp, "texts.bin"), "wb") as f:
+        f.write(b"".join(blobs) or b"\0")
+    with open(os.path.join(tmp, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump({t: int(i) for t, i in vec.vocabulary_.items()}, f, ensure_ascii=False)
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"index_version": INDEX_VERSION, "source_hash": source_hash(passages), "n_docs": n_docs}, f)
+    # Swap directories so a concurrently starting worker never sees a half-written index
+    old = f"{path}.{os.getpid()}.old"
+    if os.path.isdir(path):
+        os.replace(path, old)
+    os.replace(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+class PassageIndex:
+    """Read-only BM25 index; arrays are memory-mapped so the resident set stays small."""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("index_version") != INDEX_VERSION:
+            raise ValueError(f"unsupported index version in {path}")
+        with open(os.path.join(path, "vocab.json"), "r", encoding="utf-8") as f:
+            self.vocab: Dict[str, int] = json.load(f)
+        self.indptr = np.load(os.path.join(path, "indptr.npy"), mmap_mode="r")
+        self.doc_ids = np.load(os.path.join(path, "doc_ids.npy"), mmap_mode="r")
+        self.weights = np.load(os.path.join(path, "weights.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.texts = np.memmap(os.path.join(path, "texts.bin"), dtype=np.uint8, mode="r")
+        self.n_docs = int(self.meta["n_docs"])
+        self.version: str = self.meta["source_hash"]
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+    def text(self, doc: int) -> str:
+        return bytes(self.texts[self.offsets[doc]:self.offsets[doc + 1]]).decode("utf-8")
+
+    def search(self, query: str, k: int = RETRIEVAL_TOP_K) -> List[Tuple[int, float]]:
+        """Top-k (doc, score) for an already normalized query, best first."""
+        terms = {self.vocab[t] for t in query.split() if t in self.vocab}
+        if not terms or k <= 0:
+            return []
+        # Only the postings of the query terms are read from the memory map
+        spans = [(self.indptr[t], self.indptr[t + 1]) for t in terms]
+        docs = np.concatenate([self.doc_ids[a:b] for a, b in spans])
+        weights = np.concatenate([self.weights[a:b] for a, b in spans])
+        # Dense accumulation (one float per passage) avoids sorting the postings
+        scores = np.bincount(docs, weights=weights, minlength=self.n_docs)
+        hit = np.flatnonzero(scores)
+        if len(hit) > k:
+            hit = hit[np.argpartition(-scores[hit], k - 1)[:k]]
+        hit = hit[np.argsort(-scores[hit], kind="stable")]
+        return [(int(d), float(scores[d])) for d in hit]
+
+    def lookup(self, query: str, k: int = RETRIEVAL_TOP_K, min_score: float = RETRIEVAL_MIN_SCORE) -> List[str]:
+        return [self.text(doc) for doc, score in self.search(query, k) if score >= min_score]
+
+
+def load_index(path: str = RETRIEVAL_INDEX_DIR) -> Optional[PassageIndex]:
+    try:
+        return PassageIndex(path)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def load_or_build(passages: Optional[List[Tuple[str, str]]] = None, path: str = RETRIEVAL_INDEX_DIR) -> Optional[PassageIndex]:
+    if passages is None:
+        passages = default_passages()
+    index = load_index(path)
+    if index is not None and index.version == source_hash(passages):
+        return index
+    try:
+        build_index(passages, path)
+    except OSError:
+        return index  # read-only deployments keep serving whatever index was shipped
+    return PassageIndex(path)
+
+
+class Passages:
+    """The passage index for one knowledge-base snapshot, loaded (or rebuilt when stale) on first use.
+
+    Each snapshot carries its own, so a hot reload swaps answers and passages together.
+    """
+
+    def __init__(self, passages: List[Tuple[str, str]], path: str = RETRIEVAL_INDEX_DIR):
+        self.passages = passages
+        self.path = path
+        self._index: Optional[PassageIndex] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def index(self) -> Optional[PassageIndex]:
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._index = load_or_build(self.passages, self.path)
+                    self._loaded = True
+        return self._index
+
+
+def main(argv: Optional[Iterable[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build or query the FAQ passage index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="index data/faqs.json and the passages file")
+    build.add_argument("--passages", default=RETRIEVAL_PASSAGES, help="JSONL passages (default: %(default)s)")
+    build.add_argument("--output", default=RETRIEVAL_INDEX_DIR, help="index directory (default: %(default)s)")
+    query = sub.add_parser("query", help="print the top passages for a question")
+    query.add_argument("text")
+    query.add_argument("-k", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        started = time.perf_counter()
+        passages = list(faq_passages(load_faqs(DATA_FILE))) + list(file_passages(args.passages))
+        build_index(passages, args.output)
+        elapsed = time.perf_counter() - started
+        print(f"wrote {args.output} ({len(passages)} passages) in {elapsed:.2f}s")
+        return 0
+
+    index = load_or_build()
+    if index is None:
+        print("no passage index available", file=sys.stderr)
+        return 1
+    for doc, score in index.search(normalize(args.text), args.k):
+        print(f"{score:6.2f}  {index.text(doc)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
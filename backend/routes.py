@@ -1,48 +1,367 @@
-from typing import List, Dict, Any
-from fastapi import APIRouter, Depends
-from .schemas import ChatRequest, ChatResponse
-from .nlp import normalize
-from .model import vectorizer, clf
-from .answers import build_answer
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+import json
+import os
+import time
+from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from .schemas import ChatRequest, ChatResponse, ChatBatchRequest, ChatBatchResponse
+from .nlp import normalize, extract_entities, mentioned
+from . import model
+from .model import Scores, predict_proba_batch
+from .knowledge import KnowledgeBase, knowledge
+from .cache import make_cache
+from .inference import top_k
+from .data import OFFICIAL_LINK
+from . import tiers
+from .tiers import EXACT_MATCH_ENABLED, FALLBACK_CONFIDENCE_THRESHOLD, RESOLVED_BY
+from .sessions import Context, NO_CONTEXT, sessions
+from .chatlog import chatlog
+from . import ratelimit
+from .ratelimit import CHAT_LIMIT, enforce
 from .auth_router import get_current_user
+from .auth import password_hasher
 from .db_models import User
+from .batching import MicroBatcher, CHAT_BATCH_MAX_SIZE, CHAT_BATCH_MAX_WAIT_MS
+from .metrics import (
+    METRICS_ENABLED, STAGE, INTENTS, CONFIDENCE, CACHE_HIT, CACHE_MISS, GaugeFunc, registry,
+)
+
+# Classifier probability an intent beyond the first needs to be answered too
+SECONDARY_INTENT_THRESHOLD = float(os.getenv("SECONDARY_INTENT_THRESHOLD", "0.25"))
+
+# Upper bound on messages accepted by a single POST /chat/batch
+CHAT_BATCH_MAX_MESSAGES = int(os.getenv("CHAT_BATCH_MAX_MESSAGES", "64"))
+
+# Answers keyed by normalized text; RESPONSE_CACHE_URL=redis://... shares them across workers
+RESPONSE_CACHE_MAX_SIZE = int(os.getenv("RESPONSE_CACHE_MAX_SIZE", "4096"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL", "")
 
 router = APIRouter()
 
+response_cache = make_cache(RESPONSE_CACHE_URL, RESPONSE_CACHE_MAX_SIZE, RESPONSE_CACHE_TTL_SECONDS, "chat:")
+
+# Concurrent /chat and /chat/batch requests share one vectorized predict_proba call
+batcher = MicroBatcher(lambda texts: predict_proba_batch(texts).rows(), CHAT_BATCH_MAX_SIZE, CHAT_BATCH_MAX_WAIT_MS)
+
+registry.register(GaugeFunc("chat_response_cache_entries", "Entries in the response cache.", lambda: len(response_cache)))
+registry.register(GaugeFunc("chat_batcher_pending", "Messages waiting for the next model call.", lambda: batcher.pending))
+registry.register(GaugeFunc("chat_sessions_active", "Conversation sessions held in memory.", lambda: len(sessions)))
+
 @router.get("/health")
 def health() -> Dict[str, Any]:
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "password_hashing": password_hasher.stats(),
+        "response_cache": response_cache.stats(),
+        "passages": len(knowledge.current.passages.index() or ()),
+        "knowledge_base": knowledge.stats(),
+        "model": model.stats(),
+        "sessions": sessions.stats(),
+        "chat_log": chatlog.stats(),
+        "rate_limits": ratelimit.stats(),
+        "tiers": tiers.stats(),
+    }
 
-@router.post("/chat", response_model=ChatResponse)
-async def chat(req: ChatRequest, current_user: User = Depends(get_current_user)) -> ChatResponse:
-    text = normalize(req.message)
-    vec = vectorizer.transform([text])
-    proba = clf.predict_proba(vec)[0]
-    classes = clf.classes_
-    # Primary intent (highest probability)
-    order = proba.argsort()[::-1]
-    best_idx = int(order[0])
-    intent = classes[best_idx]
-    confidence = float(proba[best_idx])
-
-    # Select multiple intents (top-3 above threshold)
-    selected: List[str] = []
-    for idx in order[:3]:
-        if float(proba[idx]) >= 0.25:  # threshold for additional intents
-            selected.append(classes[int(idx)])
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(registry.expose(), media_type="text/plain; version=0.0.4")
+
+def warmup(messages: Optional[List[str]] = None) -> None:
+    """Run messages (default: the training texts) through the full pipeline without caching them.
+
+    Loads the model and the passage index and fills the lemma cache, so the first real request
+    does not pay for it; a pre-fork parent does this once and every worker shares the result.
+    """
+    if messages is None:
+        messages = [text for text, _ in model.TRAIN_DATA]
+    kb = knowledge.current
+    kb.passages.index()
+    texts = [normalize(m) for m in messages]
+    for text, scores in zip(texts, predict_proba_batch(texts).rows()):
+        compose_response(text, scores, kb)
+
+def timed_normalize(message: str) -> str:
+    started = time.perf_counter()
+    text = normalize(message)
+    STAGE["normalize"].observe(time.perf_counter() - started)
+    return text
+
+def record_answer(intent: str, confidence: float) -> None:
+    INTENTS.labels(intent).inc()
+    CONFIDENCE.observe(confidence)
+
+# (primary intent, confidence, all answered intents, FAQ passages when retrieval answers, tier that answered)
+Resolution = Tuple[str, float, List[str], Optional[List[str]], str]
+
+def match_known(text: str, kb: KnowledgeBase) -> Optional[Resolution]:
+    """Exact tier: the intent of a known question with the same words, without calling the model."""
+    if not EXACT_MATCH_ENABLED:
+        return None
+    started = time.perf_counter()
+    intent = kb.questions.match(text)
+    tiers.SECONDS["exact"].observe(time.perf_counter() - started)
+    return (intent, 1.0, [intent], None, "exact") if intent is not None else None
+
+def rank_intents(scores: Scores) -> Tuple[str, float, List[str]]:
+    """Primary intent, its confidence, and every top-3 intent at or above SECONDARY_INTENT_THRESHOLD."""
+    proba, classes = scores.proba, scores.classes
+    # Top-3 candidates, best first; the first is the primary intent
+    order = top_k(proba, 3)
+    intent = str(classes[order[0]])
+    selected = [str(classes[idx]) for idx in order if float(proba[idx]) >= SECONDARY_INTENT_THRESHOLD]
     if intent not in selected:
         selected.insert(0, intent)
+    return intent, float(proba[order[0]]), selected
+
+def match_fuzzy(text: str, kb: KnowledgeBase) -> Optional[Resolution]:
+    """Fuzzy tier: correct misspelled words against the known questions, then match or classify again."""
+    corrected = kb.questions.correct(text)
+    if corrected is None:
+        return None
+    intent = kb.questions.match(corrected)
+    if intent is not None:
+        return intent, 1.0, [intent], None, "fuzzy"
+    # One unbatched model call; only low-confidence messages with a correctable word get here
+    intent, confidence, selected = rank_intents(predict_proba_batch([corrected]).rows()[0])
+    return (intent, confidence, selected, None, "fuzzy") if confidence >= FALLBACK_CONFIDENCE_THRESHOLD else None
+
+def classify(text: str, scores: Scores, kb: KnowledgeBase, context: Context = NO_CONTEXT) -> Resolution:
+    """Classifier tier, falling back to the fuzzy tier and then retrieval when it is unsure."""
+    intent, confidence, selected = rank_intents(scores)
+    if confidence >= FALLBACK_CONFIDENCE_THRESHOLD:
+        return intent, confidence, selected, None, "classifier"
+
+    started = time.perf_counter()
+    resolved = match_fuzzy(text, kb)
+    tiers.SECONDS["fuzzy"].observe(time.perf_counter() - started)
+    if resolved is not None:
+        return resolved
+    # Otherwise the closest FAQ passages answer, when any match well enough
+    passage_index = kb.passages.index()
+    if passage_index is not None:
+        started = time.perf_counter()
+        passages = passage_index.lookup(f"{text} {context[0]}" if context[0] else text)
+        elapsed = time.perf_counter() - started
+        STAGE["retrieval"].observe(elapsed)
+        tiers.SECONDS["retrieval"].observe(elapsed)
+        if passages:
+            return "faq_search", confidence, ["faq_search"], ["Here is what I found:", *passages, OFFICIAL_LINK], "retrieval"
+    return intent, confidence, selected, None, "unresolved"
 
-    # Build combined answer
-    parts: List[str] = []
-    seen = set()
-    for it in selected:
-        if it in seen:
+def answer_entities(text: str, context: Context, ents: Optional[Dict[str, Any]] = None) -> Tuple[List[str], List[str]]:
+    """Every program and hostel gender the message names, extracted once for all selected intents
+    (``ents`` when the caller already has them).
+
+    Carried entities from the conversation stand in when the message names none.
+    """
+    if ents is None:
+        ents = extract_entities(text)
+    programs = mentioned(ents["programs"]) or ([context[0]] if context[0] else [])
+    genders = mentioned(ents["hostel_genders"]) or ([context[1]] if context[1] else [])
+    return programs, genders
+
+def answer_parts(
+    text: str, resolved: Resolution, kb: KnowledgeBase, context: Context = NO_CONTEXT,
+    ents: Optional[Dict[str, Any]] = None,
+) -> Iterator[str]:
+    """A lazy iterator over the answer paragraphs, so streaming clients get the intent and
+    confidence before any answer text is built. ``context`` holds the program / hostel
+    gender carried over from the conversation.
+    """
+    passages, selected = resolved[3], resolved[2]
+    if passages is not None:
+        yield from passages
+        return
+    started = time.perf_counter()
+    parts = kb.answers.answer_parts(selected, *answer_entities(text, context, ents))
+    STAGE["build_answer"].observe(time.perf_counter() - started)
+    yield from parts
+
+def render_response(
+    text: str, resolved: Resolution, kb: KnowledgeBase, context: Context = NO_CONTEXT,
+    ents: Optional[Dict[str, Any]] = None,
+) -> ChatResponse:
+    intent, confidence, intents, passages, _ = resolved
+    if passages is not None:
+        answer = "\n\n".join(passages)
+    else:
+        # Single-intent answers come pre-rendered with the official link from the snapshot's table
+        started = time.perf_counter()
+        answer = kb.answers.answer(intents, *answer_entities(text, context, ents))
+        STAGE["build_answer"].observe(time.perf_counter() - started)
+    return ChatResponse(intent=intent, answer=answer, confidence=confidence, intents=intents)
+
+def compose_response(text: str, scores: Scores, kb: KnowledgeBase, context: Context = NO_CONTEXT) -> ChatResponse:
+    return render_response(text, classify(text, scores, kb, context), kb, context)
+
+def cache_key(text: str, kb: KnowledgeBase, context: Context = NO_CONTEXT, version: Optional[str] = None) -> str:
+    # Model and answer-table versions are part of the key, so retraining or new FAQ data
+    # makes old entries unreachable (they age out of the LRU) even in a shared backend.
+    # Answers are stored under the version of the model that scored them (Scores.version)
+    passage_index = kb.passages.index()
+    index_version = passage_index.version[:8] if passage_index is not None else "-"
+    key = f"{(version or model.MODEL_VERSION)[:16]}:{kb.version[:16]}:{index_version}:{text}"
+    if context != NO_CONTEXT:
+        # Carried entities change the answer; stateless messages keep sharing one entry
+        key += f"|{context[0] or ''}|{context[1] or ''}"
+    return key
+
+async def answer_texts(
+    texts: List[str], contexts: Optional[List[Context]] = None, ents: Optional[List[Optional[Dict[str, Any]]]] = None,
+) -> List[ChatResponse]:
+    # Cache hits skip vectorization and classification; misses are classified together.
+    # One knowledge-base snapshot serves the whole request, even if a reload lands meanwhile.
+    # ``ents`` are the messages' entities when the caller already extracted them.
+    kb = knowledge.current
+    if contexts is None:
+        contexts = [NO_CONTEXT] * len(texts)
+    if ents is None:
+        ents = [None] * len(texts)
+    responses: List[Any] = [None] * len(texts)
+    missing: List[int] = []
+    for i, text in enumerate(texts):
+        key = cache_key(text, kb, contexts[i])
+        cached = response_cache.get(key)
+        if cached is not None:
+            CACHE_HIT.inc()
+            RESOLVED_BY["cache"].inc()
+            responses[i] = ChatResponse(**cached)
+            continue
+        CACHE_MISS.inc()
+        resolved = match_known(text, kb)
+        if resolved is None:
+            missing.append(i)
             continue
-        seen.add(it)
-        parts.append(build_answer(it, text))
+        RESOLVED_BY["exact"].inc()
+        responses[i] = render_response(text, resolved, kb, contexts[i], ents[i])
+        response_cache.set(key, responses[i].model_dump())
+    if missing:
+        started = time.perf_counter()
+        scored = await batcher.submit_many([texts[i] for i in missing])
+        # Every message in the model call waited for all of it
+        waited = time.perf_counter() - started
+        for i, scores in zip(missing, scored):
+            tiers.SECONDS["classifier"].observe(waited)
+            resolved = classify(texts[i], scores, kb, contexts[i])
+            RESOLVED_BY[resolved[4]].inc()
+            responses[i] = render_response(texts[i], resolved, kb, contexts[i], ents[i])
+            response_cache.set(cache_key(texts[i], kb, contexts[i], scores.version), responses[i].model_dump())
+    for response in responses:
+        record_answer(response.intent, response.confidence)
+    return responses
+
+def log_answer(user_id: Optional[int], endpoint: str, text: str, response: ChatResponse, latency: float) -> None:
+    chatlog.record(
+        user_id, endpoint, text, response.intent, response.confidence, response.intents or [response.intent], latency
+    )
+
+def conversation_context(user_id: int, text: str) -> Tuple[Context, Context, Dict[str, Any]]:
+    """(entities to carry into this message, entities to remember after it, the message's own entities)."""
+    ents = extract_entities(text)
+    context = sessions.context(user_id, ents)
+    return context, (ents["program"] or context[0], ents["hostel_gender"] or context[1]), ents
+
+async def answer_message(user_id: int, message: str, endpoint: str) -> ChatResponse:
+    """One conversational turn: context from the user's session in, the answer recorded and logged."""
+    started = time.perf_counter()
+    text = timed_normalize(message)
+    context, remembered, ents = conversation_context(user_id, text)
+    response = (await answer_texts([text], [context], [ents]))[0]
+    sessions.record(user_id, response.intent, *remembered)
+    log_answer(user_id, endpoint, text, response, time.perf_counter() - started)
+    return response
+
+@router.post("/chat", response_model=ChatResponse)
+async def chat(req: ChatRequest, current_user: User = Depends(get_current_user)) -> ChatResponse:
+    enforce(CHAT_LIMIT, current_user.id)
+    return await answer_message(current_user.id, req.message, "chat")
+
+@router.get("/chat/session")
+async def chat_session(current_user: User = Depends(get_current_user)) -> Dict[str, Any]:
+    # Recent turns, oldest first, as [unix seconds, intent, program, hostel gender]
+    return {"turns": sessions.history(current_user.id)}
+
+@router.delete("/chat/session", status_code=204)
+async def clear_chat_session(current_user: User = Depends(get_current_user)) -> Response:
+    sessions.clear(current_user.id)
+    return Response(status_code=204)
+
+@router.post("/chat/batch", response_model=ChatBatchResponse)
+async def chat_batch(req: ChatBatchRequest, current_user: User = Depends(get_current_user)) -> ChatBatchResponse:
+    if len(req.messages) > CHAT_BATCH_MAX_MESSAGES:
+        raise HTTPException(status_code=413, detail=f"At most {CHAT_BATCH_MAX_MESSAGES} messages per batch")
+    if not req.messages:
+        return ChatBatchResponse(responses=[])
+    # Each message costs one token, so batching does not bypass the per-user limit;
+    # a batch larger than the chat burst could never be admitted and gets 413
+    enforce(CHAT_LIMIT, current_user.id, len(req.messages))
+    started = time.perf_counter()
+    texts = [timed_normalize(m) for m in req.messages]
+    responses = await answer_texts(texts)
+    # Messages in a batch share one latency: the time to answer all of them
+    latency = time.perf_counter() - started
+    for text, response in zip(texts, responses):
+        log_answer(current_user.id, "batch", text, response, latency)
+    return ChatBatchResponse(responses=responses)
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream_answer(text: str, user_id: Optional[int] = None) -> AsyncIterator[str]:
+    # meta (intent, confidence) -> one part per answer paragraph -> done (full answer)
+    started = time.perf_counter()
+    kb = knowledge.current
+    if user_id is not None:
+        context, remembered, ents = conversation_context(user_id, text)
+    else:
+        context, remembered, ents = NO_CONTEXT, NO_CONTEXT, None
+    key = cache_key(text, kb, context)
+    cached = response_cache.get(key)
+    if cached is not None:
+        CACHE_HIT.inc()
+        RESOLVED_BY["cache"].inc()
+        record_answer(cached["intent"], cached["confidence"])
+        if user_id is not None:
+            sessions.record(user_id, cached["intent"], *remembered)
+        yield sse_event("meta", {"intent": cached["intent"], "confidence": cached["confidence"]})
+        for part in cached["answer"].split("\n\n"):
+            yield sse_event("part", {"text": part})
+        yield sse_event("done", cached)
+        log_answer(user_id, "stream", text, ChatResponse(**cached), time.perf_counter() - started)
+        return
+    CACHE_MISS.inc()
+    resolved = match_known(text, kb)
+    if resolved is None:
+        waiting = time.perf_counter()
+        scores = await batcher.submit(text)
+        tiers.SECONDS["classifier"].observe(time.perf_counter() - waiting)
+        resolved = classify(text, scores, kb, context)
+        key = cache_key(text, kb, context, scores.version)
+    RESOLVED_BY[resolved[4]].inc()
+    intent, confidence, intents = resolved[:3]
+    parts = answer_parts(text, resolved, kb, context, ents)
+    record_answer(intent, confidence)
+    if user_id is not None:
+        sessions.record(user_id, intent, *remembered)
+    yield sse_event("meta", {"intent": intent, "confidence": confidence})
+    built: List[str] = []
+    for part in parts:
+        built.append(part)
+        yield sse_event("part", {"text": part})
+    response = ChatResponse(intent=intent, answer="\n\n".join(built), confidence=confidence, intents=intents)
+    response_cache.set(key, response.model_dump())
+    yield sse_event("done", response.model_dump())
+    log_answer(user_id, "stream", text, response, time.perf_counter() - started)
 
-    answer = "\n\n".join(parts)
-    # Append official university link once
-    answer_with_link = f"{answer}\n\nFor official details, visit: https://www.iul.ac.in"
-    return ChatResponse(intent=intent, answer=answer_with_link, confidence=confidence)
\ No newline at end of file
+@router.post("/chat/stream")
+async def chat_stream(req: ChatRequest, current_user: User = Depends(get_current_user)) -> StreamingResponse:
+    enforce(CHAT_LIMIT, current_user.id)
+    return StreamingResponse(
+        stream_answer(timed_normalize(req.message), current_user.id),
+        media_type="text/event-stream",
+        # Disable proxy buffering (nginx) so each event reaches the client as soon as it is written
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
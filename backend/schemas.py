@@ -1,3 +1,4 @@
+from typing import List
 from pydantic import BaseModel
 
 class ChatRequest(BaseModel):
@@ -6,4 +7,12 @@ class ChatRequest(BaseModel):
 class ChatResponse(BaseModel):
     intent: str
     answer: str
-    confidence: float
\ No newline at end of file
+    confidence: float
+    # Every intent the answer covers, primary first
+    intents: List[str] = []
+
+class ChatBatchRequest(BaseModel):
+    messages: List[str]
+
+class ChatBatchResponse(BaseModel):
+    responses: List[ChatResponse]
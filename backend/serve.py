@@ -0,0 +1,153 @@
+# Pre-fork production launcher (Linux/macOS): the parent imports the app, loads the model, WordNet,
+# the knowledge base and the passage index once, then forks workers that share those pages copy-on-write.
+# Run: python -m backend.serve [--workers N] [--host 0.0.0.0] [--port 8000]
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict, List, Optional
+
+import uvicorn
+
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", str(os.cpu_count() or 1)))
+# Seconds between per-worker memory reports; 0 prints one report after startup only
+SERVE_MEMORY_REPORT_SECONDS = float(os.getenv("SERVE_MEMORY_REPORT_SECONDS", "0"))
+SERVE_GRACEFUL_TIMEOUT_SECONDS = float(os.getenv("SERVE_GRACEFUL_TIMEOUT_SECONDS", "30"))
+
+
+def preload():
+    from backend.app import app
+    from backend.database import engine
+    from backend.migrate import AUTO_MIGRATE, migrate
+    # Migrate once here; workers starting together would otherwise race on CREATE TABLE
+    if AUTO_MIGRATE:
+        migrate()
+    engine.dispose()
+    from backend.routes import warmup
+    warmup()
+    # Move everything loaded so far into the permanent generation: the collector never walks
+    # (and so never writes to) these objects again, which keeps their pages shared after fork
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+def bind(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket, log_level: str) -> None:
+    # The parent already migrated and warmed up; connections it opened must not be shared with the children
+    import backend.app
+    from backend.database import engine, async_engine
+    backend.app.AUTO_MIGRATE = False
+    backend.app.WARMUP_ON_STARTUP = False
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    config = uvicorn.Config(app, log_level=log_level, lifespan="on")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def spawn(app, sock: socket.socket, log_level: str) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(app, sock, log_level)
+        except BaseException:
+            code = 1
+            import traceback
+            traceback.print_exc()
+        finally:
+            os._exit(code)
+    return pid
+
+
+def memory_report(pids: List[int]) -> str:
+    from backend.metrics import process_memory
+    mb = 1024 * 1024
+    rows = [f"{'process':>12} {'rss MB':>8} {'pss MB':>8} {'shared MB':>10} {'private MB':>11}"]
+    for label, pid in [("parent", os.getpid())] + [(f"worker {pid}", pid) for pid in pids]:
+        m = process_memory(pid)
+        if not m:
+            continue
+        shared = m.get("shared_clean", 0) + m.get("shared_dirty", 0)
+        private = m.get("private_clean", 0) + m.get("private_dirty", 0)
+        rows.append(f"{label:>12} {m['rss'] / mb:8.1f} {m['pss'] / mb:8.1f} {shared / mb:10.1f} {private / mb:11.1f}")
+    return "\n".join(rows)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve the API from pre-forked workers that share the loaded model.")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+    if not hasattr(os, "fork"):
+        print("backend.serve needs fork(); use uvicorn --workers on this platform", file=sys.stderr)
+        return 2
+
+    started = time.perf_counter()
+    app = preload()
+    sock = bind(args.host, args.port)
+    print(f"preloaded in {time.perf_counter() - started:.2f}s; serving on {args.host}:{args.port} "
+          f"with {args.workers} workers", flush=True)
+
+    workers: Dict[int, float] = {}
+    stopping: Optional[float] = None
+
+    def stop(signum, frame):
+        nonlocal stopping
+        if stopping is None:
+            stopping = time.monotonic()
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(max(1, args.workers)):
+        workers[spawn(app, sock, args.log_level)] = time.monotonic()
+
+    next_report = time.monotonic() + 5.0
+    while workers:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            born = workers.pop(pid, None)
+            if stopping is None and born is not None:
+                # Back off if workers die right after starting (e.g. a startup error) instead of fork-looping
+                if time.monotonic() - born < 1.0:
+                    time.sleep(1.0)
+                print(f"worker {pid} exited with status {status}; restarting", file=sys.stderr, flush=True)
+                workers[spawn(app, sock, args.log_level)] = time.monotonic()
+            continue
+        if stopping is not None and time.monotonic() - stopping > SERVE_GRACEFUL_TIMEOUT_SECONDS:
+            for pid in workers:
+                os.kill(pid, signal.SIGKILL)
+        if stopping is None and next_report and time.monotonic() >= next_report:
+            print(memory_report(list(workers)), flush=True)
+            next_report = time.monotonic() + SERVE_MEMORY_REPORT_SECONDS if SERVE_MEMORY_REPORT_SECONDS > 0 else 0
+        time.sleep(0.2)
+    sock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
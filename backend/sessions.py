@@ -0,0 +1,243 @@
+# Per-user conversation sessions: recent turns and the program / hostel gender carried between messages.
+# Each turn is packed into one 64-bit integer in a fixed-size array, so a session costs a few hundred
+# bytes however long the conversation runs; SESSION_MAX_COUNT bounds the total.
+import asyncio
+import json
+import logging
+import os
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SESSION_TURNS = int(os.getenv("SESSION_TURNS", "8"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "50000"))
+# Write changed sessions to the chat_sessions table every N seconds; 0 keeps sessions in memory only
+SESSION_PERSIST_INTERVAL_SECONDS = float(os.getenv("SESSION_PERSIST_INTERVAL_SECONDS", "0"))
+
+# (carried program, carried hostel gender): entities from earlier turns that the current message lacks
+Context = Tuple[Optional[str], Optional[str]]
+NO_CONTEXT: Context = (None, None)
+
+# Turn layout: | unix seconds (32) | intent (16) | program (12) | gender (4) |
+_INTENT_SHIFT, _PROGRAM_SHIFT, _TIME_SHIFT = 16, 4, 32
+
+
+class Codebook:
+    """Interns strings as small integers; 0 stands for None."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.values: List[Optional[str]] = [None]
+        self.codes: Dict[str, int] = {}
+
+    def code(self, value: Optional[str]) -> int:
+        if value is None:
+            return 0
+        code = self.codes.get(value)
+        if code is None:
+            if len(self.values) >= self.limit:
+                return 0  # vocabulary full: the value is simply not carried
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+INTENTS = Codebook(1 << 16)
+PROGRAMS = Codebook(1 << 12)
+GENDERS = Codebook(1 << 4)
+
+
+class Session:
+    __slots__ = ("turns", "head", "count", "program", "gender", "last_seen")
+
+    def __init__(self, size: int):
+        self.turns = array("Q", bytes(8 * size))
+        self.head = 0  # next slot to write
+        self.count = 0
+        self.program = 0
+        self.gender = 0
+        self.last_seen = 0.0
+
+    def add(self, now: float, intent: int, program: int, gender: int) -> None:
+        self.turns[self.head] = (
+            (int(now) & 0xFFFFFFFF) << _TIME_SHIFT | intent << _INTENT_SHIFT | program << _PROGRAM_SHIFT | gender
+        )
+        self.head = (self.head + 1) % len(self.turns)
+        self.count = min(self.count + 1, len(self.turns))
+        if program:
+            self.program = program
+        if gender:
+            self.gender = gender
+        self.last_seen = now
+
+    def history(self) -> List[List[Any]]:
+        """Turns oldest first as [timestamp, intent, program, gender]."""
+        size = len(self.turns)
+        out = []
+        for i in range(self.head - self.count, self.head):
+            packed = self.turns[i % size]
+            out.append([
+                packed >> _TIME_SHIFT,
+                INTENTS.values[(packed >> _INTENT_SHIFT) & 0xFFFF],
+                PROGRAMS.values[(packed >> _PROGRAM_SHIFT) & 0xFFF],
+                GENDERS.values[packed & 0xF],
+            ])
+        return out
+
+
+class SessionStore:
+    """LRU of sessions keyed by user id, with idle expiry.
+
+    Used only from the event loop thread, so no locking is needed. Changed sessions are
+    collected in ``_dirty`` and written in one transaction per ``flush``; when ``persisted``,
+    sessions evicted before their turns were written wait in ``_evicted`` for that flush.
+    """
+
+    def __init__(self, turns: int, ttl: float, max_count: int, persisted: bool = SESSION_PERSIST_INTERVAL_SECONDS > 0):
+        self.size = max(1, turns)
+        self.ttl = ttl
+        self.max_count = max_count
+        self.persisted = persisted
+        self._sessions: "OrderedDict[int, Session]" = OrderedDict()
+        self._dirty: set = set()
+        self._evicted: Dict[int, Session] = {}
+        self.evictions = 0
+        self.expirations = 0
+        self.flushes = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _get(self, user_id: int, now: float) -> Optional[Session]:
+        session = self._sessions.get(user_id)
+        if session is None:
+            return None
+        if self.ttl > 0 and now - session.last_seen > self.ttl:
+            del self._sessions[user_id]
+            self.expirations += 1
+            return None
+        return session
+
+    def context(self, user_id: int, ents: Dict[str, Any]) -> Context:
+        """Entities to carry into this message: only those it does not mention itself."""
+        session = self._get(user_id, time.time())
+        if session is None:
+            return NO_CONTEXT
+        program = None if ents.get("program") else PROGRAMS.values[session.program]
+        gender = None if ents.get("hostel_gender") else GENDERS.values[session.gender]
+        return program, gender
+
+    def record(self, user_id: int, intent: str, program: Optional[str], gender: Optional[str]) -> None:
+        if self.max_count <= 0:
+            return
+        now = time.time()
+        session = self._get(user_id, now)
+        if session is None:
+            # A user back before their evicted session was written picks it up again
+            session = self._sessions[user_id] = self._evicted.pop(user_id, None) or Session(self.size)
+            while len(self._sessions) > self.max_count:
+                evicted, old = self._sessions.popitem(last=False)
+                if self.persisted and evicted in self._dirty:
+                    self._evicted[evicted] = old
+                else:
+                    self._dirty.discard(evicted)
+                self.evictions += 1
+        else:
+            self._sessions.move_to_end(user_id)
+        session.add(now, INTENTS.code(intent), PROGRAMS.code(program), GENDERS.code(gender))
+        self._dirty.add(user_id)
+
+    def history(self, user_id: int) -> List[List[Any]]:
+        session = self._get(user_id, time.time())
+        return session.history() if session is not None else []
+
+    def clear(self, user_id: int) -> None:
+        if self._sessions.pop(user_id, None) is not None or self._evicted.pop(user_id, None) is not None:
+            self._dirty.add(user_id)
+
+    def sweep(self) -> None:
+        # Least recently used first, so expired sessions sit at the front
+        if self.ttl <= 0:
+            return
+        cutoff = time.time() - self.ttl
+        while self._sessions:
+            user_id, session = next(iter(self._sessions.items()))
+            if session.last_seen >= cutoff:
+                break
+            del self._sessions[user_id]
+            self.expirations += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self._sessions),
+            "dirty": len(self._dirty),
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "flushes": self.flushes,
+        }
+
+    async def flush(self) -> int:
+        """Write every session changed since the last flush in one transaction; returns the row count."""
+        if not self._dirty:
+            return 0
+        from sqlalchemy import delete, insert
+        from .database import AsyncSessionLocal
+        from .db_models import ChatSession
+        users, self._dirty = list(self._dirty), set()
+        evicted, self._evicted = self._evicted, {}
+        rows = []
+        for user_id in users:
+            session = self._sessions.get(user_id) or evicted.get(user_id)
+            if session is not None:
+                rows.append({"user_id": user_id, "turns": json.dumps(session.history()), "updated_at": session.last_seen})
+        try:
+            async with AsyncSessionLocal() as db:
+                # Delete + insert is a portable upsert; cleared sessions are only deleted
+                await db.execute(delete(ChatSession).where(ChatSession.user_id.in_(users)))
+                if rows:
+                    await db.execute(insert(ChatSession), rows)
+                await db.commit()
+        except Exception:
+            self._dirty.update(users)  # retry on the next tick
+            self._evicted = {**{u: e for u, e in evicted.items() if u not in self._sessions}, **self._evicted}
+            raise
+        self.flushes += 1
+        return len(rows)
+
+    async def restore(self) -> int:
+        """Load sessions still within the TTL, most recent last, up to ``max_count``."""
+        from sqlalchemy import select
+        from .database import AsyncSessionLocal
+        from .db_models import ChatSession
+        cutoff = time.time() - self.ttl if self.ttl > 0 else 0.0
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(ChatSession.user_id, ChatSession.turns)
+                .where(ChatSession.updated_at >= cutoff)
+                .order_by(ChatSession.updated_at.desc())
+                .limit(self.max_count)
+            )
+            rows = result.all()
+        for user_id, turns in reversed(rows):
+            session = Session(self.size)
+            for at, intent, program, gender in json.loads(turns)[-self.size:]:
+                session.add(at, INTENTS.code(intent), PROGRAMS.code(program), GENDERS.code(gender))
+            self._sessions[user_id] = session
+            self._sessions.move_to_end(user_id)
+        return len(rows)
+
+    async def persist(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            self.sweep()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("could not persist chat sessions; will retry")
+
+
+sessions = SessionStore(SESSION_TURNS, SESSION_TTL_SECONDS, SESSION_MAX_COUNT)
@@ -15,7 +15,8 @@ except Exception as e:
 
 # Ensure DB tables exist
 try:
-    Base.metadata.create_all(bind=engine)
+    from backend.migrate import migrate
+    migrate()
 except Exception as e:
     print(f"DB_INIT_FAIL: {e}")
     sys.exit(1)
@@ -40,6 +41,33 @@ except Exception as e:
     print(f"NLP_FAIL: {e}")
     sys.exit(1)
 
+# normalize() output is unchanged on the golden corpus
+try:
+    import json
+    import os
+    golden_path = os.path.join(os.path.dirname(nlp.__file__), "data", "normalize_golden.json")
+    with open(golden_path, "r", encoding="utf-8") as f:
+        golden = json.load(f)
+    mismatches = [raw for raw, expected in golden if nlp.normalize(raw, transliterate=False) != expected]
+    assert not mismatches, mismatches[:5]
+    print("NORMALIZE_GOLDEN_OK", len(golden))
+except Exception as e:
+    print(f"NORMALIZE_GOLDEN_FAIL: {e}")
+    sys.exit(1)
+
+# Transliteration: Devanagari words come out in Hinglish spelling and reach the Latin mappings
+try:
+    from backend.translit import to_latin
+    assert to_latin("शुल्क लड़कों कितनी ज्ञान") == "shulk ladkon kitni gyan"
+    assert to_latin("btech fees") == "btech fees"
+    # Without it, Devanagari words missing from HI_MAP_PATTERNS are dropped
+    assert nlp.normalize("लड़कियों का शुल्क", transliterate=False) == "fee"
+    assert nlp.normalize("लड़कियों का शुल्क", transliterate=True) == "girl ka fee"
+    print("TRANSLIT_OK")
+except Exception as e:
+    print(f"TRANSLIT_FAIL: {e!r}")
+    sys.exit(1)
+
 # Model vectorize and predict
 try:
     vec = model.vectorizer.transform([nlp.normalize("btech fees")])
@@ -50,16 +78,238 @@ except Exception as e:
     print(f"MODEL_FAIL: {e}")
     sys.exit(1)
 
+# Model artifact matches the current training data
+try:
+    artifact = model.load_artifact()
+    assert artifact is not None and artifact["train_hash"] == model.MODEL_VERSION
+    assert artifact["classes"] == [str(c) for c in model.clf.classes_]
+    print("ARTIFACT_OK", model.MODEL_VERSION[:12])
+except Exception as e:
+    print(f"ARTIFACT_FAIL: {e}")
+    sys.exit(1)
+
+# Linear scorer parity with SVC.predict_proba
+try:
+    import numpy as np
+    from backend.inference import make_scorer, top_k
+    texts = [nlp.normalize(t) for t, _ in model.TRAIN_DATA] + [
+        nlp.normalize("girls hostel fees for btech"),
+        nlp.normalize("mba placement and admission process"),
+        "",
+    ]
+    X = model.vectorizer.transform(texts)
+    expected = model.clf.predict_proba(X)
+    got = model.scorer.predict_proba(X)
+    assert np.abs(expected - got).max() < 5e-3
+    for e, g in zip(expected, got):
+        # Top-3 rankings may only differ between near-tied intents
+        for a, b in zip(top_k(e, 3), top_k(g, 3)):
+            assert a == b or abs(e[a] - e[b]) < 5e-3
+    # Scores carry the classes of the model that produced them; ranking never reads the live model
+    from backend.routes import rank_intents
+    scores = model.predict_proba_batch(texts[:1])
+    assert list(scores.classes) == list(model.scorer.classes) and scores.version == model.MODEL_VERSION
+    row = scores.rows()[0]
+    renamed = model.Scores(row.proba, np.array([f"old_{c}" for c in row.classes]), "old")
+    assert rank_intents(renamed)[0] == "old_" + rank_intents(row)[0]
+    print("SCORER_OK", float(np.abs(expected - got).max()))
+except Exception as e:
+    print(f"SCORER_FAIL: {e!r}")
+    sys.exit(1)
+
+# Hashed features (MODEL_FEATURES=hashed) equal the sklearn HashingVectorizer union they replace,
+# and the compacted scorer still matches SVC.predict_proba
+try:
+    from sklearn.feature_extraction.text import HashingVectorizer
+    from sklearn.pipeline import FeatureUnion
+    reference = FeatureUnion([
+        ("word", HashingVectorizer(ngram_range=(1, 2), stop_words="english", n_features=2 ** 12, alternate_sign=False)),
+        ("char", HashingVectorizer(analyzer="char_wb", ngram_range=(2, 4), n_features=2 ** 12, alternate_sign=False)),
+    ], transformer_weights={"word": 1.0, "char": 2.0})
+    hashed = model.make_vectorizer("hashed", 2 ** 12, 2.0)
+    assert abs(reference.transform(texts) - hashed.transform(texts)).max() < 1e-9
+    vec, clf = model.fit(texts[:-3], [y for _, y in model.TRAIN_DATA], "hashed")
+    X = vec.transform(texts)
+    scorer = make_scorer(clf)
+    assert scorer.slots is not None
+    assert np.abs(clf.predict_proba(X) - scorer.predict_proba(X)).max() < 5e-3
+    print("HASHED_FEATURES_OK")
+except Exception as e:
+    print(f"HASHED_FEATURES_FAIL: {e!r}")
+    sys.exit(1)
+
+# Retraining pipeline: rows spilled in chunks, an incremental hashing model fitted one chunk at a time,
+# its one-vs-rest scorer matches predict_proba, and the holdout skips rows the published model trained on
+try:
+    import tempfile
+    from backend import train
+    from backend.inference import OvRIntentScorer
+    with tempfile.TemporaryDirectory() as tmp:
+        store = train.ChunkStore(tmp)
+        train.spill(model.TRAIN_DATA, store, jobs=1, chunk_size=100)
+        assert len(store) > 1 and store.rows == len(model.TRAIN_DATA)
+        classes = np.asarray(sorted(store.labels))
+        clf = train.fit_incremental(store, classes, epochs=10, batch_size=32, seed=0)
+        X, Y, keys = store[0]
+        assert (clf.predict(X) == Y).mean() > 0.9
+        assert np.abs(clf.predict_proba(X) - OvRIntentScorer(clf).predict_proba(X)).max() < 1e-9
+        assert not train.InHoldout(1.0, keys[:10])(keys)[:10].any() and train.InHoldout(1.0, keys[:0])(keys).all()
+    print("RETRAIN_OK")
+except Exception as e:
+    print(f"RETRAIN_FAIL: {e!r}")
+    sys.exit(1)
+
+# Passage retrieval: build a throwaway index and check an exam question finds the exam hint
+try:
+    import tempfile
+    from backend import nlp, retrieval
+    with tempfile.TemporaryDirectory() as tmp:
+        retrieval.build_index(retrieval.default_passages(), tmp + "/index")
+        index = retrieval.PassageIndex(tmp + "/index")
+        hits = index.lookup(nlp.normalize("entrance exam for mba"), k=1, min_score=0.0)
+        assert hits and hits[0].startswith("MBA admission exams"), hits
+        assert index.search("zzzz-unknown") == []
+        # A knowledge-base reload swaps in passages from the new file
+        from backend.knowledge import KnowledgeStore
+        faqs_path = tmp + "/faqs.json"
+        for when in ("may", "june"):
+            with open(faqs_path, "w", encoding="utf-8") as f:
+                json.dump({"base_answers": {"exam_dates": f"Entrance exams are held in {when}."}}, f)
+            if when == "may":
+                store = KnowledgeStore(faqs_path, tmp + "/reloaded")
+            else:
+                assert store.reload(force=True)
+            hits = store.current.passages.index().lookup(nlp.normalize("when are entrance exams held"), k=1)
+            assert hits == [f"Exam dates: Entrance exams are held in {when}."], hits
+    print("RETRIEVAL_OK", len(index))
+except Exception as e:
+    print(f"RETRIEVAL_FAIL: {e!r}")
+    sys.exit(1)
+
 # Answers builder for a few intents
 try:
     for intent in ["admission_fees", "hostel_fees", "placement", "admission_process"]:
         ans = answers.build_answer(intent, "btech boys hostel fees and placement")
         assert isinstance(ans, str) and len(ans) > 10
+    # Templates are data: faqs.json can add an intent and point it at any program_*_hints table
+    from backend.knowledge import build_snapshot
+    kb = build_snapshot({
+        "base_answers": {"exams": "Entrance exams vary by program."},
+        "program_exam_hints": {"mba": "CAT/MAT scores are accepted."},
+        "answer_templates": {"exams": {"program": "{program}: {hint}", "hints": "program_exam_hints"}},
+    })
+    assert kb.answers.part("exams", "mba") == "MBA: CAT/MAT scores are accepted."
+    assert kb.answers.part("exams", "bca") == kb.answers.part("exams") == "Entrance exams vary by program."
+    assert kb.answers.answer(["exams"], ["mba"]).endswith("\n\nFor official details, visit: https://www.iul.ac.in")
+    # Every program named gets its paragraph, up to the combination cap; gender-free intents are not repeated
+    both = kb.answers.answer_parts(["admission_fees", "placement"], ["btech", "mba", "bca"], ["girls"], limit=4)
+    assert [p.split(",")[0].split(":")[0] for p in both[:-1]] == [
+        "For BTECH", "For MBA", "Placement info for BTECH", "Placement info for MBA"], both
+    assert nlp.mentioned(nlp.extract_entities("compare btech cse and mba fees")["programs"]) == ["btech", "cse", "mba"]
+    try:
+        build_snapshot({"answer_templates": {"placement": {"default": "{salary}"}}})
+        raise AssertionError("unknown template field accepted")
+    except ValueError:
+        pass
     print("ANSWERS_OK")
 except Exception as e:
     print(f"ANSWERS_FAIL: {e}")
     sys.exit(1)
 
+# Inference tiers: known questions skip the model (in any word order), misspellings are corrected
+try:
+    from backend.routes import match_known, match_fuzzy
+    kb = build_snapshot({
+        "base_answers": {"exams": "Entrance exams vary by program."},
+        "questions": {"exams": ["entrance exam kaun sa hai"]},
+    })
+    assert match_known(nlp.normalize("kaun sa hai entrance exam"), kb)[:3] == ("exams", 1.0, ["exams"])
+    assert match_known(nlp.normalize("btech ki fees kitni hai"), kb)[0] == "admission_fees"
+    assert match_known(nlp.normalize("btech ki fees kitni hai aur hostel"), kb) is None
+    assert kb.questions.correct("plcement kaise hai") == "placement kaise hai"
+    # Real words are not "corrected" into known ones
+    assert kb.questions.correct("administration") is None
+    assert match_fuzzy(nlp.normalize("entrence exam kaun sa hai"), kb)[::4] == ("exams", "fuzzy")
+    try:
+        build_snapshot({"questions": {"no_such_intent": ["hello"]}})
+        raise AssertionError("questions for an unknown intent accepted")
+    except ValueError:
+        pass
+    print("TIERS_OK")
+except Exception as e:
+    print(f"TIERS_FAIL: {e!r}")
+    sys.exit(1)
+
+# Conversation sessions: a follow-up without a program inherits the previous one
+try:
+    from backend.sessions import SessionStore
+    store = SessionStore(turns=2, ttl=60, max_count=1)
+    store.record(1, "admission_fees", "btech", None)
+    assert store.context(1, nlp.extract_entities("placement")) == ("btech", None)
+    assert store.context(1, nlp.extract_entities("mba placement")) == (None, None)
+    for intent in ("placement", "hostel_fees"):
+        store.record(1, intent, None, "girls")
+    assert [t[1:] for t in store.history(1)] == [["placement", None, "girls"], ["hostel_fees", None, "girls"]]
+    store.record(2, "placement", None, None)
+    assert len(store) == 1 and store.history(1) == []
+    # An evicted session's unsaved turns still reach the next flush
+    store = SessionStore(turns=2, ttl=60, max_count=1, persisted=True)
+    store.record(1, "placement", "btech", None)
+    store.record(2, "placement", None, None)
+    assert store.stats()["dirty"] == 2 and store._evicted[1].history()[0][2] == "btech"
+    store.record(1, "hostel_fees", None, None)
+    assert [t[1] for t in store.history(1)] == ["placement", "hostel_fees"] and 2 in store._evicted
+    print("SESSIONS_OK")
+except Exception as e:
+    print(f"SESSIONS_FAIL: {e!r}")
+    sys.exit(1)
+
+# Chat log: queued records reach a gzip JSONL file and come back as low-confidence labeling rows
+try:
+    import asyncio
+    import tempfile
+    from backend.chatlog import ChatLog, low_confidence, read_files
+    with tempfile.TemporaryDirectory() as tmp:
+        log = ChatLog("file", tmp, max_size=3, batch_size=2)
+        for confidence in (0.9, 0.2, 0.3, 0.1):
+            log.record(1, "chat", f"q{confidence}", "placement", confidence, ["placement"], 0.001)
+        assert log.dropped == 1 and asyncio.run(log.flush()) == 3
+        rows = low_confidence(read_files(tmp), max_confidence=0.5)
+        assert [r["text"] for r in rows] == ["q0.2", "q0.3"], rows
+    print("CHATLOG_OK")
+except Exception as e:
+    print(f"CHATLOG_FAIL: {e!r}")
+    sys.exit(1)
+
+# Rate limiting: a burst is allowed, the next request waits about one refill interval
+try:
+    from backend.ratelimit import LoadShedder, RateLimit
+    limit = RateLimit("smoke", per_minute=60, burst=3)
+    limit.enabled = True
+    assert [limit.acquire("ip") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert 0.9 < limit.acquire("ip") <= 1.0 and limit.acquire("other") == 0.0
+    # A batch pays for every message, and one bigger than the burst is refused outright
+    assert limit.acquire("batch", 2) == 0.0 and limit.acquire("batch", 2) > 0
+    from fastapi import HTTPException
+    from backend.ratelimit import enforce
+    try:
+        enforce(limit, "batch", 4)
+        raise AssertionError("cost above the burst accepted")
+    except HTTPException as exc:
+        assert exc.status_code == 413 and "At most 3" in exc.detail
+    shedder = LoadShedder(max_in_flight=2, p99=0.0, window=10)
+    shedder.in_flight = 2
+    assert shedder.reason() == "in_flight"
+    # Behind one proxy the client-supplied X-Forwarded-For entries are ignored
+    from backend.ratelimit import client_ip
+    scope = {"client": ("10.0.0.2", 1), "headers": [(b"x-forwarded-for", b"6.6.6.6, 203.0.113.7")]}
+    assert client_ip(scope, trusted_proxies=1) == "203.0.113.7"
+    assert client_ip(scope, trusted_proxies=3) == client_ip(scope, trusted_proxies=0) == "10.0.0.2"
+    print("RATELIMIT_OK")
+except Exception as e:
+    print(f"RATELIMIT_FAIL: {e!r}")
+    sys.exit(1)
+
 # Auth hashing and token
 try:
     pwd = "test1234!"
@@ -87,5 +337,49 @@ try:
 finally:
     db.close()
 
+# WebSocket chat: authenticate with the first frame, then a follow-up keeps the program from the first turn
+try:
+    from fastapi.testclient import TestClient
+    with TestClient(app).websocket_connect("/ws/chat") as ws:
+        ws.send_json({"type": "auth", "token": token})
+        assert ws.receive_json() == {"type": "ready", "user": "tester"}
+        ws.send_json({"type": "chat", "id": 1, "message": "btech fees"})
+        first = ws.receive_json()
+        ws.send_json({"type": "chat", "id": "b", "message": "hostel fees"})
+        second = ws.receive_json()
+        assert first["type"] == "answer" and first["id"] == 1 and first["intent"] == "admission_fees", first
+        assert second["id"] == "b" and "answer" in second, second
+        ws.send_text("not json")
+        assert ws.receive_json()["status"] == 400
+        # An unexpected failure answers that message with a 500 and keeps the connection
+        from backend import ws_router
+        answer_message = ws_router.answer_message
+        ws_router.answer_message = None
+        try:
+            ws.send_json({"type": "chat", "id": 3, "message": "btech fees"})
+            assert ws.receive_json()["status"] == 500
+        finally:
+            ws_router.answer_message = answer_message
+        ws.send_json({"type": "chat", "id": 4, "message": "btech fees"})
+        assert ws.receive_json()["type"] == "answer"
+    # Messages after the token expires close the socket
+    import time
+    from datetime import timedelta
+    from starlette.websockets import WebSocketDisconnect
+    with TestClient(app).websocket_connect("/ws/chat") as ws:
+        ws.send_json({"type": "auth", "token": create_access_token({"sub": "tester"}, timedelta(seconds=1))})
+        assert ws.receive_json()["type"] == "ready"
+        time.sleep(1.1)
+        ws.send_json({"type": "chat", "id": 1, "message": "btech fees"})
+        try:
+            ws.receive_json()
+            raise AssertionError("expired token still answered")
+        except WebSocketDisconnect as exc:
+            assert exc.code == 1008 and exc.reason == "token expired", exc
+    print("WS_OK")
+except Exception as e:
+    print(f"WS_FAIL: {e!r}")
+    sys.exit(1)
+
 print("SMOKE_SUCCESS")
 sys.exit(0)
\ No newline at end of file
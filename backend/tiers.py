@@ -0,0 +1,122 @@
+# Tiered intent resolution: each message stops at the first tier that can answer it confidently.
+#   exact       a known question (TRAIN_DATA, faqs.json "questions", intent names) after normalization,
+#               or the same words in another order: one dict lookup, no model call
+#   classifier  the linear model (micro-batched); answers when confidence >= FALLBACK_CONFIDENCE_THRESHOLD
+#   fuzzy       misspelled words corrected to the known questions' vocabulary by character-trigram
+#               similarity, then the exact tier and the classifier again on the corrected text
+#   retrieval   BM25 over the FAQ passages
+#   unresolved  nothing matched: the classifier's low-confidence answer stands
+# chat_tier_total / chat_tier_seconds (and GET /health) show how much traffic each tier absorbs.
+import os
+from collections import Counter as Tally
+from typing import AbstractSet, Dict, Iterable, List, Optional, Tuple
+
+from .metrics import Counter, Histogram, registry
+from .retrieval import RETRIEVAL_CONFIDENCE_THRESHOLD
+
+# Below this classifier confidence, the fuzzy and retrieval tiers are tried
+FALLBACK_CONFIDENCE_THRESHOLD = float(os.getenv("FALLBACK_CONFIDENCE_THRESHOLD", str(RETRIEVAL_CONFIDENCE_THRESHOLD)))
+EXACT_MATCH_ENABLED = os.getenv("EXACT_MATCH_ENABLED", "true").lower() in ("1", "true", "yes")
+# Fuzzy tier: words missing from the known questions are replaced by the known word whose character
+# trigrams overlap most (Dice coefficient at least FUZZY_MIN_SIMILARITY; 0 disables the tier)
+FUZZY_MIN_SIMILARITY = float(os.getenv("FUZZY_MIN_SIMILARITY", "0.4"))
+FUZZY_MIN_WORD_CHARS = int(os.getenv("FUZZY_MIN_WORD_CHARS", "4"))
+
+TIERS = ("cache", "exact", "classifier", "fuzzy", "retrieval", "unresolved")
+RESOLVED = registry.register(Counter("chat_tier_total", "Messages answered, by the tier that answered them.", ("tier",)))
+TIER_SECONDS = registry.register(
+    Histogram("chat_tier_seconds", "Time spent in each inference tier per message, answered or not.", ("tier",))
+)
+RESOLVED_BY = {tier: RESOLVED.labels(tier) for tier in TIERS}
+SECONDS = {tier: TIER_SECONDS.labels(tier) for tier in TIERS[1:]}
+
+
+def word_key(text: str) -> str:
+    # Word order does not change what is being asked
+    return " ".join(sorted(text.split()))
+
+
+def trigrams(text: str) -> set:
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class QuestionIndex:
+    """Known questions by exact text and by word set, plus their vocabulary indexed by character trigrams.
+
+    Built once per knowledge-base snapshot. Texts claimed by two intents are dropped from
+    the exact tables, since neither answer is certain. Words in ``dictionary`` are spelled
+    correctly even when no known question uses them, so they are never corrected.
+    """
+
+    def __init__(self, questions: Iterable[Tuple[str, str]], dictionary: AbstractSet[str] = frozenset()):
+        exact: Dict[str, set] = {}
+        by_words: Dict[str, set] = {}
+        for text, intent in questions:
+            if text:
+                exact.setdefault(text, set()).add(intent)
+                by_words.setdefault(word_key(text), set()).add(intent)
+        self.exact: Dict[str, str] = {t: next(iter(i)) for t, i in exact.items() if len(i) == 1}
+        self.by_words: Dict[str, str] = {t: next(iter(i)) for t, i in by_words.items() if len(i) == 1}
+        self.words: List[str] = sorted({w for text in exact for w in text.split()})
+        self.known = frozenset(self.words)
+        self.dictionary = dictionary
+        self.sizes: List[int] = []
+        self.postings: Dict[str, List[int]] = {}
+        for i, word in enumerate(self.words):
+            grams = trigrams(word)
+            self.sizes.append(len(grams))
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(i)
+
+    def __len__(self) -> int:
+        return len(self.exact)
+
+    def match(self, text: str) -> Optional[str]:
+        """Intent of a known question with these words, in any order."""
+        intent = self.exact.get(text)
+        if intent is None:
+            intent = self.by_words.get(word_key(text))
+        return intent
+
+    def closest_word(self, word: str, min_similarity: float = FUZZY_MIN_SIMILARITY) -> Optional[str]:
+        grams = trigrams(word)
+        shared: Tally = Tally()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+        best, best_score = -1, 0.0
+        for i, count in shared.items():
+            score = 2.0 * count / (len(grams) + self.sizes[i])
+            if score > best_score:
+                best, best_score = i, score
+        return self.words[best] if best >= 0 and best_score >= min_similarity else None
+
+    def correct(self, text: str, min_similarity: float = FUZZY_MIN_SIMILARITY) -> Optional[str]:
+        """``text`` with each unknown word replaced by the closest known one, or None if none was."""
+        if min_similarity <= 0:
+            return None
+        words = text.split()
+        changed = False
+        for i, word in enumerate(words):
+            # Short words have too few trigrams to be told apart
+            if word in self.known or word in self.dictionary or len(word) < FUZZY_MIN_WORD_CHARS:
+                continue
+            close = self.closest_word(word, min_similarity)
+            if close is not None:
+                words[i] = close
+                changed = True
+        return " ".join(words) if changed else None
+
+
+def stats() -> Dict[str, Dict[str, float]]:
+    counts = {tier: int(child.value) for tier, child in RESOLVED_BY.items()}
+    total = sum(counts.values()) or 1
+    out: Dict[str, Dict[str, float]] = {}
+    for tier in TIERS:
+        row = {"answered": counts[tier], "share": counts[tier] / total}
+        child = SECONDS.get(tier)
+        calls = sum(child.counts) if child is not None else 0
+        if calls:
+            row["mean_ms"] = child.sum / calls * 1000.0
+        out[tier] = row
+    return out
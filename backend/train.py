@@ -0,0 +1,414 @@
+# Offline training: builds the intent model artifact loaded by backend.model
+# Run: python -m backend.train [--output PATH]
+#      python -m backend.train --data labeled.csv more.jsonl [--jobs N] [--folds 5] [--dry-run]
+# With --data, labeled rows (plus TRAIN_DATA) are streamed in chunks, normalized and hashed in a
+# process pool and spilled to disk; an SGD logistic model is fitted one chunk at a time, cross-validated
+# in parallel and compared with the published model on held-out rows it was not trained on before it
+# replaces MODEL_ARTIFACT.
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend import model
+from backend.nlp import normalize
+
+TRAIN_HASH_FEATURES = int(os.getenv("TRAIN_HASH_FEATURES", str(2 ** 18)))
+TRAIN_CHUNK_SIZE = 5000
+
+TEXT_COLUMNS = ("text", "message")
+LABEL_COLUMNS = ("label", "intent")
+
+
+def read_dataset(path: str) -> Iterator[Tuple[str, str]]:
+    """(text, intent) rows from a CSV with a header or from JSONL; rows without a label are skipped.
+
+    Accepts ``text``/``message`` and ``label``/``intent`` columns, so a labeled
+    ``python -m backend.chatlog export`` file can be fed back in directly.
+    """
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.endswith((".jsonl", ".json")):
+            rows: Iterator[Dict[str, Any]] = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+        for row in rows:
+            text = next((row[c] for c in TEXT_COLUMNS if row.get(c)), "")
+            label = next((row[c] for c in LABEL_COLUMNS if row.get(c)), "")
+            if text and label and label.strip():
+                yield text, label.strip()
+
+
+def make_vectorizer():
+    from sklearn.feature_extraction.text import HashingVectorizer
+    # Stateless, so chunks can be vectorized independently (and in other processes)
+    if model.MODEL_FEATURES == "hashed":
+        return model.make_vectorizer("hashed", TRAIN_HASH_FEATURES)
+    return HashingVectorizer(
+        ngram_range=(1, 2), stop_words="english", n_features=TRAIN_HASH_FEATURES, alternate_sign=False, norm="l2",
+    )
+
+
+def row_keys(normalized: List[str]) -> np.ndarray:
+    """64-bit fingerprints of normalized texts; they decide each row's fold and holdout membership."""
+    digests = (hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest() for t in normalized)
+    return np.fromiter((int.from_bytes(d, "little") for d in digests), dtype=np.uint64, count=len(normalized))
+
+
+def _featurize(texts: List[str]):
+    normalized = [normalize(t) for t in texts]
+    return normalized, make_vectorizer().transform(normalized), row_keys(normalized)
+
+
+class ChunkStore:
+    """Normalized, hashed training rows spilled to ``directory`` one chunk at a time.
+
+    Every pass over the data (epochs, folds, the holdout) loads a single chunk, so the
+    dataset never has to fit in memory at once.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.sizes: List[int] = []
+        self.labels: set = set()
+        self.nnz = 0
+
+    def __len__(self) -> int:
+        return len(self.sizes)
+
+    @property
+    def rows(self) -> int:
+        return sum(self.sizes)
+
+    def _path(self, i: int, name: str) -> str:
+        return os.path.join(self.directory, f"{i:06d}.{name}")
+
+    def add(self, normalized: List[str], X, keys: np.ndarray, labels: List[str]) -> None:
+        import scipy.sparse as sp
+        i = len(self.sizes)
+        sp.save_npz(self._path(i, "X.npz"), X.tocsr(), compressed=False)
+        np.save(self._path(i, "keys.npy"), keys)
+        with open(self._path(i, "rows.json"), "w", encoding="utf-8") as f:
+            json.dump([normalized, labels], f, ensure_ascii=False)
+        self.sizes.append(len(labels))
+        self.labels.update(labels)
+        self.nnz += X.nnz
+
+    def __getitem__(self, i: int) -> Tuple[Any, np.ndarray, np.ndarray]:
+        """(X, labels, row keys) of chunk ``i``."""
+        import scipy.sparse as sp
+        return sp.load_npz(self._path(i, "X.npz")), np.asarray(self.rows_of(i)[1]), np.load(self._path(i, "keys.npy"))
+
+    def rows_of(self, i: int) -> Tuple[List[str], List[str]]:
+        """(normalized texts, labels) of chunk ``i``."""
+        with open(self._path(i, "rows.json"), "r", encoding="utf-8") as f:
+            normalized, labels = json.load(f)
+        return normalized, labels
+
+
+def chunked(rows: Iterable[Tuple[str, str]], size: int) -> Iterator[List[Tuple[str, str]]]:
+    it = iter(rows)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def spill(rows: Iterable[Tuple[str, str]], store: ChunkStore, jobs: int, chunk_size: int = TRAIN_CHUNK_SIZE) -> str:
+    """Normalize and hash ``rows`` chunk by chunk in ``jobs`` processes, writing each chunk to ``store``.
+
+    At most two chunks per worker are in flight. Returns the training hash of all rows.
+    """
+    digest = hashlib.sha256(model.training_hash([], []).encode("utf-8"))
+
+    def add(result, labels: List[str]) -> None:
+        normalized, X, keys = result
+        digest.update(json.dumps([normalized, labels], ensure_ascii=False).encode("utf-8"))
+        store.add(normalized, X, keys, labels)
+
+    chunks = chunked(rows, chunk_size)
+    if jobs <= 1:
+        for chunk in chunks:
+            add(_featurize([t for t, _ in chunk]), [y for _, y in chunk])
+        return digest.hexdigest()
+    pending: Deque = deque()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for chunk in chunks:
+            pending.append((pool.submit(_featurize, [t for t, _ in chunk]), [y for _, y in chunk]))
+            if len(pending) >= 2 * jobs:
+                future, labels = pending.popleft()
+                add(future.result(), labels)
+        while pending:
+            future, labels = pending.popleft()
+            add(future.result(), labels)
+    return digest.hexdigest()
+
+
+class InFold:
+    """Picklable row selection: the rows of fold ``fold`` of ``folds`` (every other row with ``invert``)."""
+
+    def __init__(self, fold: int, folds: int, invert: bool = False):
+        self.fold, self.folds, self.invert = fold, folds, invert
+
+    def __call__(self, keys: np.ndarray) -> np.ndarray:
+        rows = keys % np.uint64(self.folds) == np.uint64(self.fold)
+        return ~rows if self.invert else rows
+
+
+class InHoldout:
+    """Picklable row selection: a ``fraction`` of the rows whose key is not in ``seen`` (every other row with ``invert``).
+
+    ``seen`` holds the keys of the rows the published model was trained on, so it is scored on
+    rows it has not seen, just like the candidate.
+    """
+
+    def __init__(self, fraction: float, seen: np.ndarray, invert: bool = False):
+        self.fraction, self.seen, self.invert = fraction, seen, invert
+
+    def __call__(self, keys: np.ndarray) -> np.ndarray:
+        # High bits pick the holdout, low bits the folds, so the two splits are independent
+        rows = (keys >> np.uint64(32)) % np.uint64(10_000) < np.uint64(round(self.fraction * 10_000))
+        rows &= ~np.isin(keys, self.seen)
+        return ~rows if self.invert else rows
+
+
+def fit_incremental(chunks, classes: np.ndarray, epochs: int, batch_size: int, seed: int, select=None):
+    """SGD logistic regression over ``chunks`` ((X, labels, keys) triples, e.g. a ChunkStore), one chunk at a time.
+
+    Chunks are visited in a new random order each epoch and their rows shuffled; ``select(keys)``
+    picks the rows of a chunk to train on.
+    """
+    from sklearn.linear_model import SGDClassifier
+    clf = SGDClassifier(loss="log_loss", alpha=1e-5, random_state=seed)
+    rng = np.random.default_rng(seed)
+    for _ in range(epochs):
+        for i in rng.permutation(len(chunks)):
+            X, Y, keys = chunks[i]
+            rows = np.flatnonzero(select(keys)) if select is not None else np.arange(len(Y))
+            rows = rng.permutation(rows)
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                clf.partial_fit(X[batch], Y[batch], classes=classes)
+    return clf
+
+
+def _fit_fold(job) -> Tuple[np.ndarray, np.ndarray]:
+    chunks, classes, fold, folds, epochs, batch_size, seed = job
+    clf = fit_incremental(chunks, classes, epochs, batch_size, seed, InFold(fold, folds, invert=True))
+    truth, predicted = [], []
+    for i in range(len(chunks)):
+        X, Y, keys = chunks[i]
+        rows = InFold(fold, folds)(keys)
+        if rows.any():
+            truth.append(np.searchsorted(classes, Y[rows]))
+            predicted.append(np.searchsorted(classes, clf.predict(X[rows])))
+    return np.concatenate(truth or [[]]), np.concatenate(predicted or [[]])
+
+
+def cross_validate(chunks, classes: np.ndarray, folds: int, jobs: int, epochs: int, batch_size: int,
+                   seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(true, out-of-fold predicted) class indices for every row; folds are fitted in parallel."""
+    jobs_ = [(chunks, classes, fold, folds, epochs, batch_size, seed) for fold in range(folds)]
+    if jobs <= 1:
+        results = [_fit_fold(j) for j in jobs_]
+    else:
+        with ProcessPoolExecutor(max_workers=min(jobs, folds)) as pool:
+            results = list(pool.map(_fit_fold, jobs_))
+    return np.concatenate([t for t, _ in results]), np.concatenate([p for _, p in results])
+
+
+def intent_report(y_true: Sequence[Any], y_pred: Sequence[Any], classes: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    """Accuracy, macro F1 and per-intent scores; with ``classes``, ``y_true``/``y_pred`` are indices into it."""
+    from sklearn.metrics import accuracy_score, precision_recall_fscore_support
+    labels = sorted(set(np.unique(y_true).tolist()))
+    precision, recall, f1, support = precision_recall_fscore_support(
+        y_true, y_pred, labels=labels, zero_division=0
+    )
+    names = [str(classes[label]) for label in labels] if classes is not None else labels
+    return {
+        "accuracy": float(accuracy_score(y_true, y_pred)),
+        "macro_f1": float(np.mean(f1)),
+        "intents": {
+            name: {"precision": float(p), "recall": float(r), "f1": float(f), "support": int(n)}
+            for name, p, r, f, n in zip(names, precision, recall, f1, support)
+        },
+    }
+
+
+def print_report(title: str, report: Dict[str, Any]) -> None:
+    print(f"{title}: accuracy {report['accuracy']:.3f}, macro F1 {report['macro_f1']:.3f}")
+    print(f"  {'intent':<22} {'precision':>9} {'recall':>7} {'f1':>6} {'support':>8}")
+    for label, row in report["intents"].items():
+        print(f"  {label:<22} {row['precision']:9.3f} {row['recall']:7.3f} {row['f1']:6.3f} {row['support']:8d}")
+
+
+def row_keys_path(path: str) -> str:
+    return f"{path}.rows.npz"
+
+
+def published_model(path: str) -> Optional[Tuple[Any, Any, np.ndarray]]:
+    """(vectorizer, scorer, keys of the rows it was trained on) for the model currently at ``path``, if any."""
+    from backend.inference import make_scorer
+    artifact = model.load_artifact(path)
+    if artifact is None:
+        return None
+    seen: Optional[np.ndarray] = None
+    try:
+        with np.load(row_keys_path(path)) as saved:
+            # Only valid for the artifact it was written with
+            if str(saved["train_hash"]) == artifact["train_hash"]:
+                seen = saved["keys"]
+    except (OSError, KeyError, ValueError):
+        pass
+    if seen is None:
+        # The built-in model, and models published before row keys were kept, trained on TRAIN_DATA
+        seen = np.unique(row_keys([normalize(t) for t, _ in model.TRAIN_DATA]))
+    return artifact["vectorizer"], make_scorer(artifact["clf"]), seen
+
+
+def compare_on_holdout(store: ChunkStore, classes: np.ndarray, candidate, published, select) -> Tuple[np.ndarray, ...]:
+    """(true, candidate, published) class indices on the holdout rows; published is empty without a model.
+
+    Intents the published model does not know count as wrong (-1).
+    """
+    index = {str(c): i for i, c in enumerate(classes)}
+    truth, ours, theirs = [], [], []
+    for i in range(len(store)):
+        X, Y, keys = store[i]
+        rows = select(keys)
+        if not rows.any():
+            continue
+        truth.append(np.searchsorted(classes, Y[rows]))
+        ours.append(np.searchsorted(classes, candidate.predict(X[rows])))
+        if published is not None:
+            vec, scorer, _ = published
+            normalized = [t for t, keep in zip(store.rows_of(i)[0], rows) if keep]
+            predicted = scorer.classes[scorer.predict_proba(vec.transform(normalized)).argmax(axis=1)]
+            theirs.append(np.array([index.get(str(c), -1) for c in predicted]))
+    return tuple(np.concatenate(part) if part else np.empty(0, dtype=np.int64) for part in (truth, ours, theirs))
+
+
+def read_rows(paths: Sequence[str], builtin: bool) -> Iterator[Tuple[str, str]]:
+    if builtin:
+        yield from model.TRAIN_DATA
+    for path in paths:
+        yield from read_dataset(path)
+
+
+def retrain(args) -> int:
+    with tempfile.TemporaryDirectory(prefix="backend-train-", dir=args.spill_dir) as spill_dir:
+        return _retrain(args, ChunkStore(spill_dir))
+
+
+def _retrain(args, store: ChunkStore) -> int:
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+
+    # Rows are streamed from the files, so reading overlaps normalizing and hashing
+    train_hash = spill(read_rows(args.data, not args.no_builtin), store, args.jobs)
+    timings["read+normalize+hash"] = time.perf_counter() - started
+    if not store.rows:
+        print("no labeled rows to train on", file=sys.stderr)
+        return 2
+    classes = np.asarray(sorted(store.labels))
+    print(f"{store.rows} rows in {len(store)} chunks, {len(classes)} intents, {store.nnz} features set ({args.jobs} jobs)")
+
+    mark = time.perf_counter()
+    fit_args = (args.epochs, args.batch_size, args.seed)
+    cv = intent_report(*cross_validate(store, classes, args.folds, args.jobs, *fit_args), classes)
+    timings["cross-validation"] = time.perf_counter() - mark
+    print_report(f"{args.folds}-fold cross-validation", cv)
+
+    # Holdout comparison with the published model, on rows neither model was trained on
+    mark = time.perf_counter()
+    published = published_model(args.output)
+    seen = published[2] if published is not None else np.empty(0, dtype=np.uint64)
+    in_holdout = InHoldout(args.holdout, seen)
+    candidate = fit_incremental(store, classes, *fit_args, select=InHoldout(args.holdout, seen, invert=True))
+    truth, ours, theirs = compare_on_holdout(store, classes, candidate, published, in_holdout)
+    timings["holdout"] = time.perf_counter() - mark
+    holdout: Optional[Dict[str, Any]] = None
+    regressions: List[str] = []
+    if not len(truth):
+        print("holdout: no rows the published model was not trained on; skipping the comparison")
+    else:
+        holdout = intent_report(truth, ours, classes)
+        print_report(f"holdout ({len(truth)} rows), candidate", holdout)
+    if holdout is not None and published is not None:
+        current = intent_report(truth, theirs, classes)
+        print(f"holdout, published: accuracy {current['accuracy']:.3f}, macro F1 {current['macro_f1']:.3f}")
+        for metric in ("accuracy", "macro_f1"):
+            if holdout[metric] < current[metric] - args.max_regression:
+                regressions.append(f"{metric} {current[metric]:.3f} -> {holdout[metric]:.3f}")
+
+    mark = time.perf_counter()
+    clf = fit_incremental(store, classes, *fit_args)
+    timings["final fit"] = time.perf_counter() - mark
+    timings["total"] = time.perf_counter() - started
+    print("timings: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
+
+    if regressions and not args.force:
+        print("REJECTED: candidate regresses on " + "; ".join(regressions) + " (use --force to publish anyway)")
+        return 1
+    if args.dry_run:
+        print("dry run: not publishing")
+        return 0
+    extra = {
+        "published": True,
+        "trained_at": time.time(),
+        "metrics": {"cross_validation": cv, "holdout": holdout, "rows": store.rows, "timings": timings},
+    }
+    # The next retrain keeps these rows out of its holdout; written first, it is ignored until the artifact matches
+    keys = np.unique(np.concatenate([store[i][2] for i in range(len(store))]))
+    tmp = f"{args.output}.{os.getpid()}.rows.tmp.npz"
+    np.savez(tmp, keys=keys, train_hash=np.str_(train_hash))
+    os.replace(tmp, row_keys_path(args.output))
+    # Written to a temporary file and renamed, so running servers (MODEL_RELOAD_INTERVAL_SECONDS) swap atomically
+    model.save_artifact(make_vectorizer(), clf, train_hash, args.output, extra)
+    print(f"published {args.output} (hash {train_hash[:12]})")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Train the intent classifier and write the model artifact.")
+    parser.add_argument("--output", default=model.MODEL_ARTIFACT, help="artifact path (default: %(default)s)")
+    parser.add_argument("--data", nargs="+", help="labeled CSV/JSONL files; retrains incrementally and publishes")
+    parser.add_argument("--no-builtin", action="store_true", help="do not add model.TRAIN_DATA to --data")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="worker processes (default: %(default)s)")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--holdout", type=float, default=0.2,
+                        help="fraction of the rows the published model has not seen held out for the regression check")
+    parser.add_argument("--max-regression", type=float, default=0.01,
+                        help="largest accepted drop in holdout accuracy / macro F1 (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--force", action="store_true", help="publish even if the candidate regresses")
+    parser.add_argument("--dry-run", action="store_true", help="train and report without publishing")
+    parser.add_argument("--spill-dir", help="where hashed chunks are kept during training (default: system temp)")
+    args = parser.parse_args(argv)
+    if args.data:
+        return retrain(args)
+
+    started = time.perf_counter()
+    X, Y = model.training_set()
+    train_hash = model.training_hash(X, Y)
+    vec, clf = model.fit(X, Y)
+    model.save_artifact(vec, clf, train_hash, args.output)
+    elapsed = time.perf_counter() - started
+    print(f"wrote {args.output} ({len(X)} samples, {len(clf.classes_)} intents, hash {train_hash[:12]}) in {elapsed:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+# Devanagari -> Latin romanization in the spelling Hinglish users type ("शुल्क" -> "shulk",
+# "लड़कों" -> "ladkon", "कितनी" -> "kitni"), so Hindi written in either script reaches the same tokens.
+# Run: python -m backend.translit "बीटेक की फीस कितनी है"
+import re
+import sys
+import unicodedata
+from typing import List
+
+VOWELS = {
+    "अ": "a", "आ": "a", "इ": "i", "ई": "i", "उ": "u", "ऊ": "u", "ऋ": "ri",
+    "ए": "e", "ऐ": "ai", "ओ": "o", "औ": "au", "ऍ": "e", "ऑ": "o",
+}
+MATRAS = {
+    "ा": "a", "ि": "i", "ी": "i", "ु": "u", "ू": "u", "ृ": "ri",
+    "े": "e", "ै": "ai", "ो": "o", "ौ": "au", "ॅ": "e", "ॉ": "o",
+}
+CONSONANTS = {
+    "क": "k", "ख": "kh", "ग": "g", "घ": "gh", "ङ": "n",
+    "च": "ch", "छ": "chh", "ज": "j", "झ": "jh", "ञ": "n",
+    "ट": "t", "ठ": "th", "ड": "d", "ढ": "dh", "ण": "n",
+    "त": "t", "थ": "th", "द": "d", "ध": "dh", "न": "n",
+    "प": "p", "फ": "f", "ब": "b", "भ": "bh", "म": "m",
+    "य": "y", "र": "r", "ल": "l", "व": "v",
+    "श": "sh", "ष": "sh", "स": "s", "ह": "h",
+}
+# Consonant + nukta (U+093C); precomposed forms are decomposed first (NFD)
+NUKTA_CONSONANTS = {"क": "q", "ख": "kh", "ग": "g", "ज": "z", "ड": "d", "ढ": "dh", "फ": "f", "य": "y"}
+NUKTA, VIRAMA = "\u093c", "\u094d"
+NASALS = {"ं": "n", "ँ": "n"}
+OTHER = {"ः": "h", "।": ".", "॥": ".", "ॐ": "om", **{chr(0x0966 + d): str(d) for d in range(10)}}
+LABIALS = frozenset("pbm")
+
+DEVANAGARI_RUN = re.compile(r"[ऀ-ॿ]+")
+
+
+def _syllables(word: str) -> List[List[str]]:
+    # [consonant, vowel, nasal] per syllable; vowel None means the inherent "a", "" means virama
+    out: List[List[str]] = []
+    previous = ""
+    for ch in unicodedata.normalize("NFD", word):
+        if ch == "ञ" and out and out[-1][:2] == ["j", ""]:
+            out[-1][0] = "g"  # "ज्ञ" is said (and typed) "gy": "ज्ञान" -> "gyan"
+            out.append(["y", None, ""])
+        elif ch in CONSONANTS:
+            out.append([CONSONANTS[ch], None, ""])
+        elif ch == NUKTA:
+            if previous in NUKTA_CONSONANTS and out[-1][1] is None:
+                out[-1][0] = NUKTA_CONSONANTS[previous]
+        elif ch in MATRAS and out and out[-1][0] and out[-1][1] is None:
+            out[-1][1] = MATRAS[ch]
+        elif ch == VIRAMA and out and out[-1][1] is None:
+            out[-1][1] = ""
+        elif ch in VOWELS:
+            out.append(["", VOWELS[ch], ""])
+        elif ch in NASALS and out:
+            out[-1][2] = NASALS[ch]
+        elif ch in OTHER:
+            out.append(["", OTHER[ch], ""])
+        previous = ch
+    return out
+
+
+def romanize_word(word: str) -> str:
+    """One run of Devanagari letters in Hinglish spelling, dropping the silent schwas."""
+    syllables = _syllables(word)
+    last = len(syllables) - 1
+    vowels: List[str] = [vowel if vowel is not None else "a" for _, vowel, _ in syllables]
+    # Right to left, so a schwa is only dropped before a syllable that keeps its vowel:
+    # "कम" -> "kam" (word-final), "कितनी" -> "kitni", but "कंप्यूटर" -> "kampyutar"
+    for i in range(last, 0, -1):
+        consonant, vowel, nasal = syllables[i]
+        if vowel is not None or nasal or not consonant:
+            continue
+        if i == last or (vowels[i - 1] != "" and not syllables[i - 1][2] and syllables[i + 1][0] and vowels[i + 1] != ""):
+            vowels[i] = ""
+    out = []
+    for i, ((consonant, _, nasal), vowel) in enumerate(zip(syllables, vowels)):
+        if nasal == "n" and i < last and syllables[i + 1][0][:1] in LABIALS:
+            nasal = "m"  # "संपर्क" -> "sampark"
+        out.append(consonant + vowel + nasal)
+    return "".join(out)
+
+
+def _romanize(m: re.Match) -> str:
+    return romanize_word(m.group(0))
+
+
+def to_latin(text: str) -> str:
+    """``text`` with every Devanagari word romanized; Latin text passes through unchanged."""
+    return DEVANAGARI_RUN.sub(_romanize, text)
+
+
+if __name__ == "__main__":
+    for arg in sys.argv[1:]:
+        print(to_latin(arg))
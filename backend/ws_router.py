@@ -0,0 +1,230 @@
+# Chat over one WebSocket per conversation: the token is checked once on connect instead of on
+# every message, and answers are the same ChatResponse payloads as POST /chat.
+#   client: {"type": "auth", "token": "<access token>"}  (first message, unless an Authorization header was sent)
+#   server: {"type": "ready", "user": "<username>"}
+#   client: {"type": "chat", "id": 1, "message": "btech fees"}
+#   server: {"type": "answer", "id": 1, "intent": ..., "answer": ..., "confidence": ..., "intents": [...]}
+#   server: {"type": "error", "id": 1, "status": 429, "detail": ..., "retry_after": 1}
+#   server: {"type": "ping"} every WS_HEARTBEAT_SECONDS; any client frame (e.g. {"type": "pong"}) counts as activity
+# The connection is closed with 1008 once the token's "exp" has passed.
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+
+from .auth_router import user_for_token
+from .metrics import Counter, GaugeFunc, registry
+from .ratelimit import CHAT_LIMIT, enforce
+from .routes import answer_message
+
+WS_AUTH_TIMEOUT_SECONDS = float(os.getenv("WS_AUTH_TIMEOUT_SECONDS", "10"))
+WS_HEARTBEAT_SECONDS = float(os.getenv("WS_HEARTBEAT_SECONDS", "30"))
+# Connections without any client frame for this long are closed; 0 keeps them open
+WS_IDLE_TIMEOUT_SECONDS = float(os.getenv("WS_IDLE_TIMEOUT_SECONDS", "300"))
+# Outgoing frames buffered per connection; a client that leaves it full for WS_SEND_TIMEOUT_SECONDS is dropped
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "32"))
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "10"))
+WS_MAX_MESSAGE_CHARS = int(os.getenv("WS_MAX_MESSAGE_CHARS", "4096"))
+
+# Close codes (RFC 6455 / IANA registry)
+CLOSE_NORMAL, CLOSE_POLICY, CLOSE_TRY_AGAIN = 1000, 1008, 1013
+
+MESSAGES = registry.register(Counter("ws_messages_total", "WebSocket frames by direction and type.", ("direction", "type")))
+CLOSED = registry.register(Counter("ws_closed_total", "WebSocket connections closed by the server, by reason.", ("reason",)))
+
+PING = json.dumps({"type": "ping"})
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+class Connection:
+    """One authenticated socket: a bounded outbox drained by a single sender task.
+
+    Only the sender writes to the socket, so answers, pings and the close frame never
+    interleave. Heartbeats and idle checks are done for all connections by ``heartbeat``,
+    which keeps an idle connection down to its receive task and its sender task.
+    """
+
+    __slots__ = ("websocket", "user_id", "expires_at", "outbox", "last_seen", "closing")
+
+    def __init__(self, websocket: WebSocket, user_id: int, expires_at: float = math.inf):
+        self.websocket = websocket
+        self.user_id = user_id
+        # Unix time of the token's "exp" claim
+        self.expires_at = expires_at
+        self.outbox: "asyncio.Queue[Any]" = asyncio.Queue(WS_SEND_QUEUE_SIZE)
+        self.last_seen = time.monotonic()
+        self.closing = False
+
+    def expired(self, now: Optional[float] = None) -> bool:
+        return (time.time() if now is None else now) >= self.expires_at
+
+    async def send(self, payload: Dict[str, Any]) -> None:
+        MESSAGES.labels("out", payload["type"]).inc()
+        frame = json.dumps(payload)
+        if not self.outbox.full():
+            self.outbox.put_nowait(frame)
+            return
+        try:
+            await asyncio.wait_for(self.outbox.put(frame), WS_SEND_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            self.close(CLOSE_TRY_AGAIN, "slow consumer", force=True)
+
+    def close(self, code: int, reason: str, force: bool = False) -> None:
+        """Queue a close frame behind pending answers; ``force`` skips the queue."""
+        if self.closing:
+            return
+        self.closing = True
+        CLOSED.labels(reason).inc()
+        if force or self.outbox.full():
+            asyncio.ensure_future(self._close_now(code, reason))
+        else:
+            self.outbox.put_nowait((code, reason))
+
+    async def _close_now(self, code: int, reason: str) -> None:
+        try:
+            await self.websocket.close(code, reason)
+        except Exception:
+            pass  # already gone
+
+    async def run_sender(self) -> None:
+        while True:
+            item = await self.outbox.get()
+            if isinstance(item, tuple):
+                await self._close_now(*item)
+                return
+            await self.websocket.send_text(item)
+
+
+connections: "set[Connection]" = set()
+
+registry.register(GaugeFunc("ws_connections_open", "Authenticated WebSocket connections.", lambda: len(connections)))
+
+
+async def heartbeat(interval: float = WS_HEARTBEAT_SECONDS, idle_timeout: float = WS_IDLE_TIMEOUT_SECONDS) -> None:
+    """Ping every connection each ``interval``; close the ones idle past ``idle_timeout`` or with an expired token."""
+    while True:
+        await asyncio.sleep(interval)
+        now, wall = time.monotonic(), time.time()
+        for conn in list(connections):
+            if conn.expired(wall):
+                conn.close(CLOSE_POLICY, "token expired")
+            elif idle_timeout > 0 and now - conn.last_seen > idle_timeout:
+                conn.close(CLOSE_NORMAL, "idle timeout")
+            elif not conn.closing and not conn.outbox.full():
+                # A full outbox already means traffic is pending; the ping would only add to it
+                MESSAGES.labels("out", "ping").inc()
+                conn.outbox.put_nowait(PING)
+
+
+def _bearer(websocket: WebSocket) -> Optional[str]:
+    scheme, _, token = websocket.headers.get("authorization", "").partition(" ")
+    return token if scheme.lower() == "bearer" and token else None
+
+
+async def authenticate(websocket: WebSocket) -> Optional[Tuple[Any, float]]:
+    """(user, token expiry) for the Authorization header or the first {"type": "auth"} frame, or None."""
+    token = _bearer(websocket)
+    if token is None:
+        try:
+            message = json.loads(await asyncio.wait_for(websocket.receive_text(), WS_AUTH_TIMEOUT_SECONDS))
+        except (asyncio.TimeoutError, ValueError, KeyError):
+            return None
+        if not isinstance(message, dict) or message.get("type") != "auth" or not isinstance(message.get("token"), str):
+            return None
+        token = message["token"]
+    user = await user_for_token(token)
+    if user is None:
+        return None
+    from jose import jwt
+    # Already verified by user_for_token
+    expires_at = jwt.get_unverified_claims(token).get("exp")
+    return user, float(expires_at) if expires_at is not None else math.inf
+
+
+def _error(message_id: Any, status: int, detail: str, **extra: Any) -> Dict[str, Any]:
+    return {"type": "error", "id": message_id, "status": status, "detail": detail, **extra}
+
+
+async def handle(conn: Connection, raw: str) -> None:
+    if conn.expired():
+        conn.close(CLOSE_POLICY, "token expired")
+        return
+    try:
+        message = json.loads(raw)
+    except ValueError:
+        message = None
+    if not isinstance(message, dict):
+        await conn.send(_error(None, 400, "Frames must be JSON objects"))
+        return
+    kind = message.get("type")
+    MESSAGES.labels("in", kind if kind in ("chat", "ping", "pong") else "other").inc()
+    if kind == "pong":
+        return
+    if kind == "ping":
+        await conn.send({"type": "pong"})
+        return
+    message_id = message.get("id")
+    text = message.get("message")
+    if kind != "chat" or not isinstance(text, str):
+        await conn.send(_error(message_id, 400, 'Expected {"type": "chat", "message": "..."}'))
+        return
+    if len(text) > WS_MAX_MESSAGE_CHARS:
+        await conn.send(_error(message_id, 413, "Message too long"))
+        return
+    try:
+        # Same per-user bucket as POST /chat; a limited message is refused, the connection stays open
+        enforce(CHAT_LIMIT, conn.user_id)
+        response = await answer_message(conn.user_id, text, "ws")
+    except HTTPException as exc:
+        extra = {"retry_after": int(exc.headers["Retry-After"])} if exc.headers and "Retry-After" in exc.headers else {}
+        await conn.send(_error(message_id, exc.status_code, str(exc.detail), **extra))
+        return
+    except Exception:
+        # One failed message must not take the conversation down with it
+        logger.exception("WebSocket chat message failed")
+        await conn.send(_error(message_id, 500, "Internal server error"))
+        return
+    await conn.send({"type": "answer", "id": message_id, **response.model_dump()})
+
+
+@router.websocket("/chat")
+async def chat_socket(websocket: WebSocket) -> None:
+    await websocket.accept()
+    authenticated = await authenticate(websocket)
+    if authenticated is None:
+        CLOSED.labels("unauthenticated").inc()
+        await websocket.close(CLOSE_POLICY, "Could not validate credentials")
+        return
+    user, expires_at = authenticated
+    conn = Connection(websocket, user.id, expires_at)
+    connections.add(conn)
+    sender = asyncio.create_task(conn.run_sender())
+    try:
+        await conn.send({"type": "ready", "user": user.username})
+        # Messages are answered one at a time, in order, so each turn sees the previous turn's session
+        while not conn.closing:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            conn.last_seen = time.monotonic()
+            raw = message.get("text")
+            if raw is None:
+                await conn.send(_error(None, 400, "Binary frames are not supported"))
+            else:
+                await handle(conn, raw)
+        # Let the sender flush pending answers and the close frame
+        if conn.closing and not sender.done():
+            await asyncio.wait_for(sender, WS_SEND_TIMEOUT_SECONDS)
+    except (WebSocketDisconnect, RuntimeError, asyncio.TimeoutError):
+        pass
+    finally:
+        connections.discard(conn)
+        sender.cancel()
@@ -25,11 +25,55 @@ const Chatbot: React.FC<ChatbotProps> = ({ token }) => {
   const [voiceEnabled, setVoiceEnabled] = useState(true) // speak bot replies
   const bottomRef = useRef<HTMLDivElement>(null)
   const recogRef = useRef<any>(null)
+  // One authenticated socket per conversation; null until the server answers "ready"
+  const socketRef = useRef<WebSocket | null>(null)
+  const pendingRef = useRef(new Map<number, (reply: any) => void>())
+  const nextIdRef = useRef(1)
 
   useEffect(() => {
     bottomRef.current?.scrollIntoView({ behavior: 'smooth' })
   }, [messages])
 
+  // Chat over /ws/chat when it is available; send() falls back to /chat/stream otherwise
+  useEffect(() => {
+    let closed = false
+    let retry: ReturnType<typeof setTimeout> | undefined
+    const connect = () => {
+      const ws = new WebSocket(`${API_BASE.replace(/^http/, 'ws')}/ws/chat`)
+      ws.onopen = () => ws.send(JSON.stringify({ type: 'auth', token }))
+      ws.onmessage = (e: MessageEvent) => {
+        const data = JSON.parse(e.data)
+        if (data.type === 'ready') socketRef.current = ws
+        else if (data.type === 'ping') ws.send(JSON.stringify({ type: 'pong' }))
+        else {
+          const resolve = pendingRef.current.get(data.id)
+          pendingRef.current.delete(data.id)
+          resolve?.(data)
+        }
+      }
+      ws.onclose = () => {
+        if (socketRef.current === ws) socketRef.current = null
+        pendingRef.current.forEach(resolve => resolve({ type: 'error', detail: 'connection closed' }))
+        pendingRef.current.clear()
+        if (!closed) retry = setTimeout(connect, 5000)
+      }
+    }
+    connect()
+    return () => {
+      closed = true
+      clearTimeout(retry)
+      socketRef.current?.close()
+      socketRef.current = null
+    }
+  }, [token])
+
+  const askSocket = (ws: WebSocket, message: string): Promise<any> =>
+    new Promise(resolve => {
+      const id = nextIdRef.current++
+      pendingRef.current.set(id, resolve)
+      ws.send(JSON.stringify({ type: 'chat', id, message }))
+    })
+
   // Initialize speech recognition once
   useEffect(() => {
     if (!SpeechRecognition) return
@@ -68,7 +112,16 @@ const Chatbot: React.FC<ChatbotProps> = ({ token }) => {
     setInput('')
     setLoading(true)
     try {
-      const res = await fetch(`${API_BASE}/chat`, {
+      const ws = socketRef.current
+      if (ws) {
+        const reply = await askSocket(ws, userMsg.text)
+        if (reply.type !== 'answer') throw new Error(reply.detail || 'Request failed')
+        setMessages(prev => [...prev, { role: 'bot', text: reply.answer, meta: { intent: reply.intent, confidence: reply.confidence } }])
+        speak(reply.answer)
+        return
+      }
+      // Server-Sent Events: meta (intent/confidence) first, then one part per paragraph, then done
+      const res = await fetch(`${API_BASE}/chat/stream`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -76,15 +129,37 @@ const Chatbot: React.FC<ChatbotProps> = ({ token }) => {
         },
         body: JSON.stringify({ message: userMsg.text })
       })
-      if (!res.ok) throw new Error('Request failed')
-      const data = await res.json()
-      const botMsg: Message = {
-        role: 'bot',
-        text: data.answer,
-        meta: { intent: data.intent, confidence: data.confidence }
+      if (!res.ok || !res.body) throw new Error('Request failed')
+      const reader = res.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ''
+      let answer = ''
+      // Update the bot message added by the meta event (always the last message)
+      const updateBot = (patch: Partial<Message>) =>
+        setMessages(prev => [...prev.slice(0, -1), { ...prev[prev.length - 1], ...patch }])
+      for (;;) {
+        const { done, value } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+        let sep: number
+        while ((sep = buffer.indexOf('\n\n')) !== -1) {
+          const frame = buffer.slice(0, sep)
+          buffer = buffer.slice(sep + 2)
+          const event = frame.match(/^event: (.*)$/m)?.[1]
+          const data = JSON.parse(frame.match(/^data: (.*)$/m)?.[1] || '{}')
+          if (event === 'meta') {
+            setLoading(false)
+            setMessages(prev => [...prev, { role: 'bot', text: '', meta: { intent: data.intent, confidence: data.confidence } }])
+          } else if (event === 'part') {
+            answer = answer ? `${answer}\n\n${data.text}` : data.text
+            updateBot({ text: answer })
+          } else if (event === 'done') {
+            answer = data.answer
+            updateBot({ text: answer })
+          }
+        }
       }
-      setMessages(prev => [...prev, botMsg])
-      speak(botMsg.text)
+      speak(answer)
     } catch (e: any) {
       setMessages(prev => [...prev, { role: 'bot', text: 'Error contacting server.' }])
     } finally {